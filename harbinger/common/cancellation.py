@@ -0,0 +1,99 @@
+"""
+ProcessGroups class:
+    - keeps track of the process groups of the framework commands running
+    in this process so a cancelled run can stop all of them, and lets the
+    framework code check whether the run was cancelled
+"""
+import os
+import signal
+import threading
+import time
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# seconds a process group is given to exit after SIGTERM before SIGKILL
+GRACE = 10
+
+
+class Cancelled(RuntimeError):
+    """raised by framework code once the run has been cancelled"""
+
+
+class ProcessGroups():
+    # the signal handlers take it in the main thread, which may be holding
+    # it already when the signal arrives
+    lock = threading.RLock()
+    groups = {}
+    cancelled = None
+
+    @classmethod
+    def add(cls, popen):
+        """track popen, which must lead its own process group"""
+        with cls.lock:
+            cls.groups[popen.pid] = popen
+
+    @classmethod
+    def remove(cls, popen):
+        with cls.lock:
+            cls.groups.pop(popen.pid, None)
+
+    @classmethod
+    def cancel(cls, signal_num, grace=GRACE):
+        """mark this process cancelled and stop every tracked group"""
+        cls.cancelled = signal_num
+        LOG.error('Cancelled by signal %s, stopping %s running commands',
+                  signal_num, len(cls.groups))
+        cls.stop(grace)
+
+    @classmethod
+    def stop(cls, grace=GRACE):
+        """stop every tracked group, SIGKILL them after grace seconds"""
+        with cls.lock:
+            popens = list(cls.groups.values())
+
+        cls.terminate([popen.pid for popen in popens], grace,
+                      lambda: all(popen.poll() is not None
+                                  for popen in popens))
+
+    @classmethod
+    def check(cls):
+        """raise Cancelled if this process has been cancelled"""
+        if cls.cancelled is not None:
+            raise Cancelled('cancelled by signal %s' % cls.cancelled)
+
+    @classmethod
+    def reset(cls):
+        """forget the cancellation, only once nothing can be checking it"""
+        cls.cancelled = None
+
+    @staticmethod
+    def signal(pgid, signal_num):
+        try:
+            os.killpg(pgid, signal_num)
+        except ProcessLookupError:
+            return False
+        return True
+
+    @classmethod
+    def terminate(cls, pgids, grace=GRACE, exited=None):
+        """SIGTERM the groups, SIGKILL them once grace seconds have passed
+
+        exited returns True once everything that was signalled is gone, the
+        grace period is cut short when it does. Children may outlive the
+        group leader, the groups are killed in any case.
+
+        """
+        pgids = [pgid for pgid in pgids
+                 if cls.signal(pgid, signal.SIGTERM)]
+        if not pgids:
+            return
+
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and \
+                not (exited is not None and exited()):
+            time.sleep(0.1)
+
+        for pgid in pgids:
+            cls.signal(pgid, signal.SIGKILL)
@@ -38,22 +38,27 @@ class DirectoryManager():
             '%Y-%m-%d %H:%M:%S')
 
         archive_list = []
+        # outputs of named environment targets live one directory down
         for (dirpath, dirnames, filenames) in os.walk(self.outputs_dir):
             for file_name in filenames:
                 if 'hrb' not in file_name:
-                    root_name = file_name.split('.')[0]
+                    # the whole extension is kept, e.g. log.gz or log.1.gz
+                    root_name = file_name.split('.', 1)[0]
                     try:
-                        ext = file_name.split('.')[1]
+                        ext = file_name.split('.', 1)[1]
                     except IndexError:
                         ext = 'hrb'
 
                     name_format = '{}-{}-hrb.{}'
                     new_name = name_format.format(root_name, archive_id, ext)
-                    os.rename(os.path.join(self.outputs_dir, file_name),
-                              os.path.join(self.outputs_dir, new_name))
+                    os.rename(os.path.join(dirpath, file_name),
+                              os.path.join(dirpath, new_name))
 
-                    archive_list.append(new_name)
-            break
+                    archive_list.append(
+                        os.path.relpath(os.path.join(dirpath, new_name),
+                                        self.outputs_dir))
+            if dirpath != self.outputs_dir:
+                del dirnames[:]
 
         if archive_list:
             archive_name = 'archive-hrb.log'
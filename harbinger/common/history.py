@@ -0,0 +1,84 @@
+"""
+DurationHistory class:
+    - stores how long each test of a framework took in previous runs so
+    tests can be ordered and sharded longest first
+"""
+import heapq
+import os
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+# weight given to the newest duration when it is folded into the history
+SMOOTHING = 0.5
+
+
+class DurationHistory():
+    def __init__(self, framework_name, target=None, history_path=None):
+        if history_path is None:
+            history_dir = os.path.join(CONF.DEFAULT.files_dir, "history")
+            if target:
+                history_dir = os.path.join(history_dir, target)
+            history_path = os.path.join(history_dir, framework_name + ".json")
+        self.history_path = history_path
+        self.durations = None
+
+    def load(self):
+        if self.durations is None:
+            self.durations = Utils.read_json(self.history_path)
+
+        return self.durations
+
+    def record(self, durations):
+        """fold the durations (test -> seconds) of a run into the history"""
+        if not durations:
+            return
+
+        # shards and frameworks running in other processes may record at the
+        # same time, the lock keeps the read-modify-write consistent
+        with Utils.locked_json(self.history_path) as history:
+            for test, duration in durations.items():
+                if test in history:
+                    duration = SMOOTHING * duration + \
+                        (1 - SMOOTHING) * history[test]
+                history[test] = round(duration, 3)
+
+        self.durations = history
+        LOG.info('Recorded durations of %s tests in %s', len(durations),
+                 self.history_path)
+
+    def estimate(self, test):
+        """expected duration of test, unknown tests get the known average"""
+        durations = self.load()
+        if test in durations:
+            return durations[test]
+        if durations:
+            return sum(durations.values()) / len(durations)
+        return 0
+
+    def order(self, test_list):
+        """sort tests longest first, ties keep their original order"""
+        return sorted(test_list, key=self.estimate, reverse=True)
+
+    def pack(self, test_list, count):
+        """split tests into count groups using longest processing time first
+
+        each test, longest first, goes into the group with the lowest
+        expected total so far, so the groups finish at about the same time.
+        Without any history this falls back to dealing tests out evenly.
+
+        """
+        groups = [[] for _ in range(count)]
+        heap = [(0, 0, index) for index in range(count)]
+        for test in self.order(test_list):
+            load, size, index = heapq.heappop(heap)
+            groups[index].append(test)
+            heapq.heappush(heap,
+                           (load + self.estimate(test), size + 1, index))
+
+        return groups
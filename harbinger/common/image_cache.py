@@ -0,0 +1,114 @@
+"""
+ImageCache class:
+    - keeps the images built for the frameworks under the files directory,
+    addressed by a hash of what they were built from, so a missing image
+    is uploaded again without being rebuilt. The least recently used
+    builds are removed once the cache grows past its size
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+GB = 1024 ** 3
+
+
+class ImageCache():
+    def __init__(self, max_size, cache_dir=None):
+        """cache at most max_size bytes of images in cache_dir"""
+        if cache_dir is None:
+            cache_dir = os.path.join(CONF.DEFAULT.files_dir, "image_cache")
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_size = max_size
+
+    @staticmethod
+    def key(recipe, files=()):
+        """return the hash of a build
+
+        recipe is a json serialisable description of the build, files are
+        the scripts it runs, their contents are hashed
+
+        """
+        digest = hashlib.sha256(
+            json.dumps(recipe, sort_keys=True).encode('utf-8'))
+        for path in files:
+            digest.update(path.encode('utf-8') + b'\0')
+            with open(path, 'rb') as build_file:
+                for chunk in iter(lambda: build_file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        """return the directory holding the image built for key, or None"""
+        with Utils.locked_json(self.index_path) as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+
+            build_dir = os.path.join(self.cache_dir, key)
+            if not os.path.exists(os.path.join(build_dir, entry['file'])):
+                LOG.warning('Cached image %s is missing, it is built again',
+                            entry['file'])
+                del index[key]
+                return None
+
+            entry['used'] = time.time()
+
+        LOG.info('Using the image %s built before', entry['file'])
+        return build_dir
+
+    def store(self, key, image_name, image_path):
+        """keep the image named image_name built into image_path
+
+        returns the directory the image is cached in. The image is copied,
+        builders may modify the image they built before in place
+
+        """
+        image_file = Utils.find_image_file(image_name, image_path)
+        if image_file is None:
+            raise OSError('Image cache error: %s could not be found in %s' %
+                          (image_name, image_path))
+
+        build_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(build_dir):
+            os.makedirs(build_dir)
+        source = os.path.join(image_path, image_file)
+        target = os.path.join(build_dir, image_file)
+        # copied under a name of its own then renamed, a worker that looked
+        # the image up never reads a partial copy
+        Utils.replace_file(target, functools.partial(shutil.copyfile, source))
+
+        with Utils.locked_json(self.index_path) as index:
+            index[key] = {'file': image_file,
+                          'size': os.path.getsize(target),
+                          'used': time.time()}
+            self.evict(index, keep=key)
+
+        LOG.info('Cached image %s in %s', image_file, build_dir)
+        return build_dir
+
+    def evict(self, index, keep=None):
+        """remove the least recently used images the cache has no room for"""
+        size = sum(entry['size'] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]['used']):
+            if size <= self.max_size:
+                break
+            if key == keep:
+                continue
+
+            LOG.info('Removing cached image %s, the cache is full',
+                     index[key]['file'])
+            shutil.rmtree(os.path.join(self.cache_dir, key),
+                          ignore_errors=True)
+            size -= index.pop(key)['size']
@@ -0,0 +1,130 @@
+"""
+JobServer class:
+    - accepts run submissions for harbinger serve on a unix socket and
+    answers status requests, one json document per line
+JobClient class:
+    - talks to a running harbinger serve
+"""
+import contextlib
+import json
+import os
+import socket
+import socketserver
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """handle one request, e.g. {"action": "submit", "yaml": "..."}
+
+    submit answers with the queued job, list with every job and watch
+    with every event of a job, as they happen, followed by the job once
+    it finished. Failed requests are answered with {"error": "..."}.
+
+    """
+    def handle(self):
+        queue = self.server.queue
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            action = request.get('action')
+            if action == 'submit':
+                job = queue.submit(request['yaml'], request.get('resume'),
+                                   request.get('priority', 0))
+                self.send({'job': job.to_dict(),
+                           'position': queue.position(job)})
+            elif action == 'list':
+                self.send({'jobs': [job.to_dict() for job in queue.list()]})
+            elif action == 'watch':
+                # closed right away when the client goes, so the events of
+                # the job are not kept for it
+                events = queue.watch(request['job'])
+                with contextlib.closing(events):
+                    for event in events:
+                        self.send({'event': event})
+                self.send({'job': queue.get(request['job']).to_dict()})
+            else:
+                raise RuntimeError('Unknown action %s' % action)
+        except (BrokenPipeError, ConnectionResetError):
+            LOG.debug('Client went away')
+        except (AttributeError, KeyError, ValueError, RuntimeError) as ex:
+            self.send({'error': '%s: %s' % (ex.__class__.__name__, ex)})
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, queue):
+        if os.path.exists(socket_path):
+            if JobClient(socket_path).alive():
+                raise RuntimeError('harbinger serve is already listening on '
+                                   '%s' % socket_path)
+            # left behind by a daemon that did not exit cleanly
+            os.remove(socket_path)
+
+        directory = os.path.dirname(socket_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.queue = queue
+        self.socket_path = socket_path
+        super(JobServer, self).__init__(socket_path, JobRequestHandler)
+
+    def server_close(self):
+        super(JobServer, self).server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class JobClient():
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or CONF.DEFAULT.serve_socket
+
+    def alive(self):
+        try:
+            with self.connect():
+                return True
+        except OSError:
+            return False
+
+    def connect(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(self.socket_path)
+        except OSError:
+            client.close()
+            raise
+        return client
+
+    def request(self, message):
+        """send message and yield every answer of the daemon"""
+        try:
+            client = self.connect()
+        except OSError as ex:
+            raise RuntimeError('Could not reach harbinger serve on %s: %s' %
+                               (self.socket_path, ex))
+
+        with client, client.makefile('rb') as answers:
+            client.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            for line in answers:
+                answer = json.loads(line.decode('utf-8'))
+                if 'error' in answer:
+                    raise RuntimeError(answer['error'])
+                yield answer
+
+    def submit(self, yaml_text, resume=None, priority=0):
+        return next(self.request({'action': 'submit', 'yaml': yaml_text,
+                                  'resume': resume, 'priority': priority}))
+
+    def list(self):
+        return next(self.request({'action': 'list'}))['jobs']
+
+    def watch(self, job_id):
+        return self.request({'action': 'watch', 'job': job_id})
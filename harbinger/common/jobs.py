@@ -0,0 +1,366 @@
+"""
+JobQueue class:
+    - stores the runs submitted to harbinger serve in a sqlite database
+    with their priority, submission time and state, hands them out highest
+    priority first to the daemons of the host, and lets clients follow a
+    run while it executes
+"""
+import collections
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.journal import RunJournal
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PASSED = 'passed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (PASSED, FAILED, CANCELLED)
+
+COLUMNS = ('job_id', 'yaml_path', 'resume', 'priority', 'state', 'result',
+           'run_id', 'owner', 'submitted', 'started', 'finished')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    yaml_path TEXT NOT NULL,
+    resume TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    result TEXT,
+    run_id TEXT,
+    owner INTEGER,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority, submitted);
+'''
+
+
+class Job():
+    def __init__(self, job_id, yaml_path, resume=None, priority=0,
+                 state=QUEUED, result=None, run_id=None, owner=None,
+                 submitted=None, started=None, finished=None):
+        self.job_id = job_id
+        self.yaml_path = yaml_path
+        self.resume = resume
+        self.priority = priority
+        self.state = state
+        self.result = result
+        # the harbinger run the job became, it can be resumed by its id
+        self.run_id = run_id
+        # pid of the daemon that claimed the job
+        self.owner = owner
+        self.submitted = submitted if submitted is not None else time.time()
+        self.started = started
+        self.finished = finished
+
+    def to_dict(self):
+        return {
+            'job': self.job_id,
+            'yaml': self.yaml_path,
+            'resume': self.resume,
+            'priority': self.priority,
+            'state': self.state,
+            'result': self.result,
+            'run_id': self.run_id,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobEvents():
+    """the latest events of one job and the clients watching it"""
+    def __init__(self, max_events):
+        self.events = collections.deque(maxlen=max_events)
+        # events ever added, the deque only keeps the last ones
+        self.count = 0
+        self.watchers = 0
+        self.finished = False
+
+    def append(self, event):
+        self.events.append(event)
+        self.count += 1
+        if event.get('state') in FINISHED:
+            self.finished = True
+
+    def since(self, index):
+        """the events kept from index on, index counting every event"""
+        first = self.count - len(self.events)
+        return list(self.events)[max(index - first, 0):]
+
+
+class JobQueue():
+    # seconds between looks at the database for work queued by others
+    POLL = 1
+    # events kept of each job, a watcher falling further behind misses
+    # the oldest log lines
+    MAX_EVENTS = 1000
+
+    def __init__(self, jobs_dir=None):
+        if jobs_dir is None:
+            jobs_dir = os.path.join(CONF.DEFAULT.files_dir, "jobs")
+        if not os.path.isdir(jobs_dir):
+            os.makedirs(jobs_dir)
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, "jobs.db")
+        self.condition = threading.Condition()
+        # job_id -> JobEvents, state changes and log lines of the jobs seen
+        # by this process, dropped once a job finished and is not watched
+        self.events = {}
+
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def connect(self, immediate=False):
+        """yield a connection inside a transaction
+
+        an immediate transaction takes the write lock of the database up
+        front, so a read followed by a write is atomic between processes
+
+        """
+        connection = sqlite3.connect(self.db_path, timeout=30,
+                                     isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield connection
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _job(row):
+        return Job(**dict(zip(COLUMNS, row))) if row else None
+
+    def _select(self, connection, where='', args=()):
+        rows = connection.execute(
+            'SELECT %s FROM jobs %s' % (', '.join(COLUMNS), where), args)
+        return [self._job(row) for row in rows]
+
+    def submit(self, yaml_text, resume=None, priority=0):
+        """store the yaml of a run and queue it, return the new job
+
+        jobs with a higher priority are run first, jobs of the same
+        priority in the order they were submitted
+
+        """
+        job_id = uuid.uuid4().hex[:8]
+        yaml_path = os.path.join(self.jobs_dir, job_id + ".yaml")
+        with open(yaml_path, 'w') as yaml_file:
+            yaml_file.write(yaml_text)
+
+        job = Job(job_id, yaml_path, resume, int(priority or 0))
+        with self.connect() as connection:
+            connection.execute(
+                'INSERT INTO jobs (%s) VALUES (%s)' %
+                (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+                [getattr(job, column) for column in COLUMNS])
+        self._event(job.job_id, {'state': QUEUED})
+
+        LOG.info('Queued job %s with priority %s', job_id, job.priority)
+        return job
+
+    def get(self, job_id):
+        with self.connect() as connection:
+            jobs = self._select(connection, 'WHERE job_id = ?', (job_id, ))
+        if not jobs:
+            raise RuntimeError('There is no job %s' % job_id)
+        return jobs[0]
+
+    def list(self):
+        with self.connect() as connection:
+            return self._select(connection, 'ORDER BY submitted, rowid')
+
+    def position(self, job):
+        """number of queued jobs that will run before job"""
+        with self.connect() as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM jobs WHERE state = ? AND job_id != ? '
+                'AND (priority > ? OR (priority = ? AND submitted <= ?))',
+                (QUEUED, job.job_id, job.priority, job.priority,
+                 job.submitted)).fetchone()[0]
+
+    def claim(self, timeout=None):
+        """mark the next queued job running for this process and return it
+
+        the job is taken inside an immediate transaction, so two daemons
+        never claim the same job. Returns None when no job was queued
+        within timeout seconds.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.connect(immediate=True) as connection:
+                jobs = self._select(
+                    connection, 'WHERE state = ? ORDER BY priority DESC, '
+                    'submitted, rowid LIMIT 1', (QUEUED, ))
+                if jobs:
+                    job = jobs[0]
+                    job.state = RUNNING
+                    job.owner = os.getpid()
+                    job.started = time.time()
+                    # a resubmitted run continues, a new one is named after
+                    # the job so it can be resumed if the daemon dies
+                    job.run_id = job.resume or job.job_id
+                    connection.execute(
+                        'UPDATE jobs SET state = ?, owner = ?, started = ?, '
+                        'run_id = ? WHERE job_id = ?',
+                        (job.state, job.owner, job.started, job.run_id,
+                         job.job_id))
+
+            if jobs:
+                self._event(job.job_id, {'state': RUNNING})
+                return job
+
+            wait = self.POLL
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            with self.condition:
+                self.condition.wait(wait)
+
+    def recover(self):
+        """queue again the running jobs of daemons that died
+
+        a job whose run was journaled resumes that run, so frameworks
+        that completed are not run twice
+
+        """
+        with self.connect(immediate=True) as connection:
+            jobs = self._select(connection, 'WHERE state = ?', (RUNNING, ))
+            recovered = []
+            for job in jobs:
+                if job.owner and self._alive(job.owner):
+                    continue
+                resume = job.resume
+                if job.run_id and RunJournal(job.run_id).exists():
+                    resume = job.run_id
+                connection.execute(
+                    'UPDATE jobs SET state = ?, owner = NULL, started = NULL,'
+                    ' resume = ? WHERE job_id = ?',
+                    (QUEUED, resume, job.job_id))
+                recovered.append(job.job_id)
+
+        if recovered:
+            LOG.warning('Queued again jobs %s, their daemon stopped while '
+                        'running them', recovered)
+        return recovered
+
+    @staticmethod
+    def _alive(pid):
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def finish(self, job, state, result=None, run_id=None):
+        job.state = state
+        job.result = result
+        job.run_id = run_id or job.run_id
+        job.finished = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                'UPDATE jobs SET state = ?, result = ?, run_id = ?, '
+                'finished = ? WHERE job_id = ?',
+                (job.state, job.result, job.run_id, job.finished,
+                 job.job_id))
+        self._event(job.job_id, {'state': state, 'result': result,
+                                 'run_id': job.run_id})
+
+        LOG.info('Job %s %s', job.job_id, state)
+
+    def log(self, job, message):
+        self._event(job.job_id, {'log': message})
+
+    def _job_events(self, job_id):
+        job_events = self.events.get(job_id)
+        if job_events is None:
+            job_events = self.events[job_id] = JobEvents(self.MAX_EVENTS)
+        return job_events
+
+    def _event(self, job_id, event):
+        with self.condition:
+            job_events = self._job_events(job_id)
+            job_events.append(event)
+            if job_events.finished and not job_events.watchers:
+                del self.events[job_id]
+            self.condition.notify_all()
+
+    def watch(self, job_id):
+        """yield the events of a job, as they happen, until it finishes
+
+        log lines are only known to the daemon running the job, the state
+        of a job run by another daemon is followed through the database
+
+        """
+        job = self.get(job_id)
+        with self.condition:
+            self._job_events(job_id).watchers += 1
+        try:
+            for event in self._watch(job_id, job):
+                yield event
+        finally:
+            with self.condition:
+                job_events = self.events[job_id]
+                job_events.watchers -= 1
+                if not job_events.watchers and (job_events.finished or
+                                                not job_events.count):
+                    del self.events[job_id]
+
+    def _watch(self, job_id, job):
+        index = 0
+        state = None
+        while True:
+            with self.condition:
+                job_events = self.events[job_id]
+                if index >= job_events.count:
+                    self.condition.wait(self.POLL)
+                new_events = job_events.since(index)
+                index = job_events.count
+
+            for event in new_events:
+                state = event.get('state', state)
+                yield event
+
+            if state in FINISHED:
+                return
+
+            if not new_events:
+                job = self.get(job_id)
+                if job.state != state:
+                    state = job.state
+                    yield {'state': job.state, 'result': job.result,
+                           'run_id': job.run_id}
+                    if state in FINISHED:
+                        # finished by another daemon
+                        with self.condition:
+                            self.events[job_id].finished = True
+                        return
@@ -0,0 +1,110 @@
+"""
+RunJournal class:
+    - records the state of every framework (and shard of a framework)
+    of a run so an interrupted run can be resumed where it stopped
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+TIMED_OUT = 'timeout'
+CANCELLED = 'cancelled'
+
+# result given to units a resumed run does not execute again
+RESUMED = 'resumed'
+
+
+class RunJournal():
+    def __init__(self, run_id, journal_path=None):
+        if journal_path is None:
+            journal_path = os.path.join(CONF.DEFAULT.files_dir, "runs",
+                                        run_id + ".json")
+        self.run_id = run_id
+        self.journal_path = journal_path
+
+    @staticmethod
+    def new_run_id():
+        return uuid.uuid4().hex[:8]
+
+    @staticmethod
+    def unit_name(framework_name, target=None):
+        if target is None:
+            return framework_name
+        return '{}@{}'.format(framework_name, target)
+
+    @staticmethod
+    def yaml_digest(yaml_path):
+        """sha256 of the content of the yaml of a run, None without one
+
+        the content is compared rather than the path, a submitted run is
+        given a copy of its yaml under a new name every time
+
+        """
+        if not yaml_path or not os.path.isfile(yaml_path):
+            return None
+        with open(yaml_path, 'rb') as yaml_file:
+            return hashlib.sha256(yaml_file.read()).hexdigest()
+
+    def exists(self):
+        return os.path.exists(self.journal_path)
+
+    def create(self, yaml_path):
+        with Utils.locked_json(self.journal_path) as journal:
+            journal['run_id'] = self.run_id
+            journal['yaml'] = yaml_path
+            journal['yaml_digest'] = self.yaml_digest(yaml_path)
+            journal['created'] = time.time()
+            journal.setdefault('units', {})
+
+        LOG.info('Run %s is journaled in %s, resume it with --resume %s',
+                 self.run_id, self.journal_path, self.run_id)
+
+    def load(self):
+        return Utils.read_json(self.journal_path)
+
+    def matches(self, yaml_path):
+        """whether the run was journaled with the same yaml as yaml_path"""
+        recorded = self.load().get('yaml_digest')
+        return recorded is None or recorded == self.yaml_digest(yaml_path)
+
+    def _unit(self, journal, unit):
+        return journal.setdefault('units', {}).setdefault(
+            unit, {'state': None, 'shards': {}})
+
+    def state(self, unit, shard=None):
+        record = self.load().get('units', {}).get(unit, {})
+        if shard is not None:
+            return record.get('shards', {}).get(str(shard))
+        return record.get('state')
+
+    def completed(self, unit, shard=None):
+        return self.state(unit, shard) == COMPLETED
+
+    def set_state(self, unit, state, shard=None):
+        with Utils.locked_json(self.journal_path) as journal:
+            record = self._unit(journal, unit)
+            if shard is not None:
+                record['shards'][str(shard)] = state
+            else:
+                record['state'] = state
+            record['updated'] = time.time()
+
+    def shard_groups(self, unit):
+        """tests of every shard of unit as they were first split"""
+        return self.load().get('units', {}).get(unit, {}).get('groups')
+
+    def set_shard_groups(self, unit, groups):
+        with Utils.locked_json(self.journal_path) as journal:
+            self._unit(journal, unit)['groups'] = groups
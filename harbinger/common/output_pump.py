@@ -0,0 +1,169 @@
+"""
+OutputPump class:
+    - reads the stdout and stderr of a framework command in large chunks,
+    splits them into lines and hands them to sinks: the log, the tail
+    kept for failures
+"""
+import collections
+import os
+import selectors
+import time
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+
+class CommandResult():
+    """what a command returned and how much it wrote"""
+
+    def __init__(self, command):
+        self.command = command
+        self.returncode = None
+        self.started = time.time()
+        self.duration = None
+        self.bytes = {STDOUT: 0, STDERR: 0}
+        self.lines = {STDOUT: 0, STDERR: 0}
+
+    def __repr__(self):
+        return '<CommandResult %s: returned %s in %.1fs, %s>' % (
+            self.command, self.returncode, self.duration or 0,
+            ', '.join('%s %s bytes' % (stream, self.bytes[stream])
+                      for stream in (STDOUT, STDERR)))
+
+
+class LogSink():
+    """log the output as it is, one record per chunk read
+
+    a record per line made the log the busiest part of a chatty command
+    """
+
+    def __init__(self, logger=LOG):
+        self.logger = logger
+
+    def write(self, stream, lines):
+        self.logger.info('\n'.join(lines).rstrip(),
+                         extra={'plainOutput': True})
+
+    def close(self):
+        pass
+
+
+class TailSink():
+    """keep the last max_size characters of the output, whatever its size
+
+    lines of both streams are kept in the order they were read, a line
+    longer than max_size is cut to its end
+
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lines = collections.deque()
+        self.size = 0
+        self.dropped = False
+
+    def write(self, stream, lines):
+        # only the end of a large chunk can be kept, the rest is skipped
+        # without being looked at
+        start = len(lines)
+        kept = 0
+        while start > 0 and kept < self.max_size:
+            start -= 1
+            kept += len(lines[start]) + 1
+        if start > 0:
+            self.dropped = True
+
+        for line in lines[start:]:
+            if len(line) >= self.max_size:
+                # with its line break it fills the tail
+                line = line[1 - self.max_size:]
+            self.lines.append(line)
+            self.size += len(line) + 1
+            while self.size > self.max_size:
+                self.size -= len(self.lines.popleft()) + 1
+                self.dropped = True
+
+    def close(self):
+        pass
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+class OutputPump():
+    # bytes read from a pipe at once
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, popen, sinks, on_output=None):
+        """pump the pipes of popen, opened in binary mode, into sinks
+
+        a sink has write(stream, lines), called with the complete lines
+        of each chunk read from stream, and close(). on_output is called
+        whenever something was read
+
+        """
+        self.popen = popen
+        self.sinks = sinks
+        self.on_output = on_output
+
+    def run(self, command=None):
+        """pump until both pipes are closed, wait for the command to exit
+        and return its CommandResult
+        """
+        result = CommandResult(command)
+        started = time.monotonic()
+        selector = selectors.DefaultSelector()
+        pending = {}
+        for stream, pipe in ((STDOUT, self.popen.stdout),
+                             (STDERR, self.popen.stderr)):
+            if pipe is not None:
+                selector.register(pipe.fileno(), selectors.EVENT_READ,
+                                  stream)
+                pending[stream] = b''
+
+        try:
+            while selector.get_map():
+                for key, _ in selector.select():
+                    stream = key.data
+                    chunk = os.read(key.fd, self.CHUNK_SIZE)
+                    if not chunk:
+                        selector.unregister(key.fd)
+                        # a last line without a line break
+                        rest = pending.pop(stream)
+                        if rest:
+                            self.emit(result, stream, rest)
+                        continue
+
+                    if self.on_output is not None:
+                        self.on_output()
+                    result.bytes[stream] += len(chunk)
+                    complete, newline, pending[stream] = \
+                        (pending[stream] + chunk).rpartition(b'\n')
+                    if newline:
+                        self.emit(result, stream, complete)
+                    if len(pending[stream]) >= self.CHUNK_SIZE:
+                        # a stream writing no line breaks, e.g. a progress
+                        # bar, is passed on in pieces rather than held
+                        self.emit(result, stream, pending[stream])
+                        pending[stream] = b''
+        finally:
+            selector.close()
+            for pipe in (self.popen.stdout, self.popen.stderr):
+                if pipe is not None:
+                    pipe.close()
+            for sink in self.sinks:
+                sink.close()
+
+        result.returncode = self.popen.wait()
+        result.duration = time.monotonic() - started
+        return result
+
+    def emit(self, result, stream, data):
+        lines = data.decode('utf-8', 'replace').split('\n')
+        result.lines[stream] += len(lines)
+        for sink in self.sinks:
+            sink.write(stream, lines)
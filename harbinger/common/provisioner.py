@@ -0,0 +1,77 @@
+"""
+Provisioner class:
+    - readies the images and flavors of the frameworks of a run in a pool
+    of threads, ahead of their execution
+"""
+from multiprocessing.pool import ThreadPool
+
+from oslo_log import log as logging
+
+from harbinger.common.cancellation import ProcessGroups
+
+LOG = logging.getLogger(__name__)
+
+
+class Provisioner():
+    def __init__(self, provision, threads):
+        """provision(*args) readies the resources of one framework
+
+        threads is the number of frameworks provisioned at once
+
+        """
+        self.provision = provision
+        self.pool = ThreadPool(processes=threads)
+        self.results = {}
+        # every submission, waited for or not
+        self.started = []
+        self.stopped = False
+
+    def submit(self, name, args):
+        """start provisioning the framework unit name"""
+        result = self.pool.apply_async(self._provision, args)
+        self.results[name] = result
+        self.started.append(result)
+
+    def _provision(self, *args):
+        # frameworks still queued once the run stopped are left alone
+        if not self.stopped:
+            self.provision(*args)
+
+    def wait(self, name):
+        """block until the provisioning of name is over
+
+        a failure is only logged, the framework meets it again when it
+        provisions its resources itself and fails with it
+
+        """
+        result = self.results.pop(name, None)
+        if result is None:
+            return
+
+        try:
+            result.get()
+            LOG.info('Resources of %s are ready', name)
+        except Exception as ex:
+            LOG.warning('Provisioning %s failed: %s', name, ex)
+
+    def wait_all(self):
+        for name in list(self.results):
+            self.wait(name)
+
+    def stop(self):
+        """return once no thread provisions anything anymore
+
+        nothing more is provisioned, and the commands running are killed
+        until the threads are done, a cancelled or failed run does not
+        wait for an upload to finish. Frameworks are run in this process
+        too, this is only called once none of them runs
+
+        """
+        self.stopped = True
+        self.pool.close()
+        for result in self.started:
+            while not result.ready():
+                ProcessGroups.stop(grace=0)
+                result.wait(0.1)
+        self.pool.terminate()
+        self.pool.join()
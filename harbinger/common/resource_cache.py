@@ -0,0 +1,81 @@
+"""
+ResourceCache class:
+    - keeps the images and flavors of a cloud project on disk for a few
+    minutes, so the frameworks and workers of a run look them up without
+    asking glance and nova each time
+"""
+import hashlib
+import os
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+# kinds of resources that are cached
+IMAGES = 'images'
+FLAVORS = 'flavors'
+
+
+class ResourceCache():
+    def __init__(self, project, ttl, run_id=None, cache_path=None):
+        """cache the resources of project, named after its auth url and ids
+
+        resources are kept ttl seconds after they were listed, run_id is
+        the run listing them for its frameworks
+
+        """
+        if cache_path is None:
+            key = hashlib.sha256(project.encode('utf-8'))
+            cache_path = os.path.join(CONF.DEFAULT.files_dir, "resources",
+                                      key.hexdigest() + ".json")
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.run_id = run_id
+
+    def fresh(self, entry, run_id=None):
+        if not entry or time.time() - entry['fetched'] > self.ttl:
+            return False
+        return run_id is None or entry.get('run_id') == run_id
+
+    def lookup(self, kind):
+        """return name -> id of every resource of kind, None if not fresh"""
+        entry = Utils.read_json(self.cache_path).get(kind)
+        if not self.fresh(entry):
+            return None
+
+        return entry['resources']
+
+    def store(self, kind, resources):
+        with Utils.locked_json(self.cache_path) as cached:
+            cached[kind] = self.entry(resources)
+
+    def entry(self, resources):
+        return {'fetched': time.time(), 'run_id': self.run_id,
+                'resources': resources}
+
+    def refresh(self, kind, list_resources):
+        """list the resources of kind once for the run and return them
+
+        list_resources returns name -> id of every resource of kind. The
+        first framework of the run lists them while the cache is locked,
+        the others wait and get its result
+
+        """
+        with Utils.locked_json(self.cache_path) as cached:
+            entry = cached.get(kind)
+            if not self.fresh(entry, self.run_id):
+                cached[kind] = entry = self.entry(list_resources())
+                LOG.info('Cached %s %s in %s', len(entry['resources']), kind,
+                         self.cache_path)
+
+        return entry['resources']
+
+    def invalidate(self, kind):
+        """forget the resources of kind, e.g. once one was created"""
+        with Utils.locked_json(self.cache_path) as cached:
+            cached.pop(kind, None)
@@ -0,0 +1,210 @@
+"""
+Scheduler class:
+    - admits framework executions into a worker pool only while the
+    concurrency budget declared in the Options section allows it and
+    every framework it depends on has finished successfully
+"""
+import collections
+import threading
+import time
+
+from oslo_log import log as logging
+
+from harbinger.common.cancellation import Cancelled
+
+LOG = logging.getLogger(__name__)
+
+
+class DependencyError(RuntimeError):
+    """raised in place of running a unit whose dependency did not pass"""
+
+
+class Scheduler():
+    def __init__(self, budget=None, max_parallel=None):
+        self.budget = dict(budget or {})
+        self.max_parallel = max_parallel
+        self.in_use = dict.fromkeys(self.budget, 0)
+        self.running = 0
+        self.units = collections.OrderedDict()
+        self.dependencies = {}
+        self.completed = collections.OrderedDict()
+        self.condition = threading.Condition()
+        # set once the run is cancelled, running units must stop by then
+        self.deadline = None
+
+    def add(self, name, weight, args, depends_on=None):
+        """queue a unit of work
+
+        weight is a mapping of resource dimension (e.g. vms, vcpus, ram) to
+        the amount of that resource the unit will consume while running.
+        Dimensions that are not part of the budget are not limited.
+        depends_on lists the units that must pass before this one starts.
+
+        """
+        self.units[name] = (dict(weight or {}), args)
+        self.dependencies[name] = list(depends_on or [])
+
+    def mark_completed(self, name, result=None):
+        """treat a queued unit as finished without running it"""
+        self.completed[name] = result
+
+    def cancel(self, grace):
+        """stop admitting units, running ones are given grace seconds"""
+        with self.condition:
+            if self.deadline is None:
+                self.deadline = time.monotonic() + grace
+            self.condition.notify_all()
+
+    def order(self):
+        """return unit names sorted so each follows its dependencies
+
+        units without a dependency between them keep the order they were
+        added in. Raises RuntimeError on unknown dependencies or cycles.
+
+        """
+        unknown = ['%s -> %s' % (name, dep)
+                   for name, deps in self.dependencies.items()
+                   for dep in deps if dep not in self.units]
+        if unknown:
+            raise RuntimeError('There are one or more dependencies on '
+                               'frameworks that are not in Execute:\n%s' %
+                               unknown)
+
+        ordered = []
+        remaining = list(self.units)
+        while remaining:
+            ready = [
+                name for name in remaining
+                if all(dep in ordered for dep in self.dependencies[name])
+            ]
+            if not ready:
+                raise RuntimeError('There is a dependency cycle between '
+                                   'the frameworks:\n%s' % remaining)
+            for name in ready:
+                ordered.append(name)
+                remaining.remove(name)
+
+        return ordered
+
+    def fits(self, weight):
+        if self.max_parallel and self.running >= self.max_parallel:
+            return False
+
+        # a unit heavier than the whole budget is still allowed to run on
+        # its own, otherwise it would never be admitted
+        if self.running == 0:
+            return True
+
+        for key, limit in self.budget.items():
+            if self.in_use[key] + weight.get(key, 0) > limit:
+                return False
+
+        return True
+
+    def acquire(self, name, weight):
+        for key, limit in self.budget.items():
+            if weight.get(key, 0) > limit:
+                LOG.warning(
+                    '%s needs %s %s which exceeds the budget of %s, '
+                    'it will be run on its own', name, weight[key], key,
+                    limit)
+            self.in_use[key] += weight.get(key, 0)
+        self.running += 1
+
+    def release(self, weight):
+        for key in self.budget:
+            self.in_use[key] -= weight.get(key, 0)
+        self.running -= 1
+
+    def run(self, pool, func):
+        """run every queued unit through pool.apply_async
+
+        a unit is admitted as soon as all of its dependencies have passed,
+        in dependency order, later units are allowed to start ahead of a
+        unit that does not currently fit. Units depending on a unit that
+        failed are not run. Once cancelled no more units are started and
+        units still running when the grace period ends are given up on.
+        Returns an OrderedDict of unit name to result, or to the exception
+        the unit raised.
+
+        """
+        pending = [
+            name for name in self.order() if name not in self.completed
+        ]
+        results = collections.OrderedDict((name, None) for name in self.units)
+        results.update(self.completed)
+        done = set(self.completed)
+        finished = []
+        active = set()
+
+        def on_done(name, outcome):
+            with self.condition:
+                results[name] = outcome
+                finished.append(name)
+                self.condition.notify()
+
+        with self.condition:
+            while pending or self.running:
+                if self.deadline is not None:
+                    for name in pending:
+                        results[name] = Cancelled(
+                            '%s was not started, the run was cancelled' %
+                            name)
+                    del pending[:]
+
+                for name in list(pending):
+                    failed = [
+                        dep for dep in self.dependencies[name]
+                        if isinstance(results[dep], Exception)
+                    ]
+                    if failed:
+                        LOG.error('Skipping %s, dependencies %s did not pass',
+                                  name, failed)
+                        pending.remove(name)
+                        results[name] = DependencyError(
+                            '%s was skipped because %s did not pass' %
+                            (name, ', '.join(failed)))
+                        continue
+
+                    weight, args = self.units[name]
+                    if not done.issuperset(self.dependencies[name]) or \
+                            not self.fits(weight):
+                        continue
+
+                    pending.remove(name)
+                    self.acquire(name, weight)
+                    active.add(name)
+                    LOG.info('Starting %s (%s running, in use: %s)', name,
+                             self.running, self.in_use)
+                    pool.apply_async(
+                        func, [args],
+                        callback=lambda res, name=name: on_done(name, res),
+                        error_callback=lambda exc, name=name: on_done(
+                            name, exc))
+
+                if not self.running:
+                    continue
+
+                while not finished:
+                    if self.deadline is None:
+                        self.condition.wait()
+                        continue
+                    remaining = self.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                if not finished:
+                    for name in active:
+                        results[name] = Cancelled(
+                            '%s did not stop after the run was cancelled' %
+                            name)
+                    break
+
+                while finished:
+                    name = finished.pop()
+                    done.add(name)
+                    active.discard(name)
+                    self.release(self.units[name][0])
+
+        return results
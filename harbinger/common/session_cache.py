@@ -0,0 +1,111 @@
+"""
+SessionCache class:
+    - hands out one keystone session per set of credentials, shared by the
+    Glance and Nova clients of every framework, and keeps the token it got
+    on disk so the other workers of a run, and the runs that follow, reuse
+    it instead of authenticating again
+"""
+import hashlib
+import os
+import threading
+
+from keystoneauth1.identity.generic import password
+from keystoneauth1 import session
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+# seconds before it expires a cached token is replaced by a new one
+REFRESH_MARGIN = 300
+
+
+class CachedPassword(password.Password):
+    """password authentication that shares its token through a file"""
+    def __init__(self, cache_dir=None, **kwargs):
+        super(CachedPassword, self).__init__(**kwargs)
+        self.cache_dir = cache_dir
+
+    @property
+    def cache_key(self):
+        # a hash of the credentials, they never reach the disk
+        return hashlib.sha256(
+            self.get_cache_id().encode('utf-8')).hexdigest()
+
+    @property
+    def cache_path(self):
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(CONF.DEFAULT.files_dir, "sessions")
+        return os.path.join(cache_dir, self.cache_key + ".json")
+
+    def get_auth_ref(self, session, **kwargs):
+        """return the cached token, authenticate if it is about to expire
+
+        the file stays locked while authenticating, so processes starting
+        together authenticate once and the others get its token
+
+        """
+        cache_path = self.cache_path
+        directory = os.path.dirname(cache_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # the token is a secret, only the owner of the file may read it
+        os.close(os.open(cache_path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+        with Utils.locked_json(cache_path) as cached:
+            state = cached.get('auth_state')
+            if state:
+                self.set_auth_state(state)
+                if not self.auth_ref.will_expire_soon(REFRESH_MARGIN):
+                    LOG.debug('Using the token cached in %s', cache_path)
+                    return self.auth_ref
+
+            LOG.info('Authenticating with keystone: %s', self.auth_url)
+            self.auth_ref = super(CachedPassword, self).get_auth_ref(
+                session, **kwargs)
+            cached['auth_state'] = self.get_auth_state()
+
+        return self.auth_ref
+
+
+class SessionCache():
+    lock = threading.Lock()
+    sessions = {}
+    # the process the sessions belong to
+    pid = os.getpid()
+
+    @classmethod
+    def session(cls, cache_dir=None, **kwargs):
+        """return the keystone session for the credentials in kwargs
+
+        the session is created once per process, it authenticates the
+        first time a client uses it
+
+        """
+        if cls.pid != os.getpid():
+            cls.reset()
+
+        auth = CachedPassword(cache_dir, **kwargs)
+        key = auth.cache_key
+        with cls.lock:
+            if key not in cls.sessions:
+                cls.sessions[key] = session.Session(auth=auth)
+
+            return cls.sessions[key]
+
+    @classmethod
+    def reset(cls):
+        """forget every session, they are created again when needed
+
+        a forked worker must not share the connections of its parent, its
+        sessions are created again and find the token on disk. The lock is
+        replaced as well, the parent may have held it while forking
+
+        """
+        cls.lock = threading.Lock()
+        cls.sessions = {}
+        cls.pid = os.getpid()
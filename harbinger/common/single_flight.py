@@ -0,0 +1,80 @@
+"""
+SingleFlight class:
+    - lets one process of a run build a missing cloud resource, e.g. an
+    image, while the other processes that need it wait for it instead of
+    building it again
+"""
+import hashlib
+import os
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class SingleFlight():
+    def __init__(self, scope, name, lock_path=None):
+        """coordinate the builds of the resource name within scope
+
+        scope tells the clouds and kinds of resources apart, a build that
+        fails is not attempted again by the processes that were waiting
+        for it
+
+        """
+        if lock_path is None:
+            key = hashlib.sha256('{}\0{}'.format(scope, name).encode('utf-8'))
+            lock_path = os.path.join(CONF.DEFAULT.files_dir, "locks",
+                                     key.hexdigest() + ".json")
+        self.lock_path = lock_path
+        self.name = name
+
+    def run(self, done, build):
+        """build the resource unless done() tells it exists
+
+        processes calling run at the same time are serialised, the first
+        one builds and the others find the resource done. When the build
+        failed while they were waiting for it they raise its error instead
+        of building, a process coming later, e.g. of a resumed run, builds
+        again. A cancelled build is not a failure. Returns True if this
+        process built the resource.
+
+        """
+        if done():
+            return False
+
+        LOG.debug('Waiting for the build lock of %s', self.name)
+        waiting_since = time.time()
+        error = None
+        with Utils.locked_json(self.lock_path) as flight:
+            if done():
+                LOG.info('%s was built by another worker', self.name)
+                return False
+
+            if flight.get('error') and \
+                    flight.get('failed_at', 0) >= waiting_since:
+                raise RuntimeError('Building %s failed in another worker: %s'
+                                   % (self.name, flight['error']))
+
+            try:
+                build()
+            except Cancelled:
+                # the run was stopped, nothing is recorded and the next
+                # one to come builds
+                raise
+            except Exception as ex:
+                error = ex
+                flight['error'] = '%s: %s' % (ex.__class__.__name__, ex)
+                flight['failed_at'] = time.time()
+            else:
+                flight['error'] = None
+
+        if error is not None:
+            raise error
+
+        return True
@@ -1,4 +1,8 @@
+import contextlib
+import fcntl
+import json
 import os
+import tempfile
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -38,6 +42,82 @@ class Utils():
                    'because the class was not found'.format(dottedpath))
             raise AttributeError(msg)
 
+    @staticmethod
+    def read_json(path):
+        """return the json document stored in path, or an empty dict"""
+        if not os.path.exists(path):
+            return {}
+
+        with open(path, 'r') as json_file:
+            fcntl.flock(json_file, fcntl.LOCK_SH)
+            try:
+                return json.loads(json_file.read() or '{}')
+            except ValueError:
+                LOG.warning('Ignoring unreadable file %s', path)
+                return {}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def locked_json(path):
+        """yield the json document stored in path under an exclusive lock
+
+        the document (an empty dict for a new or unreadable file) can be
+        changed in place, it is written back when the block exits. The
+        lock makes read-modify-write safe between processes.
+
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, 'a+') as json_file:
+            fcntl.flock(json_file, fcntl.LOCK_EX)
+            json_file.seek(0)
+            try:
+                document = json.loads(json_file.read() or '{}')
+            except ValueError:
+                LOG.warning('Replacing unreadable file %s', path)
+                document = {}
+
+            yield document
+
+            json_file.seek(0)
+            json_file.truncate()
+            json.dump(document, json_file, indent=2, sort_keys=True)
+
+    @staticmethod
+    def find_image_file(image_name, image_path):
+        """return the name of the first file in image_path named after
+        image_name, or None
+        """
+        for file_name in sorted(os.listdir(image_path)):
+            if image_name in file_name and \
+                    os.path.isfile(os.path.join(image_path, file_name)):
+                return file_name
+
+        return None
+
+    @staticmethod
+    def replace_file(path, write):
+        """write(partial) fills a temporary file that then replaces path
+
+        each caller writes a file of its own next to path, readers of path
+        never see it half written. The temporary file is removed when
+        write fails
+
+        """
+        directory, name = os.path.split(path)
+        handle, partial = tempfile.mkstemp(prefix=name + '.', suffix='.part',
+                                           dir=directory or None)
+        os.close(handle)
+        try:
+            write(partial)
+            os.replace(partial, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(partial)
+            raise
+
     @staticmethod
     def get_supported_frameworks():
         directory = os.path.dirname(os.path.dirname(__file__)) + "/executors"
@@ -65,6 +145,7 @@ class Utils():
          (Execute -> Framework)
            extras
            options_override
+         (Environment -> target)
          (Options)
          (Harbinger.cfg)
 
@@ -76,6 +157,7 @@ class Utils():
         # ensure the "optional" fields in input yaml have a default value
         # to prevent any errors in lookup
         hierarchy = (CONF[executor.framework.name], executor.options,
+                     getattr(executor, 'environment', None),
                      executor.framework.options_override
                      if 'options_override' in vars(executor.framework) else {},
                      executor.framework.extras
@@ -103,17 +185,20 @@ class Utils():
         return result[-1]
 
     @classmethod
-    def source_openrc(cls, executor):
-        """set additional openstack related environment variables
+    def openrc_environ(cls, executor):
+        """return the openstack related environment variables of executor
 
-         This sets the additional openstack related environment variables
+         These are the additional openstack related environment variables
          that are needed at a minimum to connect to the api. Other neccessary
          variables are specified in the input yaml and enforced via the schema
-         so they should already be set.
+         so they are part of the environment already. Unset ones are left out.
          """
-        os.environ['OS_USERNAME'] = cls.hierarchy_lookup(executor, 'username')
-        os.environ['OS_PASSWORD'] = cls.hierarchy_lookup(executor, 'password')
-        os.environ['OS_PROJECT_NAME'] = cls.hierarchy_lookup(
-            executor, 'project_name')
-        os.environ['EXTERNAL_NETWORK'] = cls.hierarchy_lookup(
-            executor, 'external_network')
+        environ = {
+            'OS_USERNAME': cls.hierarchy_lookup(executor, 'username'),
+            'OS_PASSWORD': cls.hierarchy_lookup(executor, 'password'),
+            'OS_PROJECT_NAME': cls.hierarchy_lookup(executor, 'project_name'),
+            'EXTERNAL_NETWORK': cls.hierarchy_lookup(executor,
+                                                     'external_network'),
+        }
+        return {key: value for key, value in environ.items()
+                if value is not None}
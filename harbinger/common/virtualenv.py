@@ -0,0 +1,58 @@
+"""
+VirtualEnv class:
+    - the environment bin/activate would set for the virtualenv of a
+    framework, worked out once per process, so its programs can be run
+    directly rather than through a shell sourcing bin/activate
+"""
+import os
+import shutil
+import threading
+
+
+class VirtualEnv():
+    # path -> VirtualEnv of this process
+    _venvs = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.bin_dir = os.path.join(path, 'bin')
+        # (program, PATH) -> absolute path of program
+        self.programs = {}
+
+    @classmethod
+    def get(cls, path):
+        """the VirtualEnv of path, created on first use"""
+        with cls._lock:
+            venv = cls._venvs.get(path)
+            if venv is None:
+                venv = cls._venvs[path] = cls(path)
+            return venv
+
+    def environ(self, base):
+        """a copy of the variables base with the venv activated"""
+        environ = dict(base)
+        environ.pop('PYTHONHOME', None)
+        environ['VIRTUAL_ENV'] = self.path
+        environ['PATH'] = self.bin_dir + os.pathsep + \
+            base.get('PATH', os.defpath)
+        return environ
+
+    def resolve(self, program, path):
+        """the absolute path of program, searched for in path
+
+        program is returned as it is when it holds a directory or can not
+        be found, running it then fails with the usual OSError
+
+        """
+        if os.sep in program:
+            return program
+
+        key = (program, path)
+        resolved = self.programs.get(key)
+        if resolved is None:
+            resolved = shutil.which(program, path=path)
+            if resolved is None:
+                return program
+            self.programs[key] = resolved
+        return resolved
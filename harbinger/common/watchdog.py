@@ -0,0 +1,90 @@
+"""
+Watchdog class:
+    - kills the process group of a framework command that runs past its
+    wall-clock timeout or stops producing output for too long
+"""
+import threading
+import time
+
+from oslo_log import log as logging
+
+from harbinger.common.cancellation import ProcessGroups
+
+LOG = logging.getLogger(__name__)
+
+# reasons a command can be killed for
+WALL_CLOCK = 'wall-clock'
+STALL = 'stall'
+
+
+class CommandTimeout(RuntimeError):
+    """raised in place of the result of a command the watchdog killed"""
+
+
+class Watchdog():
+    def __init__(self, popen, timeout=None, stall_timeout=None, grace=10,
+                 interval=1):
+        """watch popen, which must lead its own process group
+
+        timeout is the wall-clock limit and stall_timeout the longest time
+        without output, both in seconds, None disables them. A killed group
+        gets SIGTERM first and SIGKILL once grace seconds have passed.
+
+        """
+        self.popen = popen
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.grace = grace
+        self.interval = interval
+        self.started = self.last_output = time.monotonic()
+        self.reason = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def feed(self):
+        """tell the watchdog the command produced output"""
+        self.last_output = time.monotonic()
+
+    def expired(self):
+        now = time.monotonic()
+        if self.timeout and now - self.started > self.timeout:
+            return WALL_CLOCK
+        if self.stall_timeout and now - self.last_output > self.stall_timeout:
+            return STALL
+        return None
+
+    def start(self):
+        if not self.timeout and not self.stall_timeout:
+            return
+
+        self.thread = threading.Thread(target=self._watch,
+                                       name='watchdog-%s' % self.popen.pid)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            reason = self.expired()
+            if reason is not None:
+                self.reason = reason
+                self.kill()
+                return
+
+    def kill(self):
+        """terminate the whole process group, then kill what is left"""
+        LOG.error('Killing process group %s, %s timeout expired',
+                  self.popen.pid, self.reason)
+        ProcessGroups.terminate([self.popen.pid], self.grace,
+                                lambda: self.popen.poll() is not None)
+
+    def describe(self, command):
+        if self.reason == STALL:
+            return 'command <%s> was killed after %s seconds without ' \
+                   'output' % (command, self.stall_timeout)
+        return 'command <%s> was killed after running for %s seconds' % \
+            (command, self.timeout)
@@ -4,83 +4,457 @@ BaseExecutor class:
     will inheret from this class
 """
 
+import functools
+import json
 import os
 import shlex
 import subprocess
+import time
+import types
+
+from multiprocessing.pool import ThreadPool
 
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.cancellation import ProcessGroups
+from harbinger.common.history import DurationHistory
+from harbinger.common.image_cache import GB
+from harbinger.common.image_cache import ImageCache
+from harbinger.common.journal import CANCELLED
+from harbinger.common.journal import COMPLETED
+from harbinger.common.journal import FAILED
+from harbinger.common.journal import RunJournal
+from harbinger.common.journal import RUNNING
+from harbinger.common.journal import TIMED_OUT
+from harbinger.common.output_file import FILE_OUTPUT
+from harbinger.common.output_file import LOG_OUTPUT
+from harbinger.common.output_file import MB
+from harbinger.common.output_file import OutputFile
+from harbinger.common.output_pump import LogSink
+from harbinger.common.output_pump import OutputPump
+from harbinger.common.output_pump import TailSink
+from harbinger.common.resource_cache import FLAVORS
+from harbinger.common.resource_cache import IMAGES
+from harbinger.common.resource_cache import ResourceCache
+from harbinger.common.session_cache import SessionCache
+from harbinger.common.single_flight import SingleFlight
 from harbinger.common.utils import Utils
+from harbinger.common.virtualenv import VirtualEnv
+from harbinger.common.watchdog import CommandTimeout
+from harbinger.common.watchdog import Watchdog
 from harbinger.flavors.flavor_manager import FlavorManager
+from harbinger.flavors.flavor_manager import NO_REUSE
+from harbinger.flavors.flavor_manager import REUSE
+from harbinger.flavors.flavor_manager import SPEC_KEYS
 from harbinger.images.image_manager import ImageManager
+from harbinger.images.image_manager import MEMBERSHIP
+from harbinger.images.image_manager import SHARING
+from harbinger.images.image_optimizer import ImageOptimizer
 
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# scope of the image builds of this host, whatever project they are for
+BUILDS = 'builds'
+
 
 class BaseExecutor():
     def __init__(self, framework, environment, options):
-        self.inputs_dir = os.path.join(CONF.DEFAULT.files_dir, "inputs")
-        self.outputs_dir = os.path.join(CONF.DEFAULT.files_dir, "outputs")
         self.framework = framework
         self.environment = environment
         self.options = options
+        # the environment variables the commands of the framework run with,
+        # a read-only mapping of its own, see build_environ
+        self.environ = self.build_environ()
+
+        # each target environment gets its own inputs and outputs so
+        # results from different clouds do not overwrite each other
+        self.target = getattr(self.environment, 'target', None)
+        self.inputs_dir = os.path.join(CONF.DEFAULT.files_dir, "inputs")
+        self.outputs_dir = os.path.join(CONF.DEFAULT.files_dir, "outputs")
+        if self.target:
+            self.inputs_dir = os.path.join(self.inputs_dir, self.target)
+            self.outputs_dir = os.path.join(self.outputs_dir, self.target)
+            for directory in (self.inputs_dir, self.outputs_dir):
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+
         self.relative_path = os.path.join(
             CONF.DEFAULT.files_dir, "frameworks", self.framework.name,
             Utils.hierarchy_lookup(self, "test_paths"))
+        self.shards = int(Utils.hierarchy_lookup(self, "shards") or 1)
+        self.history = DurationHistory(self.framework.name, self.target)
+
+        # timeouts are in seconds, 0 or unset disables them. timeout covers
+        # the whole framework, command_timeout and stall_timeout (the
+        # longest time without output) apply to each command
+        self.timeout = self.lookup_seconds('timeout')
+        self.command_timeout = self.lookup_seconds('command_timeout')
+        self.stall_timeout = self.lookup_seconds('stall_timeout')
+        self.deadline = None
+        if self.timeout:
+            self.deadline = time.monotonic() + self.timeout
+        # the last failure_tail_size KB written by a command are attached
+        # to its error when it fails, 0 disables it
+        self.failure_tail_size = self.lookup_number('failure_tail_size', 'KB')
+
+        # the output of commands is logged as it comes, or with
+        # command_output = file written to a file of each framework and
+        # shard in outputs_dir, leaving a line per command in the log
+        self.command_output = Utils.hierarchy_lookup(
+            self, 'command_output') or LOG_OUTPUT
+        if self.command_output not in (LOG_OUTPUT, FILE_OUTPUT):
+            raise RuntimeError('command_output of %s must be %s or %s, got '
+                               '%s' % (self.framework.name, LOG_OUTPUT,
+                                       FILE_OUTPUT, self.command_output))
+        self.output_options = {}
+        if self.command_output == FILE_OUTPUT:
+            rotate_size = self.lookup_number('output_rotate_size', 'MB')
+            self.output_options = {
+                'compression': Utils.hierarchy_lookup(self,
+                                                      'output_compression'),
+                'rotate_size': int(rotate_size * MB) if rotate_size else None,
+                'rotate_count': int(Utils.hierarchy_lookup(
+                    self, 'output_rotate_count') or 5),
+            }
+
+        run_id = getattr(self.options, 'run_id', None)
+        self.unit_name = RunJournal.unit_name(self.framework.name, self.target)
+        self.journal = RunJournal(run_id) if run_id else None
 
         auth_url = self.environment.OS_AUTH_URL + \
             self.environment.OS_API_VERSION
 
         client_label = self.framework.name
-
-        openstack_creds = {
-            'auth_url':
-            auth_url,
-            'user_id':
-            getattr(self.options, 'user_id', None),
-            'username':
-            getattr(self.options, 'username', None),
-            'password':
-            getattr(self.options, 'password', None),
-            'user_domain_id':
-            getattr(self.options, 'user_domain_id', None),
-            'user_domain_name':
-            getattr(self.options, 'user_domain_name', None),
-            'project_id':
-            getattr(self.options, 'project_id', None),
-            'project_name':
-            getattr(self.options, 'project_name', None),
-            'project_domain_id':
-            getattr(self.options, 'project_domain_id', None),
-            'project_domain_name':
-            getattr(self.options, 'project_domain_name', None)
-        }
-
-        self.image = ImageManager(client_label, **openstack_creds)
-        self.flavor = FlavorManager(client_label, **openstack_creds)
+        if self.target:
+            client_label += '@' + self.target
+
+        # credentials may be set per target in the Environment section
+        openstack_creds = {'auth_url': auth_url}
+        for key in ('user_id', 'username', 'password', 'user_domain_id',
+                    'user_domain_name', 'project_id', 'project_name',
+                    'project_domain_id', 'project_domain_name'):
+            openstack_creds[key] = Utils.hierarchy_lookup(self, key)
+
+        # both clients, and every framework with the same credentials,
+        # authenticate once through the same session
+        auth_session = SessionCache.session(**openstack_creds)
+
+        # the cloud project the images and flavors of the framework are in
+        self.project = self.project_key(openstack_creds)
+
+        # images and flavors are cached for resource_cache_ttl seconds,
+        # 0 disables the cache
+        resource_cache = None
+        resource_cache_ttl = self.lookup_seconds('resource_cache_ttl')
+        if resource_cache_ttl:
+            resource_cache = ResourceCache(self.project, resource_cache_ttl,
+                                           run_id)
+        # the whole catalogs are only listed into the cache up front when
+        # resource_prefetch asks for it, images are otherwise looked up
+        # by name
+        self.resource_prefetch = resource_cache is not None and str(
+            Utils.hierarchy_lookup(self, 'resource_prefetch')).lower() == \
+            'true'
+
+        # built images are kept for later runs, image_cache_size is the
+        # size of the cache in GB, 0 disables it
+        self.image_cache = None
+        image_cache_size = self.lookup_number('image_cache_size', 'GB')
+        if image_cache_size:
+            self.image_cache = ImageCache(int(image_cache_size * GB))
+
+        self.image = ImageManager(client_label, auth_session,
+                                  resource_cache, **openstack_creds)
+        self.flavor = FlavorManager(client_label, auth_session,
+                                    resource_cache, **openstack_creds)
+
+        # images may be uploaded once into an image home project, in the
+        # same domain, and shared from there with the project of each target
+        self.image_home = None
+        self.image_home_project = None
+        home_creds = dict(openstack_creds)
+        for key in ('project_id', 'project_name'):
+            home_creds[key] = Utils.hierarchy_lookup(self,
+                                                     'image_home_' + key)
+        if home_creds['project_id'] or home_creds['project_name']:
+            self.image_sharing = \
+                Utils.hierarchy_lookup(self, 'image_sharing') or MEMBERSHIP
+            if self.image_sharing not in SHARING:
+                raise RuntimeError('image_sharing of %s must be one of %s, '
+                                   'got %s' % (self.framework.name,
+                                               ', '.join(SHARING),
+                                               self.image_sharing))
+
+            # a target that is the image home uploads its images directly
+            if self.project_key(home_creds) != self.project:
+                self.image_home_project = self.project_key(home_creds)
+                home_cache = None
+                if resource_cache_ttl:
+                    home_cache = ResourceCache(self.image_home_project,
+                                               resource_cache_ttl, run_id)
+                self.image_home = ImageManager(
+                    client_label + ' image home',
+                    SessionCache.session(**home_creds), home_cache,
+                    **home_creds)
+
+    @staticmethod
+    def project_key(openstack_creds):
+        """tell the cloud projects of openstack_creds apart"""
+        return '{}/{}'.format(openstack_creds['auth_url'], '/'.join(
+            str(openstack_creds[key]) for key in (
+                'project_id', 'project_name', 'project_domain_id',
+                'project_domain_name')))
 
     def setup(self):
-        self.export_environment()
+        self.prefetch_resources()
 
-    def export_environment(self):
-        """setup environment variables
+    def prefetch_resources(self):
+        """list the images and flavors of the cloud once for the run
 
-        this method sets environment variables (all uppsercase) from the
-        Envronment section of input yaml as python environment variables
+        the frameworks of the run then look them up in the cache, a cloud
+        that cannot be listed is asked again for each lookup. Nothing is
+        listed unless resource_prefetch is set
 
         """
+        if not self.resource_prefetch:
+            return
+
+        managers = [(IMAGES, self.image), (FLAVORS, self.flavor)]
+        if self.image_home is not None:
+            managers.append((IMAGES, self.image_home))
+        for kind, manager in managers:
+            try:
+                manager.prefetch()
+            except Exception as ex:
+                LOG.warning('Could not prefetch the %s of %s: %s', kind,
+                            self.unit_name, ex)
+
+    def cleanup(self):
+        """release what the framework created when its run is cancelled
+
+        this method is a hook, the commands of the framework have already
+        been stopped when it is called. Framework executors that create
+        resources outside of their commands should override it.
+
+        """
+        LOG.info('Cleaning up %s', self.unit_name)
+
+    def lookup_seconds(self, prop):
+        return self.lookup_number(prop, 'seconds')
+
+    def lookup_number(self, prop, unit):
+        value = Utils.hierarchy_lookup(self, prop)
+        if not value:
+            return None
+        try:
+            return float(value) or None
+        except ValueError:
+            raise RuntimeError('%s of %s must be a number of %s, got %s'
+                               % (prop, self.framework.name, unit, value))
+
+    def build_environ(self):
+        """return the environment variables of the framework's commands
+
+        the variables of this process, with the upper case ones of the
+        Environment section of input yaml, the environment_overrides of
+        the framework and its openstack credentials on top. Nothing is
+        written to os.environ, frameworks running side by side in one
+        process each pass their own variables to their commands
+
+        """
+        environ = dict(os.environ)
         for attr, value in self.environment.__dict__.items():
             if attr.isupper():
-                os.environ[attr] = value
+                environ[attr] = value
 
         # set environment_overrides present in input.yaml
         attr = getattr(self.framework, 'environment_overrides', None)
         if attr is not None:
             for key, value in attr.items():
                 if key.isupper():
-                    os.environ[key] = value
+                    environ[key] = value
+
+        environ.update(Utils.openrc_environ(self))
+        return types.MappingProxyType(environ)
+
+    def provision(self):
+        """ready the images and flavors the framework needs
+
+        this method is a stub, framework executors that need cloud
+        resources should override it with their ensure_image and
+        ensure_flavor calls. It is called ahead of the framework's
+        execution by the run, then again by setup, where it finds the
+        resources ready
+
+        """
+
+    def ensure_image(self, image_name, image_path=None):
+        """create and upload image_name unless glance has it
+
+        the frameworks of a run that miss the same image wait for the one
+        creating it, a failed creation fails all of them
+
+        """
+        home = self.image_home
+        if home is not None and home.project_id == self.image.project_id:
+            # the image home named differently, sharing the image with it
+            # would wait for the build lock the target already holds
+            home = None
+
+        def build():
+            build_path = self.build_image(image_name, image_path)
+            upload_path, disk_format = self.optimize_image(image_name,
+                                                           build_path)
+            (home or self.image).upload_image(image_name, disk_format,
+                                              'bare', upload_path)
+
+        def build_here():
+            # the projects of every target build into the same directory of
+            # this host, one at a time, and the image is not rebuilt under
+            # an upload. A later build finds it in the image cache
+            build_dir = image_path or os.path.join(CONF.DEFAULT.files_dir,
+                                                   "images")
+            SingleFlight(BUILDS, os.path.abspath(build_dir)).run(
+                lambda: False, build)
+
+        if home is None:
+            return self.single_flight(IMAGES, image_name, self.image,
+                                      self.image.check_image, build_here)
+
+        def share():
+            # the image is built once into the image home, whichever
+            # project needs it first
+            self.single_flight(IMAGES, image_name, home, home.check_image,
+                               build_here, self.image_home_project)
+            image_id = home.share_image(image_name, self.image.project_id,
+                                        self.image_sharing)
+            if self.image_sharing == MEMBERSHIP:
+                self.image.accept_image(image_name, image_id)
+
+        check = functools.partial(self.image.check_image,
+                                  owner=home.project_id)
+        return self.single_flight(IMAGES, image_name, self.image, check,
+                                  share)
+
+    def ensure_flavor(self, flavor_name, **spec):
+        """return the name of the flavor to use for flavor_name
+
+        flavor_spec of the framework overrides spec. Unless nova has
+        flavor_name, a flavor that can stand in for it is reused as
+        flavor_reuse says, otherwise flavor_name is created with spec, see
+        ensure_image
+
+        """
+        spec = dict(spec, **(Utils.hierarchy_lookup(self, 'flavor_spec') or
+                             {}))
+        extra_specs = spec.pop('extra_specs', None)
+        unknown = set(spec) - set(SPEC_KEYS)
+        if unknown:
+            raise RuntimeError('flavor_spec of %s takes %s and extra_specs, '
+                               'got %s' % (self.framework.name,
+                                           ', '.join(SPEC_KEYS),
+                                           ', '.join(sorted(unknown))))
+        reuse = Utils.hierarchy_lookup(self, 'flavor_reuse') or NO_REUSE
+        if reuse not in REUSE:
+            raise RuntimeError('flavor_reuse of %s must be one of %s, got %s'
+                               % (self.framework.name, ', '.join(REUSE),
+                                  reuse))
+
+        if self.flavor.check_flavor(flavor_name):
+            return flavor_name
+
+        match = self.flavor.match_flavor(spec, extra_specs, reuse)
+        if match is not None:
+            LOG.info('Using flavor <%s> in place of <%s> for %s', match,
+                     flavor_name, self.unit_name)
+            return match
+
+        def build():
+            self.flavor.create_flavor(name=flavor_name,
+                                      extra_specs=extra_specs, **spec)
+
+        self.single_flight(FLAVORS, flavor_name, self.flavor,
+                           self.flavor.check_flavor, build)
+        return flavor_name
+
+    def single_flight(self, kind, name, manager, check, build,
+                      project=None):
+        """build name with build() unless check(name) finds it
+
+        project is the cloud project name is built in, the one of the
+        framework by default
+
+        """
+        def done():
+            # another worker may have created it since it was looked up
+            manager.forget()
+            return check(name)
+
+        if check(name):
+            return False
+
+        scope = '{}/{}'.format(project or self.project, kind)
+        return SingleFlight(scope, name).run(done, build)
+
+    def build_image(self, image_name, image_path=None):
+        """create image_name unless the same build is in the image cache
+
+        returns the directory holding the image, image_path when it was
+        created without the cache
+
+        """
+        recipe = self.image_recipe()
+        if self.image_cache is None or recipe is None:
+            self.create_image()
+            return image_path
+
+        key = ImageCache.key(*recipe)
+        build_dir = self.image_cache.lookup(key)
+        if build_dir is None:
+            self.create_image()
+            if image_path is None:
+                image_path = os.path.join(CONF.DEFAULT.files_dir, "images")
+            build_dir = self.image_cache.store(key, image_name, image_path)
+
+        return build_dir
+
+    def optimize_image(self, image_name, image_path=None):
+        """rewrite the image as image_optimization of the framework says
+
+        returns the directory holding the image to upload and its disk
+        format
+
+        """
+        optimizer = ImageOptimizer(
+            Utils.hierarchy_lookup(self, 'image_optimization'))
+        if image_path is None and optimizer.enabled:
+            image_path = os.path.join(CONF.DEFAULT.files_dir, "images")
+        return optimizer.optimize(image_name, image_path, self._exec_cmd)
+
+    def image_recipe(self):
+        """return what the image of the framework is built from
+
+        this method is a stub, framework executors return a description
+        of their build and the scripts it runs, (recipe, files), for their
+        images to be cached. None builds the image every time
+
+        """
+        return None
+
+    def framework_revision(self):
+        """git revision of the framework's source, None if unknown"""
+        source = os.path.join(CONF.DEFAULT.files_dir, "frameworks",
+                              self.framework.name)
+        try:
+            return subprocess.check_output(
+                ['git', '-C', source, 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
 
     def create_image(self):
         """create image needed by framework
@@ -92,33 +466,254 @@ class BaseExecutor():
         """
         raise NotImplementedError()
 
-    def _exec_cmd(self, command):
-        LOG.info('Executing {%s}:\n', command)
+    def command_timeouts(self, command, timeout=None, stall_timeout=None):
+        """return the wall-clock and stall timeout of command
 
-        command_template = '/bin/bash -c ' \
-                           '"source {}venvs/{}/bin/activate' \
-                           ' && {}"'
+        timeout and stall_timeout override the ones of the framework for
+        this command, the wall-clock timeout never runs past the deadline
+        of the framework
+
+        """
+        timeout = timeout or self.command_timeout
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandTimeout(
+                    'command <%s> was not started, %s ran for more than %s '
+                    'seconds' % (command, self.unit_name, self.timeout))
+            timeout = min(timeout or remaining, remaining)
+
+        return timeout, stall_timeout or self.stall_timeout
+
+    def output_path(self, shard=None):
+        """the file the output of the commands of shard is written to,
+        without the extension of its compression
+        """
+        path = os.path.join(self.outputs_dir,
+                            '%s-output.log' % self.framework.name)
+        if shard is not None:
+            path = self.shard_path(path, shard)
+        return path
+
+    def _exec_cmd(self, command, timeout=None, stall_timeout=None,
+                  sinks=None, shard=None, environ=None):
+        """run command in the virtualenv of the framework
+
+        command is a list of arguments, its program is run directly, or a
+        string run by bash, for shell syntax like &&. environ holds
+        variables added for this command only. Its output is logged, or
+        written to the output file of shard, and written to sinks, if any,
+        see OutputPump. Returns the CommandResult
+
+        """
+        venv = VirtualEnv.get(os.path.join(CONF.DEFAULT.files_dir, 'venvs',
+                                           self.framework.name))
+        environ = dict(venv.environ(self.environ), **(environ or {}))
+        if isinstance(command, str):
+            execute = ['/bin/bash', '-c', command]
+        else:
+            execute = [venv.resolve(command[0], environ['PATH'])] + \
+                list(command[1:])
+            command = ' '.join(shlex.quote(arg) for arg in command)
+
+        ProcessGroups.check()
+        LOG.info('Executing {%s}:\n', command)
 
-        execute = shlex.split(
-            command_template.format(CONF.DEFAULT.files_dir,
-                                    self.framework.name, command))
+        timeout, stall_timeout = self.command_timeouts(command, timeout,
+                                                       stall_timeout)
 
+        output_file = None
+        if self.command_output == FILE_OUTPUT:
+            output_file = OutputFile(self.output_path(shard),
+                                     **self.output_options)
+            sinks = [output_file] + list(sinks or [])
+        else:
+            sinks = [LogSink()] + list(sinks or [])
+        tail = None
+        if self.failure_tail_size:
+            tail = TailSink(int(self.failure_tail_size * 1024))
+            sinks.append(tail)
+
+        # the command leads its own process group so the watchdog, or a
+        # cancelled run, can stop everything it started
         popen = subprocess.Popen(execute,
                                  stdout=subprocess.PIPE,
-                                 stderr=subprocess.STDOUT,
-                                 universal_newlines=True)
+                                 stderr=subprocess.PIPE,
+                                 start_new_session=True,
+                                 env=environ)
+        ProcessGroups.add(popen)
+
+        watchdog = Watchdog(popen, timeout, stall_timeout)
+        watchdog.start()
+        try:
+            result = OutputPump(popen, sinks, watchdog.feed).run(command)
+        finally:
+            watchdog.stop()
+            ProcessGroups.remove(popen)
+
+        return_code = result.returncode
+        if output_file is not None:
+            LOG.info('Output of {%s} written to %s: %s', command,
+                     output_file.path, result)
+        else:
+            LOG.debug('%s', result)
+
+        # a command stopped because the run was cancelled did not fail
+        ProcessGroups.check()
+
+        error = None
+        if watchdog.reason is not None:
+            error = CommandTimeout(watchdog.describe(command))
+        elif return_code != 0:
+            error = RuntimeError('command <%s> failed with return code %s'
+                                 % (command, return_code))
+        if error is not None:
+            # what the command wrote last is kept with the error, which
+            # is pickled back to the run with its attributes
+            error.output_tail = tail.text() if tail is not None else None
+            raise error
+
+        return result
+
+    def execute_commands(self, commands):
+        """execute commands concurrently, each in its own subprocess
+
+        the position of a command is its shard index, shards that completed
+        in the run being resumed are not executed again
+
+        """
+        def execute_shard(index):
+            # a single command writes to the output file of the framework
+            shard = index if len(commands) > 1 else None
+            if self.journal is None:
+                return self._exec_cmd(commands[index], shard=shard)
+
+            if self.journal.completed(self.unit_name, index):
+                LOG.info('Skipping shard %s of %s, it completed before',
+                         index, self.unit_name)
+                return None
+
+            self.journal.set_state(self.unit_name, RUNNING, index)
+            try:
+                output = self._exec_cmd(commands[index], shard=shard)
+            except CommandTimeout:
+                self.journal.set_state(self.unit_name, TIMED_OUT, index)
+                raise
+            except Cancelled:
+                self.journal.set_state(self.unit_name, CANCELLED, index)
+                raise
+            except Exception:
+                self.journal.set_state(self.unit_name, FAILED, index)
+                raise
+            self.journal.set_state(self.unit_name, COMPLETED, index)
+            return output
+
+        if len(commands) == 1:
+            return [execute_shard(0)]
+
+        pool = ThreadPool(len(commands))
+        try:
+            return pool.map(execute_shard, range(len(commands)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def shard_tests(self, test_list):
+        """split test_list into at most self.shards groups
+
+        groups are balanced by the durations recorded in previous runs, a
+        resumed run reuses the groups the run was started with
+
+        """
+        if self.journal is not None:
+            groups = self.journal.shard_groups(self.unit_name)
+            if groups:
+                return groups
+
+        count = max(1, min(self.shards, len(test_list)))
+        groups = self.history.pack(test_list, count)
+        if self.journal is not None and len(groups) > 1:
+            self.journal.set_shard_groups(self.unit_name, groups)
 
-        for stdout_line in iter(popen.stdout.readline, ""):
-            LOG.info(stdout_line.rstrip(), extra={'plainOutput': True})
+        return groups
 
-        output = popen.communicate()
-        return_code = popen.returncode
+    def parse_durations(self):
+        """return the duration in seconds of every test that was run
 
-        if return_code != 0:
-            raise RuntimeError('command <%s> failed with return code %s' %
-                               (command, return_code))
+        this method is a stub, it should be implemented in the framework
+        executor class to read the durations from the framework's output
 
-        return output
+        """
+        return {}
+
+    def match_test(self, name):
+        """map a test name reported by a framework to a collected test"""
+        for test in self.collected_tests_list:
+            if test == name or test.endswith('/' + name.lstrip('/')):
+                return test
+
+        for test in self.collected_tests_list:
+            if os.path.splitext(os.path.basename(test))[0] == name:
+                return test
+
+        return None
+
+    def record_durations(self):
+        durations = {}
+        try:
+            reported = self.parse_durations()
+        except Exception as ex:
+            LOG.warning('Could not read test durations of %s: %s',
+                        self.framework.name, ex)
+            return
+
+        for name, duration in reported.items():
+            test = self.match_test(name)
+            if test is not None:
+                durations[test] = duration
+
+        self.history.record(durations)
+
+    @staticmethod
+    def shard_path(path, index):
+        root, ext = os.path.splitext(path)
+        return '{}-{}{}'.format(root, index, ext)
+
+    def merge_outputs(self, shard_paths, output_path):
+        """concatenate the outputs of every shard into output_path"""
+        with open(output_path, 'wb') as output_file:
+            for shard_path in shard_paths:
+                if os.path.exists(shard_path):
+                    with open(shard_path, 'rb') as shard_file:
+                        output_file.write(shard_file.read())
+
+    def merge_json_outputs(self, shard_paths, output_path):
+        """merge the json documents written by every shard into output_path
+
+        objects are merged key by key and lists are concatenated, for any
+        other value the one from the last shard wins
+
+        """
+        def merge(left, right):
+            if isinstance(left, dict) and isinstance(right, dict):
+                for key, value in right.items():
+                    left[key] = merge(left[key],
+                                      value) if key in left else value
+                return left
+            if isinstance(left, list) and isinstance(right, list):
+                return left + right
+            return right
+
+        merged = None
+        for shard_path in shard_paths:
+            if os.path.exists(shard_path):
+                with open(shard_path, 'r') as shard_file:
+                    document = json.load(shard_file)
+                merged = document if merged is None else merge(
+                    merged, document)
+
+        with open(output_path, 'w') as output_file:
+            json.dump(merged, output_file, indent=2)
 
     def walk_directory(self, directory):
         test_list = []
@@ -186,4 +781,5 @@ class BaseExecutor():
                                ' or directories that do not exist or have'
                                ' invalid extensions:\n%s' % bad_test_list)
 
-        return test_list
+        # start the slowest tests first so they do not form a long tail
+        return self.history.order(test_list)
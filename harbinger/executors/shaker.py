@@ -3,7 +3,9 @@ ShakerExecutor class:
     - shaker framework execution class
 """
 import configparser
+import json
 import os
+import platform
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -29,16 +31,64 @@ class ShakerExecutor(BaseExecutor):
 
     def setup(self):
         super(ShakerExecutor, self).setup()
+        self.provision()
 
-        image_name = Utils.hierarchy_lookup(self, 'image')
-        image_exists = self.image.check_image(image_name)
-
-        if image_exists is False:
-            self.create_image()
-            self.image.upload_image(image_name, 'qcow2', 'bare')
+        self.run_tests()
+        self.record_durations()
 
-        self.create_cfg_file()
-        self._exec_cmd("shaker --config-file " + self.cfg_full_path)
+    def provision(self):
+        image_name = Utils.hierarchy_lookup(self, 'image')
+        self.ensure_image(image_name)
+
+    def run_tests(self):
+        groups = self.shard_tests(self.collected_tests_list)
+        if len(groups) == 1:
+            self.create_cfg_file()
+            self._exec_cmd(["shaker", "--config-file", self.cfg_full_path])
+            return
+
+        LOG.info('Running %s shaker shards', len(groups))
+        commands = []
+        outputs = []
+        for index, group in enumerate(groups):
+            cfg_full_path = self.shard_path(self.cfg_full_path, index)
+            output = self.shard_path(self.results_json_path, index)
+            self.create_cfg_file(cfg_full_path,
+                                 self.format_collected_tests(group), output,
+                                 index)
+            commands.append(["shaker", "--config-file", cfg_full_path])
+            outputs.append(output)
+
+        self.execute_commands(commands)
+        self.merge_json_outputs(outputs, self.results_json_path)
+
+    def parse_durations(self):
+        """read scenario durations from the start and finish of its records"""
+        if not os.path.exists(self.results_json_path):
+            return {}
+
+        with open(self.results_json_path, 'r') as results_file:
+            results = json.load(results_file) or {}
+
+        spans = {}
+        for record in (results.get('records') or {}).values():
+            scenario = record.get('scenario')
+            if scenario is None or 'start' not in record or \
+                    'finish' not in record:
+                continue
+            start, finish = spans.get(scenario,
+                                      (record['start'], record['finish']))
+            spans[scenario] = (min(start, record['start']),
+                               max(finish, record['finish']))
+
+        durations = {}
+        scenarios = results.get('scenarios') or {}
+        for scenario, (start, finish) in spans.items():
+            file_name = (scenarios.get(scenario) or {}).get(
+                'file_name', scenario)
+            durations[file_name] = finish - start
+
+        return durations
 
     def add_extras_options(self):
         for key, value in self.framework.extras.items():
@@ -51,7 +101,16 @@ class ShakerExecutor(BaseExecutor):
 
         return collected_tests_string
 
-    def create_cfg_file(self):
+    def shard_endpoint(self, server_endpoint, index):
+        """offset the server port so concurrent shards do not collide"""
+        host, _, port = server_endpoint.rpartition(':')
+        return '{}:{}'.format(host, int(port) + index)
+
+    def create_cfg_file(self,
+                        cfg_full_path=None,
+                        scenario=None,
+                        output=None,
+                        shard_index=0):
         if hasattr(self.framework, 'extras'):
             self.add_extras_options()
 
@@ -65,9 +124,12 @@ class ShakerExecutor(BaseExecutor):
         project_domain_id = Utils.hierarchy_lookup(self, 'project_domain_id')
         flavor_name = Utils.hierarchy_lookup(self, 'flavor_name')
         image_name = Utils.hierarchy_lookup(self, 'image')
-        output = self.results_json_path
-        scenario = self.formated_tests
+        output = output or self.results_json_path
+        scenario = scenario or self.formated_tests
         server_endpoint = Utils.hierarchy_lookup(self, 'server_endpoint')
+        if shard_index and server_endpoint:
+            server_endpoint = self.shard_endpoint(server_endpoint,
+                                                  shard_index)
         external_net = Utils.hierarchy_lookup(self, 'external_network')
 
         user_domain = user_domain_name or user_domain_id
@@ -85,9 +147,17 @@ class ShakerExecutor(BaseExecutor):
         self.config.set("DEFAULT", "server_endpoint", server_endpoint)
         self.config.set("DEFAULT", "external_net", external_net)
 
-        with open(self.cfg_full_path, 'w') as configfile:
+        with open(cfg_full_path or self.cfg_full_path, 'w') as configfile:
             self.config.write(configfile)
 
     def create_image(self):
-        Utils.source_openrc(self)
-        self._exec_cmd("shaker-image-builder")
+        self._exec_cmd(["shaker-image-builder"])
+
+    def image_recipe(self):
+        revision = self.framework_revision()
+        if revision is None:
+            return None
+
+        return ({'framework': self.framework.name, 'revision': revision,
+                 'builder': 'shaker-image-builder',
+                 'arch': platform.machine()}, [])
@@ -4,6 +4,7 @@ YardsstickExecutor class:
 """
 import collections
 import configparser
+import json
 import os
 import tempfile
 
@@ -19,6 +20,11 @@ CONF = cfg.CONF
 
 
 class YardstickExecutor(BaseExecutor):
+    IMAGE_ARCH = 'amd64'
+    # the flavor yardstick-flavor is created with, flavor_spec in the
+    # input yaml overrides it
+    FLAVOR_SPEC = {'ram': 512, 'vcpus': 1, 'disk': 3, 'swap': 100}
+
     def __init__(self, framework, environment, options):
         super(YardstickExecutor, self).__init__(framework, environment,
                                                 options)
@@ -36,45 +42,98 @@ class YardstickExecutor(BaseExecutor):
         self.test_suite_name = "yardstick-suite.yaml"
 
         self.config = configparser.RawConfigParser()
+        # the flavor the test cases run with, set by setup
+        self.flavor_name = None
 
     def setup(self):
         super(YardstickExecutor, self).setup()
+        self.provision()
+
+        self.run_tests()
+        self.record_durations()
 
+    def provision(self):
         # check flavor
         flavor_name = Utils.hierarchy_lookup(self, 'flavor_name')
-        flavor_exists = self.flavor.check_flavor(flavor_name)
-        if flavor_exists is False:
-            self.flavor.create_flavor(name=flavor_name,
-                                      ram='512',
-                                      vcpus='1',
-                                      disk='3',
-                                      swap='100')
+        self.flavor_name = self.ensure_flavor(flavor_name,
+                                              **self.FLAVOR_SPEC)
 
         # check image
         image_name = Utils.hierarchy_lookup(self, 'image')
-        image_exists = self.image.check_image(image_name)
-
-        if image_exists is False:
-            self.create_image()
-            temp_dir = tempfile.gettempdir()
-            self.image.upload_image(image_name, 'qcow2', 'bare',
-                                    temp_dir + '/workspace/yardstick/')
-
-        self.create_yardstick_conf()
-
-        self.create_test_suite(self.formated_tests)
-
-        # set additional environment variables necessary for openstack api
-        Utils.source_openrc(self)
-
-        run_command = "yardstick --config-file " + str(self.conf_full_path)
-        run_command += " task start"
-        run_command += " --output-file " + str(self.outputs_full_path)
-        run_command += " --suite " + \
-                       str(os.path.join(self.inputs_dir,
-                                        self.test_suite_name))
-
-        self._exec_cmd(run_command)
+        temp_dir = tempfile.gettempdir()
+        self.ensure_image(image_name, temp_dir + '/workspace/yardstick/')
+
+    def run_tests(self):
+        groups = self.shard_tests(self.collected_tests_list)
+        if len(groups) == 1:
+            self.create_yardstick_conf()
+
+            self.create_test_suite(self.formated_tests)
+
+            self._exec_cmd(
+                self.run_command(self.conf_full_path, self.outputs_full_path,
+                                 self.test_suite_name))
+            return
+
+        LOG.info('Running %s yardstick shards', len(groups))
+        dispatch_file = os.path.join(
+            self.outputs_dir,
+            Utils.hierarchy_lookup(self, "dispatcher_file_name"))
+        commands = []
+        outputs = []
+        dispatch_files = []
+        for index, group in enumerate(groups):
+            conf_full_path = self.shard_path(self.conf_full_path, index)
+            output = self.shard_path(self.outputs_full_path, index)
+            suite_name = self.shard_path(self.test_suite_name, index)
+
+            # every shard gets its own conf so the dispatcher section can
+            # point at a separate file
+            self.config = configparser.RawConfigParser()
+            self.create_yardstick_conf(
+                conf_full_path, self.shard_path(dispatch_file, index))
+            self.create_test_suite(self.format_collected_tests(group),
+                                   suite_name)
+
+            commands.append(
+                self.run_command(conf_full_path, output, suite_name))
+            outputs.append(output)
+            dispatch_files.append(self.shard_path(dispatch_file, index))
+
+        self.execute_commands(commands)
+        self.merge_json_outputs(outputs, self.outputs_full_path)
+        self.merge_outputs(dispatch_files, dispatch_file)
+
+    def run_command(self, conf_full_path, output_path, suite_name):
+        return ["yardstick", "--config-file", str(conf_full_path),
+                "task", "start",
+                "--output-file", str(output_path),
+                "--suite", str(os.path.join(self.inputs_dir, suite_name))]
+
+    def parse_durations(self):
+        """read test case durations from the timestamps of their samples"""
+        if not os.path.exists(self.outputs_full_path):
+            return {}
+
+        with open(self.outputs_full_path, 'r') as output_file:
+            output = json.load(output_file) or {}
+
+        results = output.get('result') or {}
+        if isinstance(results, dict):
+            results = [results]
+
+        durations = {}
+        for result in results:
+            for name, testcase in (result.get('testcases') or {}).items():
+                timestamps = [
+                    sample['timestamp']
+                    for sample in testcase.get('tc_data') or []
+                    if 'timestamp' in sample
+                ]
+                if timestamps:
+                    durations[name] = max(timestamps) - min(timestamps)
+
+        return durations
 
     def format_collected_tests(self, collected_tests_list):
         suite = []
@@ -84,10 +143,11 @@ class YardstickExecutor(BaseExecutor):
 
         return suite
 
-    def create_test_suite(self, test_list):
+    def create_test_suite(self, test_list, suite_name=None):
+        suite_name = suite_name or self.test_suite_name
         test_suite_yaml = collections.OrderedDict()
         test_suite_yaml["schema"] = Utils.hierarchy_lookup(self, 'schema')
-        test_suite_yaml["name"] = self.test_suite_name
+        test_suite_yaml["name"] = suite_name
 
         # Check if test_cases_dir is necessary
 
@@ -97,11 +157,20 @@ class YardstickExecutor(BaseExecutor):
         else:
             test_suite_yaml["test_cases_dir"] = '/'
 
+        # a flavor reused in place of flavor_name is handed to the test
+        # cases as their flavor task argument
+        if self.flavor_name is not None and \
+                self.flavor_name != Utils.hierarchy_lookup(self,
+                                                           'flavor_name'):
+            task_args = {'default': json.dumps({'flavor': self.flavor_name})}
+            test_list = [dict(test, task_args=task_args)
+                         for test in test_list]
+
         test_suite_yaml["test_cases"] = test_list
 
         file_contents = yaml.dump(test_suite_yaml, default_flow_style=False)
 
-        with open(os.path.join(self.inputs_dir, self.test_suite_name),
+        with open(os.path.join(self.inputs_dir, suite_name),
                   'w') as yaml_file:
             yaml_file.write(file_contents)
 
@@ -109,16 +178,17 @@ class YardstickExecutor(BaseExecutor):
         for key, value in self.framework.extras.items():
             self.config.set("DEFAULT", str(key), value)
 
-    def create_yardstick_conf(self):
-        with open(self.conf_full_path, "wb") as configfile:
+    def create_yardstick_conf(self, conf_full_path=None, dispatch_file=None):
+        with open(conf_full_path or self.conf_full_path, "w") as configfile:
             if hasattr(self.framework, 'extras'):
                 self.add_extras_options()
 
             debug = Utils.hierarchy_lookup(self, "debug")
             dispatcher = Utils.hierarchy_lookup(self, "dispatcher")
-            dispatch_file = Utils.hierarchy_lookup(self,
-                                                   "dispatcher_file_name")
-            dispatch_file = os.path.join(self.outputs_dir, dispatch_file)
+            if dispatch_file is None:
+                dispatch_file = Utils.hierarchy_lookup(
+                    self, "dispatcher_file_name")
+                dispatch_file = os.path.join(self.outputs_dir, dispatch_file)
 
             self.config.set("DEFAULT", "debug", debug)
             self.config.set("DEFAULT", "dispatcher", dispatcher)
@@ -135,14 +205,22 @@ class YardstickExecutor(BaseExecutor):
         # this has to run as root, in the container root is the default user
         LOG.info('Creating Yardstick image..')
 
-        os.environ['YARD_IMG_ARCH'] = 'amd64'
-        Utils.source_openrc(self)
+        script_path = ' '.join(self.image_scripts())
+
+        self._exec_cmd('apt update && ' + script_path,
+                       environ={'YARD_IMG_ARCH': self.IMAGE_ARCH})
 
+    def image_scripts(self):
         yrdstick_path = os.path.join(CONF.DEFAULT.files_dir,
                                      "frameworks/yardstick/")
         image_modify = yrdstick_path + 'tools/yardstick-img-modify'
         cloud_modify = yrdstick_path + 'tools/ubuntu-server-cloudimg-modify.sh'
+        return [image_modify, cloud_modify]
 
-        script_path = image_modify + " " + cloud_modify
+    def image_recipe(self):
+        revision = self.framework_revision()
+        if revision is None:
+            return None
 
-        self._exec_cmd('apt update && ' + script_path)
+        return ({'framework': self.framework.name, 'revision': revision,
+                 'arch': self.IMAGE_ARCH}, self.image_scripts())
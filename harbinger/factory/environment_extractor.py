@@ -1,11 +1,15 @@
 """
 EnvironmentExtractor class:
     - extracts environment options from the yaml file and passes
-    them into the Environment class to be initialized
+    them into the Environment class to be initialized, one per
+    named target when the Environment lists targets
 """
+import collections
 
 from harbinger.factory.environment import Environment
 
+REQUIRED_KEYS = ('OS_AUTH_URL', 'OS_REGION_NAME', 'OS_API_VERSION')
+
 
 class EnvironmentExtractor():
     """Initialize environment variables provided in the yaml file"""
@@ -13,3 +17,36 @@ class EnvironmentExtractor():
         environment = Environment(yaml_file["Environment"])
 
         return environment
+
+    def parse_environments(self, yaml_file):
+        """return one Environment per target
+
+        every target inherits the values of the Environment section and
+        overrides them with its own. Without targets the Environment
+        section itself is the only target and it is left unnamed.
+
+        """
+        environment = collections.OrderedDict(yaml_file["Environment"])
+        targets = environment.pop('targets', None) or [{}]
+
+        environments = []
+        names = []
+        for target in targets:
+            values = collections.OrderedDict(environment)
+            values.update(target)
+            values['target'] = values.pop('name', None)
+            missing = [key for key in REQUIRED_KEYS if not values.get(key)]
+            if missing:
+                raise RuntimeError('Environment target %s is missing the '
+                                   'required keys:\n%s' %
+                                   (values['target'], missing))
+            names.append(values['target'])
+            environments.append(Environment(values))
+
+        duplicates = sorted(
+            set(name for name in names if names.count(name) > 1))
+        if len(targets) > 1 and (None in names or duplicates):
+            raise RuntimeError('Every Environment target needs a unique '
+                               'name:\n%s' % names)
+
+        return environments
@@ -9,27 +9,165 @@ from novaclient import client
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from harbinger.common.resource_cache import FLAVORS
+
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# how an existing flavor may stand in for the one a framework asks for:
+# one with the same spec, or the smallest one at least as large
+EXACT = 'exact'
+COMPATIBLE = 'compatible'
+NO_REUSE = 'none'
+REUSE = (EXACT, COMPATIBLE, NO_REUSE)
+# what flavors are compared on, besides their extra specs
+SPEC_KEYS = ('ram', 'vcpus', 'disk', 'swap')
+
 
 class FlavorManager():
-    def __init__(self, label, **kwargs):
-        loader = loading.get_plugin_loader('password')
-        auth = loader.load_from_options(**kwargs)
-        session2 = session.Session(auth=auth)
+    # flavors asked from nova in each request
+    PAGE_SIZE = 1000
+
+    def __init__(self, label, auth_session=None, resource_cache=None,
+                 **kwargs):
+        """create the client for label
+
+        auth_session is a keystone session to share with other clients,
+        one is created from the credentials in kwargs when it is None.
+        resource_cache is the ResourceCache of the project, if any
+
+        """
+        if auth_session is None:
+            loader = loading.get_plugin_loader('password')
+            auth = loader.load_from_options(**kwargs)
+            auth_session = session.Session(auth=auth)
 
         LOG.info('Creating Nova client for %s using keystone: %s', label,
                  kwargs.pop('auth_url'))
 
-        self.nova = client.Client(2, session=session2)
+        self.nova = client.Client(2, session=auth_session)
+        self.cache = resource_cache
+        # name -> id of every flavor, nova does not filter flavors by name
+        # so they are listed once and looked up here
+        self.snapshot = None
+        # (ram, vcpus, disk, swap) -> flavors, and id -> extra specs of
+        # the flavors compared so far, built when a flavor is matched
+        self.index = None
+        self.extra_specs = {}
+
+    def find_flavor(self, flavor_name):
+        """return the id of the flavor named flavor_name, or None"""
+        if self.cache is not None:
+            flavors = self.cache.lookup(FLAVORS)
+            if flavors is not None:
+                return flavors.get(flavor_name)
+
+        if self.snapshot is None:
+            self.snapshot = self.list_flavors()
+            if self.cache is not None:
+                self.cache.store(FLAVORS, self.snapshot)
+
+        return self.snapshot.get(flavor_name)
+
+    def list_flavors(self):
+        LOG.info('Listing every flavor in Nova')
+        flavors = {}
+        for flavor in self.iter_flavors():
+            flavors.setdefault(flavor.name, flavor.id)
+        return flavors
+
+    def iter_flavors(self):
+        marker = None
+        while True:
+            page = self.nova.flavors.list(marker=marker, limit=self.PAGE_SIZE)
+            for flavor in page:
+                yield flavor
+            if len(page) < self.PAGE_SIZE:
+                return
+            marker = page[-1].id
+
+    def index_flavors(self):
+        """group the flavors the project can use by spec"""
+        LOG.info('Indexing the flavors of Nova by spec')
+        index = {}
+        for flavor in self.iter_flavors():
+            if getattr(flavor, 'OS-FLV-DISABLED:disabled', False):
+                continue
+            spec = {key: getattr(flavor, key, 0) for key in SPEC_KEYS}
+            index.setdefault(self.spec_key(spec), []).append(flavor)
+        return index
+
+    @staticmethod
+    def spec_key(spec):
+        # nova reports no swap as ''
+        return tuple(int(spec.get(key) or 0) for key in SPEC_KEYS)
+
+    def get_extra_specs(self, flavor):
+        if flavor.id not in self.extra_specs:
+            self.extra_specs[flavor.id] = flavor.get_keys()
+        return self.extra_specs[flavor.id]
+
+    def match_flavor(self, spec, extra_specs=None, reuse=COMPATIBLE):
+        """return the name of a flavor that can stand in for spec, or None
+
+        spec gives the ram, vcpus, disk and swap of the flavor. A flavor
+        with the same spec and extra_specs is preferred, with COMPATIBLE
+        the closest one that is at least as large and has extra_specs
+        among its extra specs comes next
+
+        """
+        if reuse == NO_REUSE:
+            return None
+        if self.index is None:
+            self.index = self.index_flavors()
+
+        wanted = self.spec_key(spec)
+        extra_specs = {str(key): str(value)
+                       for key, value in (extra_specs or {}).items()}
+
+        for flavor in sorted(self.index.get(wanted, []),
+                             key=lambda flavor: flavor.name):
+            if self.get_extra_specs(flavor) == extra_specs:
+                LOG.info('Flavor <%s> has the same spec', flavor.name)
+                return flavor.name
+
+        if reuse != COMPATIBLE:
+            return None
+
+        def distance(key):
+            # the vcpus count first, then the ram, disk and swap
+            excess = [have - want for have, want in zip(key, wanted)]
+            return [excess[1], excess[0]] + excess[2:]
+
+        larger = [key for key in self.index
+                  if all(have >= want for have, want in zip(key, wanted))]
+        for key in sorted(larger, key=distance):
+            candidates = []
+            for flavor in self.index[key]:
+                flavor_specs = self.get_extra_specs(flavor)
+                if all(flavor_specs.get(name) == value
+                       for name, value in extra_specs.items()):
+                    candidates.append((len(flavor_specs), flavor.name))
+            if candidates:
+                name = min(candidates)[1]
+                LOG.info('Flavor <%s> is compatible with %s', name,
+                         dict(zip(SPEC_KEYS, wanted)))
+                return name
+
+        return None
+
+    def forget(self):
+        """drop the flavors listed before, the next lookup asks again"""
+        self.snapshot = None
+        self.index = None
+
+    def prefetch(self):
+        """load the flavors of the project into the cache, once per run"""
+        if self.cache is not None:
+            self.snapshot = self.cache.refresh(FLAVORS, self.list_flavors)
 
     def check_flavor(self, flavor_name):
-        flavor_exists = False
-        for flavor in self.nova.flavors.list():
-            if flavor.name == flavor_name:
-                flavor_exists = True
-                break
+        flavor_exists = self.find_flavor(flavor_name) is not None
 
         LOG.info('Flavor <%s> exists: %s', flavor_name, flavor_exists)
         return flavor_exists
@@ -44,16 +182,24 @@ class FlavorManager():
                       swap=0,
                       rxtx_factor=1.0,
                       is_public=True,
-                      description=None):
+                      description=None,
+                      extra_specs=None):
         LOG.info('Creating flavor %s', name)
 
-        self.nova.flavors.create(name,
-                                 ram,
-                                 vcpus,
-                                 disk,
-                                 flavorid=flavorid,
-                                 ephemeral=ephemeral,
-                                 swap=swap,
-                                 rxtx_factor=rxtx_factor,
-                                 is_public=is_public,
-                                 description=description)
+        flavor = self.nova.flavors.create(name,
+                                          ram,
+                                          vcpus,
+                                          disk,
+                                          flavorid=flavorid,
+                                          ephemeral=ephemeral,
+                                          swap=swap,
+                                          rxtx_factor=rxtx_factor,
+                                          is_public=is_public,
+                                          description=description)
+        if extra_specs:
+            flavor.set_keys(extra_specs)
+        self.index = None
+        if self.snapshot is not None:
+            self.snapshot[name] = flavor.id
+        if self.cache is not None:
+            self.cache.invalidate(FLAVORS)
@@ -3,40 +3,193 @@ Images class:
     - handle image management for the supported data plane testing framworks
 """
 import os
+import time
 
 from glanceclient import Client
+from glanceclient import exc
 from keystoneauth1 import loading
 from keystoneauth1 import session
 
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from harbinger.common.resource_cache import IMAGES
+from harbinger.common.utils import Utils
+from harbinger.images.image_stream import ImageStream
+
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# errors an upload is retried after
+TRANSIENT_ERRORS = (exc.CommunicationError, exc.HTTPBadGateway,
+                    exc.HTTPInternalServerError, exc.HTTPServiceUnavailable,
+                    ConnectionError)
+
+# how images of an image home project are shared with other projects
+MEMBERSHIP = 'membership'
+COMMUNITY = 'community'
+SHARING = (MEMBERSHIP, COMMUNITY)
+
 
 class ImageManager():
-    def __init__(self, label, **kwargs):
-        loader = loading.get_plugin_loader('password')
+    # attempts at uploading an image, seconds before the first retry,
+    # doubled before each of the next ones
+    UPLOAD_RETRIES = 5
+    UPLOAD_BACKOFF = 2
+    # seconds given to glance to import an image, and between two checks
+    IMPORT_TIMEOUT = 3600
+    IMPORT_POLL = 5
 
-        auth = loader.load_from_options(**kwargs)
-        session2 = session.Session(auth=auth)
+    def __init__(self, label, auth_session=None, resource_cache=None,
+                 **kwargs):
+        """create the client for label
+
+        auth_session is a keystone session to share with other clients,
+        one is created from the credentials in kwargs when it is None.
+        resource_cache is the ResourceCache of the project, if any
+
+        """
+        if auth_session is None:
+            loader = loading.get_plugin_loader('password')
+            auth = loader.load_from_options(**kwargs)
+            auth_session = session.Session(auth=auth)
 
         LOG.info('Creating Glance client for %s using keystone: %s', label,
                  kwargs.pop('auth_url'))
 
-        self.glance = Client('2', session=session2)
+        self.session = auth_session
+        self.glance = Client('2', session=auth_session)
+        self.cache = resource_cache
+        # name -> id of every image, only listed when glance does not
+        # filter images by name or the run prefetches them
+        self.snapshot = None
+
+    def find_image(self, image_name):
+        """return the id of the image named image_name, or None
+
+        the images cached for the project answer first, otherwise glance
+        is asked for that name only, one request whatever the size of the
+        catalog. When it does not filter by name the whole catalog is
+        listed once and later lookups are answered from it
+
+        """
+        if self.cache is not None:
+            images = self.cache.lookup(IMAGES)
+            if images is not None:
+                return images.get(image_name)
+
+        if self.snapshot is None:
+            try:
+                images = list(self.glance.images.list(
+                    filters={'name': image_name}, limit=1))
+            except exc.HTTPBadRequest as ex:
+                LOG.warning('Glance did not filter images by name: %s', ex)
+                images = None
+
+            if images is not None and \
+                    all(image['name'] == image_name for image in images):
+                return images[0]['id'] if images else None
+
+            self.snapshot = self.list_images()
+            if self.cache is not None:
+                self.cache.store(IMAGES, self.snapshot)
 
-    def check_image(self, image_name):
-        image_exists = False
+        return self.snapshot.get(image_name)
+
+    def list_images(self):
+        LOG.info('Listing every image in Glance')
+        images = {}
         for image in self.glance.images.list():
-            if image['name'] == image_name:
+            images.setdefault(image['name'], image['id'])
+        return images
+
+    def forget(self):
+        """drop the images listed before, the next lookup asks again"""
+        self.snapshot = None
+
+    def prefetch(self):
+        """load the images of the project into the cache, once per run"""
+        if self.cache is not None:
+            self.snapshot = self.cache.refresh(IMAGES, self.list_images)
+
+    @property
+    def project_id(self):
+        """id of the project the client works in"""
+        return self.session.get_project_id()
+
+    def check_image(self, image_name, owner=None):
+        """True if the project has image_name
+
+        when owner, the id of an image home project, is given the image
+        may also be one owner shares with the project, a membership that
+        is still pending is accepted
+
+        """
+        image_exists = self.find_image(image_name) is not None
+        if not image_exists and owner is not None:
+            image = self.find_shared_image(image_name, owner)
+            if image is not None:
+                if image['visibility'] == 'shared':
+                    self.accept_image(image_name, image['id'])
                 image_exists = True
-                break
 
         LOG.info('Image <%s> exists in Glance: %s', image_name, image_exists)
         return image_exists
 
+    def find_shared_image(self, image_name, owner):
+        """return the image named image_name that owner shares, or None
+
+        glance only lists the shared images whose membership was accepted
+        and no community image unless asked for them
+
+        """
+        for filters in ({'visibility': 'shared', 'member_status': 'all'},
+                        {'visibility': 'community'}):
+            filters.update(name=image_name, owner=owner)
+            images = list(self.glance.images.list(filters=filters, limit=1))
+            if images:
+                return images[0]
+        return None
+
+    def accept_image(self, image_name, image_id):
+        """accept the membership of the project to a shared image"""
+        self.glance.image_members.update(image_id, self.project_id,
+                                         'accepted')
+        if self.snapshot is not None:
+            self.snapshot[image_name] = image_id
+        if self.cache is not None:
+            self.cache.invalidate(IMAGES)
+        LOG.info('Accepted the shared image <%s>', image_name)
+
+    def share_image(self, image_name, project_id, sharing=MEMBERSHIP):
+        """share image_name with the project project_id
+
+        with MEMBERSHIP the project is made a member of the image, which
+        it still has to accept, with COMMUNITY every project can use it.
+        Returns the id of the image
+
+        """
+        image_id = self.find_image(image_name)
+        if image_id is None:
+            raise RuntimeError('Image <%s> cannot be shared, it is not in '
+                               'Glance' % image_name)
+
+        if sharing == COMMUNITY:
+            self.glance.images.update(image_id, visibility=COMMUNITY)
+        else:
+            # private images cannot have members
+            if self.glance.images.get(image_id)['visibility'] == 'private':
+                self.glance.images.update(image_id, visibility='shared')
+            try:
+                self.glance.image_members.create(image_id, project_id)
+            except exc.HTTPConflict:
+                LOG.debug('Project %s is already a member of <%s>',
+                          project_id, image_name)
+
+        LOG.info('Image <%s> shared with project %s through %s',
+                 image_name, project_id, sharing)
+        return image_id
+
     def upload_image(self,
                      image_name,
                      disk_format,
@@ -46,12 +199,7 @@ class ImageManager():
         if image_path is None:
             image_path = os.path.join(CONF.DEFAULT.files_dir, "images")
 
-        image_file = None
-        for file in os.listdir(image_path):
-            if image_name in file:
-                image_file = file
-                break
-
+        image_file = Utils.find_image_file(image_name, image_path)
         if image_file is not None:
             full_path = os.path.join(image_path, image_file)
             img = self.glance.images.create(name=image_name,
@@ -60,14 +208,112 @@ class ImageManager():
 
             LOG.info('Uploading image <%s> into Glance....', image_name)
             try:
-                self.glance.images.upload(img.id, open(full_path, 'rb'))
+                self.send_image(img.id, full_path, image_name)
             except Exception as ex:
                 msg = 'Error connecting to Glance, ' \
                       'check proxy and no_proxy settings\n' + str(ex)
                 LOG.error(msg)
+                # an image without data would pass for the uploaded one
+                self.delete_image(img.id, image_name)
                 raise
 
+            if self.snapshot is not None:
+                self.snapshot[image_name] = img.id
+            if self.cache is not None:
+                self.cache.invalidate(IMAGES)
             LOG.info('Image <%s> uploaded into Glance', image_name)
         else:
             raise OSError('Image upload error: %s could not be found in %s' %
                           (image_name, image_path))
+
+    def delete_image(self, image_id, label):
+        try:
+            self.glance.images.delete(image_id)
+            LOG.info('Deleted image <%s> left without data', label)
+        except Exception as ex:
+            LOG.warning('Could not delete image <%s> (%s), delete it before '
+                        'the next run: %s', label, image_id, ex)
+
+    def supports_import(self):
+        """True if glance takes staged uploads through its import API"""
+        try:
+            info = self.glance.images.get_import_info()
+        except exc.HTTPException as ex:
+            LOG.debug('Glance has no import API: %s', ex)
+            return False
+
+        methods = info.get('import-methods', {}).get('value', [])
+        return 'glance-direct' in methods
+
+    def send_image(self, image_id, path, label):
+        """stream the file at path into the image, retrying on failures
+
+        with the import API the file is staged then imported, an import
+        that fails is retried from the staged data instead of sending the
+        file again. The checksums computed while sending are checked
+        against the ones glance computed
+
+        """
+        use_import = self.supports_import()
+        stream = None
+        for attempt in range(1, self.UPLOAD_RETRIES + 1):
+            try:
+                if not use_import:
+                    stream = self.send(self.glance.images.upload, image_id,
+                                       path, label)
+                else:
+                    if stream is None:
+                        stream = self.send(self.glance.images.stage,
+                                           image_id, path, label)
+                    self.glance.images.image_import(image_id,
+                                                    method='glance-direct')
+                break
+            except TRANSIENT_ERRORS as ex:
+                if attempt == self.UPLOAD_RETRIES:
+                    raise
+                delay = self.UPLOAD_BACKOFF * 2 ** (attempt - 1)
+                LOG.warning('Uploading <%s> failed (attempt %s of %s), '
+                            'retrying in %s seconds: %s', label, attempt,
+                            self.UPLOAD_RETRIES, delay, ex)
+                time.sleep(delay)
+
+        if use_import:
+            self.wait_for_import(image_id, label)
+        self.verify(image_id, stream)
+
+    @staticmethod
+    def send(send, image_id, path, label):
+        with ImageStream(path, label) as stream:
+            send(image_id, stream, stream.size)
+
+        if not stream.complete:
+            raise exc.CommunicationError(
+                'only %s of the %s bytes of <%s> were sent' %
+                (stream.sent, stream.size, label))
+        return stream
+
+    def wait_for_import(self, image_id, label):
+        deadline = time.monotonic() + self.IMPORT_TIMEOUT
+        while True:
+            status = self.glance.images.get(image_id)['status']
+            if status == 'active':
+                return
+            if status in ('killed', 'deleted'):
+                raise RuntimeError('Glance could not import <%s>, the image '
+                                   'is %s' % (label, status))
+            if time.monotonic() > deadline:
+                raise RuntimeError('Glance did not import <%s> within %s '
+                                   'seconds' % (label, self.IMPORT_TIMEOUT))
+            time.sleep(self.IMPORT_POLL)
+
+    def verify(self, image_id, stream):
+        image = self.glance.images.get(image_id)
+        expected = [('checksum', stream.checksum)]
+        if image.get('os_hash_algo') == 'sha512':
+            expected.append(('os_hash_value', stream.sha512.hexdigest()))
+
+        for key, value in expected:
+            if image.get(key) and image.get(key) != value:
+                raise RuntimeError(
+                    'The %s of <%s> in Glance is %s, the uploaded file has '
+                    '%s' % (key, stream.label, image.get(key), value))
@@ -0,0 +1,89 @@
+"""
+ImageOptimizer class:
+    - rewrites a built image with qemu-img before it is uploaded, to make
+    it smaller to send or quicker to boot on the target cloud
+"""
+import os
+import time
+
+from oslo_log import log as logging
+
+from harbinger.common.utils import Utils
+
+LOG = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+NONE = 'none'
+# optimization -> disk format of the result, qemu-img command, followed
+# by the source and the target
+OPTIMIZATIONS = {
+    # unused and zeroed clusters are left out of the copy
+    'sparsify': ('qcow2', ['qemu-img', 'convert', '-O', 'qcow2']),
+    # smaller to upload, clusters are decompressed when they are read
+    'compress': ('qcow2', ['qemu-img', 'convert', '-c', '-O', 'qcow2']),
+    # e.g. for ceph, which would convert qcow2 images on every boot
+    'raw': ('raw', ['qemu-img', 'convert', '-O', 'raw']),
+}
+
+
+class ImageOptimizer():
+    def __init__(self, optimization=None):
+        optimization = optimization or NONE
+        if optimization != NONE and optimization not in OPTIMIZATIONS:
+            raise RuntimeError('image_optimization must be one of %s, got %s'
+                               % (', '.join([NONE] + sorted(OPTIMIZATIONS)),
+                                  optimization))
+        self.optimization = optimization
+
+    @property
+    def enabled(self):
+        return self.optimization != NONE
+
+    def optimize(self, image_name, image_path, execute):
+        """optimize the image named image_name built into image_path
+
+        execute runs a command given as a list of arguments. Returns the
+        directory holding the image to upload and its disk format, the
+        result is written to a subdirectory of image_path named after the
+        optimization and kept for as long as the built image does not
+        change
+
+        """
+        if not self.enabled:
+            return image_path, 'qcow2'
+
+        image_file = Utils.find_image_file(image_name, image_path)
+        if image_file is None:
+            raise OSError('Image optimization error: %s could not be found '
+                          'in %s' % (image_name, image_path))
+
+        disk_format, command = OPTIMIZATIONS[self.optimization]
+        source = os.path.join(image_path, image_file)
+        target_path = os.path.join(image_path, self.optimization)
+        target = os.path.join(target_path, image_name + '.' + disk_format)
+
+        if os.path.exists(target) and \
+                os.path.getmtime(target) >= os.path.getmtime(source):
+            LOG.info('Using the %s image %s optimized before',
+                     self.optimization, target)
+            return target_path, disk_format
+
+        if not os.path.isdir(target_path):
+            os.makedirs(target_path)
+        started = time.monotonic()
+        # optimizers of the same image each write a file of their own
+        Utils.replace_file(
+            target, lambda partial: execute(command + [source, partial]))
+
+        LOG.info('Optimized image %s (%s) in %.0f seconds: %s -> %s',
+                 image_name, self.optimization, time.monotonic() - started,
+                 self.describe(source), self.describe(target))
+        return target_path, disk_format
+
+    @staticmethod
+    def describe(path):
+        """size and space used on disk of path, they differ when sparse"""
+        stat = os.stat(path)
+        return '%.0f MB (%.0f MB on disk)' % (stat.st_size / MB,
+                                              stat.st_blocks * 512 / MB)
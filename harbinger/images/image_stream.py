@@ -0,0 +1,70 @@
+"""
+ImageStream class:
+    - reads an image file for an upload in chunks, computing its checksums
+    on the way and logging the progress of the upload
+"""
+import hashlib
+import os
+import time
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+
+class ImageStream():
+    # seconds between two progress messages
+    REPORT_INTERVAL = 30
+
+    def __init__(self, path, label=None):
+        self.path = path
+        self.label = label or os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.sent = 0
+        # the checksums glance keeps for an image, md5 and its default
+        # os_hash_algo
+        self.md5 = hashlib.md5()  # nosec
+        self.sha512 = hashlib.sha512()
+        self.image_file = None
+        self.started = self.reported = None
+
+    def __enter__(self):
+        self.image_file = open(self.path, 'rb')
+        self.started = self.reported = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self.image_file.close()
+
+    def read(self, size=-1):
+        chunk = self.image_file.read(size)
+        self.md5.update(chunk)
+        self.sha512.update(chunk)
+        self.sent += len(chunk)
+
+        now = time.monotonic()
+        finished = chunk and self.sent == self.size
+        if finished or now - self.reported >= self.REPORT_INTERVAL:
+            self.reported = now
+            self.report(now)
+        return chunk
+
+    def throughput(self, now=None):
+        """MB sent per second"""
+        elapsed = (now or time.monotonic()) - self.started
+        return self.sent / MB / elapsed if elapsed > 0 else 0.0
+
+    def report(self, now=None):
+        LOG.info('Uploaded %.0f of %.0f MB of <%s> at %.1f MB/s',
+                 self.sent / MB, self.size / MB, self.label,
+                 self.throughput(now))
+
+    @property
+    def checksum(self):
+        return self.md5.hexdigest()
+
+    @property
+    def complete(self):
+        return self.sent == self.size
@@ -0,0 +1,47 @@
+"""
+ListJobs class:
+    - Lists the runs submitted to a running harbinger serve
+"""
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from prettytable import PrettyTable
+
+from harbinger import base
+from harbinger.common.job_server import JobClient
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class ListJobs(base.Base):
+    description = "lists the runs submitted to harbinger serve"
+
+    def get_description(self):
+        return self.description
+
+    def get_parser(self, prog_name):
+        parser = super(ListJobs, self).get_parser(prog_name)
+        parser.add_argument(
+            '--socket',
+            metavar='<path>',
+            default=CONF.DEFAULT.serve_socket,
+            help='Unix socket harbinger serve listens on',
+        )
+
+        return parser
+
+    def take_action(self, parsed_args):
+        jobs = JobClient(parsed_args.socket).list()
+        self.job_tables = PrettyTable(
+            ['Job', 'Priority', 'State', 'Submitted', 'Run', 'Result'])
+        self.job_tables.align = 'l'
+        for job in jobs:
+            self.job_tables.add_row([
+                job['job'], job['priority'], job['state'],
+                time.strftime('%Y-%m-%d %H:%M:%S',
+                              time.localtime(job['submitted'])),
+                job['run_id'] or '', job['result'] or ''
+            ])
+        print(self.job_tables)
@@ -4,21 +4,39 @@ Run class:
     data from the yaml file and proceeds to run the relevant
     frameworks
 """
+import collections
 import io
 import multiprocessing
 import os
 import signal
+import threading
 import traceback
 
+from multiprocessing.pool import ThreadPool
+
 from oslo_config import cfg
 from oslo_log import log as logging
-from psutil import Process
+from prettytable import PrettyTable
 from pykwalify.core import Core
 
 from harbinger import base
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.cancellation import GRACE
+from harbinger.common.cancellation import ProcessGroups
 from harbinger.common.directory_manager import \
     DirectoryManager
+from harbinger.common.journal import CANCELLED
+from harbinger.common.journal import COMPLETED
+from harbinger.common.journal import FAILED
+from harbinger.common.journal import RESUMED
+from harbinger.common.journal import RunJournal
+from harbinger.common.journal import RUNNING
+from harbinger.common.journal import TIMED_OUT
+from harbinger.common.provisioner import Provisioner
+from harbinger.common.scheduler import DependencyError
+from harbinger.common.scheduler import Scheduler
 from harbinger.common.utils import Utils
+from harbinger.common.watchdog import CommandTimeout
 from harbinger.factory.environment_extractor \
     import EnvironmentExtractor
 from harbinger.factory.framework_extractor import \
@@ -33,11 +51,25 @@ CONF = cfg.CONF
 class Run(base.CommandBase):
     description = "run harbinger by providing a yaml file"
 
+    # a warm worker pool handed in by harbinger serve, reused between runs
+    pool = None
+    pool_size = None
+    # frameworks whose images and flavors are readied at once, unless
+    # provisioning_threads says otherwise
+    provisioning_threads = 4
+
     def get_description(self):
         return self.description
 
     def get_parser(self, prog_name):
         parser = super(Run, self).get_parser(prog_name)
+        parser.add_argument(
+            '--resume',
+            metavar='<run-id>',
+            default=None,
+            help=('Resume an interrupted run, frameworks and shards '
+                  'that completed are not executed again'),
+        )
 
         return parser
 
@@ -46,7 +78,7 @@ class Run(base.CommandBase):
             self.app_args.yaml_file)
 
     def parse_environment(self):
-        self.environment = self.environment_extractor.parse_environment(
+        self.environments = self.environment_extractor.parse_environments(
             self.app_args.yaml_file)
 
     def parse_options(self):
@@ -58,6 +90,9 @@ class Run(base.CommandBase):
         self.directory_manager.setup()
 
         self.app_args.yaml_file = self.load_yaml(parsed_args.yaml)
+        self.app_args.yaml_path = parsed_args.yaml
+        self.app_args.resume = getattr(parsed_args, 'resume', None)
+        self.app_args.run_id = getattr(parsed_args, 'run_id', None)
         self.framework_extractor = FrameworkExtractor()
         self.environment_extractor = EnvironmentExtractor()
         self.options_extractor = OptionsExtractor()
@@ -76,78 +111,398 @@ class Run(base.CommandBase):
                     schema_data=schema_file)
         core.validate(raise_exception=True)
 
-        self.directory_manager.archive_outputs()
-
-        if self.options.execution_mode == 'serial':
-            self.execute_serial()
-        else:
-            # parallel is default
-            self.execute_parallel()
+        self.start_journal()
+
+        try:
+            if self.options.execution_mode == 'serial':
+                self.execute_serial()
+            elif self.options.execution_mode == 'threads':
+                self.execute_threads()
+            else:
+                # parallel is default
+                self.execute_parallel()
+        finally:
+            # the cancellation belongs to the run, the frameworks it ran in
+            # this process have all stopped by now
+            ProcessGroups.reset()
 
         LOG.info('All frameworks have finished execution')
 
-    def execute_serial(self):
-        LOG.info('Executing frameworks %s in serial',
-                 self.frameworks_dict.keys())
+    def start_journal(self):
+        resume = getattr(self.app_args, 'resume', None)
+        if resume:
+            self.journal = RunJournal(resume)
+            if not self.journal.exists():
+                raise RuntimeError(
+                    'Run %s can not be resumed, %s does not exist' %
+                    (resume, self.journal.journal_path))
+            # the units of the journal are those of the yaml it was
+            # created with, another yaml would skip or repeat the wrong ones
+            yaml_path = getattr(self.app_args, 'yaml_path', None)
+            if not self.journal.matches(yaml_path):
+                raise RuntimeError(
+                    'Run %s can not be resumed with %s, it was started with '
+                    'another yaml, %s' %
+                    (resume, yaml_path, self.journal.load().get('yaml')))
+            # the outputs of completed frameworks are reused as they are
+            LOG.info('Resuming run %s', resume)
+        else:
+            self.directory_manager.archive_outputs()
+            self.journal = RunJournal(
+                getattr(self.app_args, 'run_id', None) or
+                RunJournal.new_run_id())
+            self.journal.create(getattr(self.app_args, 'yaml_path', None))
+
+        # workers find the journal through the run id
+        self.options.run_id = self.journal.run_id
+
+    @staticmethod
+    def unit_name(item, environment):
+        return RunJournal.unit_name(item, getattr(environment, 'target', None))
+
+    def create_scheduler(self, max_parallel=None):
+        """queue every framework once for every target environment"""
+        scheduler = Scheduler(
+            getattr(self.options, 'concurrency_budget', None), max_parallel)
+        for environment in self.environments:
+            for item in self.frameworks_dict:
+                framework = self.frameworks_dict[item]
+                # after is accepted as an alias of depends_on, dependencies
+                # are between frameworks running against the same target
+                depends_on = list(getattr(framework, 'depends_on', None) or [])
+                depends_on += getattr(framework, 'after', None) or []
+                scheduler.add(
+                    self.unit_name(item, environment),
+                    getattr(framework, 'weight', None),
+                    (item, framework, environment, self.options),
+                    [self.unit_name(dep, environment) for dep in depends_on])
+
+        journal = getattr(self, 'journal', None)
+        if journal is not None:
+            for name in scheduler.units:
+                if journal.completed(name):
+                    LOG.info('Skipping %s, it completed before', name)
+                    scheduler.mark_completed(name, RESUMED)
+
+        return scheduler
+
+    def start_provisioning(self, scheduler, order):
+        """ready the images and flavors of the frameworks left to run
+
+        they are provisioned provisioning_threads at a time in threads of
+        this process, in the order given. Returns the Provisioner, None
+        when provisioning_threads is 0 and every framework provisions its
+        own resources when it starts
+
+        """
+        threads = getattr(self.options, 'provisioning_threads', None)
+        if threads is None:
+            threads = self.provisioning_threads
+        names = [name for name in order if name not in scheduler.completed]
+        if not threads or not names:
+            return None
+
+        LOG.info('Provisioning the resources of %s', names)
+        provisioner = Provisioner(provision, min(threads, len(names)))
+        for name in names:
+            provisioner.submit(name, scheduler.units[name][1])
+        return provisioner
 
-        for item in self.frameworks_dict:
-            worker([
-                item, self.frameworks_dict[item], self.environment,
-                self.options
-            ])
+    def execute_serial(self):
+        scheduler = self.create_scheduler()
+        order = scheduler.order()
+        LOG.info('Executing frameworks %s in serial', order)
+
+        # frameworks run in this process, a signal stops their commands and
+        # the framework raises Cancelled once it notices
+        handlers = install_signal_handlers(
+            lambda signal_num, frame: ProcessGroups.cancel(signal_num))
+        # the next frameworks are provisioned while one runs
+        provisioner = self.start_provisioning(scheduler, order)
+        try:
+            for item in order:
+                if item not in scheduler.completed:
+                    if provisioner is not None:
+                        provisioner.wait(item)
+                    worker(list(scheduler.units[item][1]))
+        except Exception as ex:
+            # there is no summary in serial mode, see log_summary
+            self.log_output_tail(item, ex)
+            raise
+        finally:
+            # a cancelled or failed run leaves nothing provisioning behind
+            if provisioner is not None:
+                provisioner.stop()
+            restore_signal_handlers(handlers)
 
     def execute_parallel(self):
-        LOG.info('Executing frameworks %s in parallel',
-                 self.frameworks_dict.keys())
+        # the pool is sized by max_parallel rather than the local cpu count,
+        # what the cloud can absorb is governed by the concurrency budget
+        max_parallel = getattr(self.options, 'max_parallel', None) or \
+            multiprocessing.cpu_count()
+        if self.pool is not None:
+            max_parallel = min(max_parallel, self.pool_size)
+        scheduler = self.create_scheduler(max_parallel)
+        self.provision_parallel(scheduler)
+        LOG.info('Executing frameworks %s in parallel', list(scheduler.units))
+
+        pool = self.pool
+        if pool is None:
+            processes = min(max_parallel, len(scheduler.units)) or 1
+            pool = multiprocessing.Pool(processes=processes,
+                                        initializer=worker_init)
+
+        def cancel(signal_num, frame):
+            workers = [child.pid for child in
+                       multiprocessing.active_children()]
+            if scheduler.deadline is not None:
+                LOG.error('Signal %s received again, killing the workers',
+                          signal_num)
+                ProcessGroups.terminate(workers, grace=0)
+                return
+
+            # workers stop their commands within GRACE seconds, the rest of
+            # the grace period leaves time for cleanup and flushing
+            LOG.error('Signal %s received, cancelling the run', signal_num)
+            scheduler.cancel(2 * GRACE)
+            for pid in workers:
+                ProcessGroups.signal(pid, signal.SIGTERM)
+
+        handlers = install_signal_handlers(cancel)
+        try:
+            results = scheduler.run(pool, pool_worker)
+        finally:
+            restore_signal_handlers(handlers)
+
+        if scheduler.deadline is not None:
+            # workers still busy after the grace period are killed, idle ones
+            # would not exit on the SIGTERM sent by terminate
+            ProcessGroups.terminate(
+                [child.pid for child in multiprocessing.active_children()],
+                grace=0)
+            pool.terminate()
+            pool.join()
+            self.pool = None
+        elif self.pool is None:
+            pool.close()
+            pool.join()
+
+        self.log_summary(scheduler, results)
+        self.raise_failures(results)
+
+    def execute_threads(self):
+        """run the frameworks in threads of this process
+
+        like parallel mode, without worker processes: nothing is forked or
+        pickled, and the frameworks share the sessions and resources cached
+        by this process. A signal stops the commands of every framework,
+        which then raise Cancelled, and no further framework is started.
+        Returns once every thread has stopped
+
+        """
+        max_parallel = getattr(self.options, 'max_parallel', None) or \
+            multiprocessing.cpu_count()
+        scheduler = self.create_scheduler(max_parallel)
+        self.provision_parallel(scheduler)
+        LOG.info('Executing frameworks %s in threads', list(scheduler.units))
+
+        def cancel(signal_num, frame):
+            if scheduler.deadline is not None:
+                LOG.error('Signal %s received again, killing the commands',
+                          signal_num)
+                ProcessGroups.stop(grace=0)
+                return
+
+            scheduler.cancel(2 * GRACE)
+            ProcessGroups.cancel(signal_num)
+
+        pool = ThreadPool(
+            processes=min(max_parallel, len(scheduler.units)) or 1)
+        handlers = install_signal_handlers(cancel)
+        try:
+            results = scheduler.run(pool, worker)
+        finally:
+            restore_signal_handlers(handlers)
+            if scheduler.deadline is not None:
+                # commands started after the signal, or that outlived the
+                # grace period, are killed so the threads can stop
+                ProcessGroups.stop(grace=0)
+            pool.close()
+            pool.join()
+
+        self.log_summary(scheduler, results)
+        self.raise_failures(results)
+
+    @staticmethod
+    def raise_failures(results):
+        # raise the first exception thrown by the workers, skipped
+        # frameworks are only reported when nothing else failed
+        failures = [
+            outcome for outcome in results.values()
+            if isinstance(outcome, Exception)
+        ]
+        failures.sort(key=lambda ex: isinstance(ex, DependencyError))
+        if failures:
+            raise failures[0]
+
+    def provision_parallel(self, scheduler):
+        """provision every framework before the workers start running them
+        """
+        handlers = install_signal_handlers(
+            lambda signal_num, frame: ProcessGroups.cancel(signal_num))
+        provisioner = self.start_provisioning(scheduler, scheduler.order())
+        try:
+            if provisioner is not None:
+                provisioner.wait_all()
+            # a run cancelled while provisioning does not start, the run
+            # clears the cancellation once it is over
+            ProcessGroups.check()
+        finally:
+            if provisioner is not None:
+                provisioner.stop()
+            restore_signal_handlers(handlers)
+
+    def log_summary(self, scheduler, results):
+        """log one row per framework with a result column per target"""
+        targets = []
+        rows = collections.OrderedDict()
+        for name, outcome in results.items():
+            item, _, environment, _ = scheduler.units[name][1]
+            target = getattr(environment, 'target', None)
+            if target not in targets:
+                targets.append(target)
+
+            if outcome == RESUMED:
+                result = 'passed (resumed)'
+            elif isinstance(outcome, DependencyError):
+                result = 'skipped: %s' % outcome
+            elif isinstance(outcome, CommandTimeout):
+                result = 'timed out: %s' % outcome
+            elif isinstance(outcome, Cancelled):
+                result = 'cancelled: %s' % outcome
+            elif isinstance(outcome, Exception):
+                result = 'failed: %s' % outcome
+            else:
+                result = 'passed'
+            rows.setdefault(item, {})[target] = result
+
+        table = PrettyTable(['Framework'] +
+                            [target or 'Result' for target in targets])
+        table.align = 'l'
+        for item, row in rows.items():
+            table.add_row([item] +
+                          [row.get(target, '') for target in targets])
+
+        LOG.info('Execution summary:\n%s', table)
+
+        for name, outcome in results.items():
+            self.log_output_tail(name, outcome)
+
+    @staticmethod
+    def log_output_tail(name, error):
+        """log the last output of a failed command, to triage it without
+        searching the whole log
+        """
+        tail = getattr(error, 'output_tail', None)
+        if tail:
+            LOG.error('Last output of %s before it failed:\n%s', name, tail)
+
+
+def create_executor(name, framework, environment, options):
+    # alter the name to correctly find the class e.g. go from shaker to Shaker
+    class_name = name.title()
+    cls = Utils.load_class('harbinger.executors.' + name + '.' + class_name +
+                           'Executor')
+    return cls(framework, environment, options)
 
-        results = []
-        parent_id = os.getpid()
-        pool = multiprocessing.Pool(initializer=worker_init(parent_id))
-        for item in self.frameworks_dict:
-            results.append(
-                pool.apply_async(worker, [(item, self.frameworks_dict[item],
-                                           self.environment, self.options)]))
 
-        pool.close()
-        pool.join()
+def loader(name, framework, environment, options):
+    framework_executor = create_executor(name, framework, environment,
+                                         options)
+    try:
+        framework_executor.setup()
+    except Cancelled:
+        framework_executor.cleanup()
+        raise
 
-        for outcome in results:
-            # call get so any thrown exceptions are correctly raised
-            outcome.get()
 
+def provision(name, framework, environment, options):
+    """ready the images and flavors of a framework ahead of its execution
+
+    this runs in a thread of the run, next to the other frameworks being
+    provisioned or run, each with environment variables of its own
+
+    """
+    framework_executor = create_executor(name, framework, environment,
+                                         options)
+    framework_executor.prefetch_resources()
+    framework_executor.provision()
+
+
+def install_signal_handlers(handler):
+    """route SIGINT and SIGTERM to handler, return the previous handlers"""
+    return {
+        signal_num: signal.signal(signal_num, handler)
+        for signal_num in (signal.SIGINT, signal.SIGTERM)
+    }
 
-def loader(name, framework, environment, options):
-    # alter the name to correctly find the class e.g. go from shaker to Shaker
-    class_name = name.title()
-    cls = Utils.load_class('harbinger.executors.' + name + '.' + class_name +
-                           'Executor')
-    framework_executor = cls(framework, environment, options)
-    framework_executor.setup()
 
+def restore_signal_handlers(handlers):
+    for signal_num, handler in handlers.items():
+        signal.signal(signal_num, handler)
 
-def worker_init(parent_id):
-    def sig_int(signal_num, frame):
-        LOG.error('signal: %s frame: %s', signal_num, frame)
-        parent = Process(parent_id)
-        for child in parent.children():
-            if child.pid != os.getpid():
-                LOG.error("exiting child: %s" % child.pid)
-                child.kill()
-        LOG.error("exiting parent: %s" % parent_id)
-        parent.kill()
-        LOG.error("exiting all: %s" % os.getpid())
-        Process(os.getpid()).kill()
 
-    signal.signal(signal.SIGINT, sig_int)
+def flush_logs():
+    for handler in logging.getLogger().logger.handlers:
+        handler.flush()
+
+
+def worker_init():
+    # a worker leads its own process group, so a ctrl-c on the terminal only
+    # reaches the parent which forwards it as SIGTERM
+    os.setpgrp()
+    install_signal_handlers(
+        lambda signal_num, frame: ProcessGroups.cancel(signal_num))
 
 
 def worker(args):
+    unit = Run.unit_name(args[0], args[2])
+    run_id = getattr(args[3], 'run_id', None)
+    journal = RunJournal(run_id) if run_id else None
     try:
-        multiprocessing.current_process().name = args[0] + '-worker'
-        return loader(*args)
-    except Exception:
+        if threading.current_thread() is threading.main_thread():
+            multiprocessing.current_process().name = unit + '-worker'
+        else:
+            # a framework run in a thread of the run
+            threading.current_thread().name = unit + '-worker'
+        if journal is not None:
+            journal.set_state(unit, RUNNING)
+        result = loader(*args)
+        if journal is not None:
+            journal.set_state(unit, COMPLETED)
+        return result
+    except Cancelled:
+        if journal is not None:
+            journal.set_state(unit, CANCELLED)
+        LOG.error('%s was cancelled', unit)
+        flush_logs()
+        raise
+    except Exception as ex:
+        if journal is not None:
+            journal.set_state(
+                unit, TIMED_OUT if isinstance(ex, CommandTimeout) else FAILED)
         # this is used to correctly capture traceback from exceptions
         exc_buffer = io.StringIO()
         traceback.print_exc(file=exc_buffer)
         LOG.error(exc_buffer.getvalue())
         raise
+
+
+def pool_worker(args):
+    """worker run in a process of the pool, one framework at a time"""
+    try:
+        return worker(args)
+    finally:
+        # pool processes are reused, a cancellation only applies to the
+        # framework that was running when it arrived
+        ProcessGroups.reset()
@@ -0,0 +1,160 @@
+"""
+Serve class:
+    - keeps harbinger resident, running the yaml files submitted on a unix
+    socket one after the other with warm configuration, clients and
+    worker pool
+"""
+import argparse
+import logging as consoleLogging
+import multiprocessing
+import threading
+import time
+
+import multiprocessing_logging
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger import base
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.job_server import JobServer
+from harbinger.common.jobs import CANCELLED
+from harbinger.common.jobs import FAILED
+from harbinger.common.jobs import JobQueue
+from harbinger.common.jobs import PASSED
+from harbinger.run import Run
+from harbinger.run import worker_init
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class JobLogHandler(consoleLogging.Handler):
+    """add every log record to the events of the job being run"""
+    def __init__(self, queue):
+        super(JobLogHandler, self).__init__()
+        self.queue = queue
+        self.job = None
+        self.setFormatter(consoleLogging.Formatter(
+            '%(processName)s %(levelname)s %(name)s %(message)s'))
+
+    def emit(self, record):
+        job = self.job
+        if job is not None:
+            self.queue.log(job, self.format(record))
+
+
+class Serve(base.Base):
+    description = "run harbinger as a daemon that runs submitted yaml files"
+
+    # seconds between looks for jobs left running by daemons that died
+    RECOVER = 60
+
+    def get_description(self):
+        return self.description
+
+    def get_parser(self, prog_name):
+        parser = super(Serve, self).get_parser(prog_name)
+        parser.add_argument(
+            '--socket',
+            metavar='<path>',
+            default=CONF.DEFAULT.serve_socket,
+            help='Unix socket to listen on for submitted runs',
+        )
+        parser.add_argument(
+            '--workers',
+            metavar='<count>',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help=('Size of the worker pool kept warm between runs, it caps '
+                  'max_parallel'),
+        )
+
+        return parser
+
+    def take_action(self, parsed_args):
+        self.queue = JobQueue()
+        self.queue.recover()
+        self.workers = parsed_args.workers
+
+        # the handler is wrapped so records logged in pool workers reach it
+        self.log_handler = JobLogHandler(self.queue)
+        self.mp_log_handler = multiprocessing_logging.MultiProcessingHandler(
+            'job-log', sub_handler=self.log_handler)
+        consoleLogging.getLogger().addHandler(self.mp_log_handler)
+        self.pool = self.create_pool()
+
+        self.server = JobServer(parsed_args.socket, self.queue)
+        server_thread = threading.Thread(target=self.server.serve_forever,
+                                         name='job-server')
+        server_thread.daemon = True
+        server_thread.start()
+        LOG.info('Listening for runs on %s with %s workers',
+                 parsed_args.socket, self.workers)
+
+        try:
+            self.serve_jobs()
+        except KeyboardInterrupt:
+            LOG.info('Stopping')
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+
+    def serve_jobs(self):
+        """run the queued jobs one after the other, until interrupted
+
+        the jobs of a daemon that died are queued again by the daemons
+        still alive, not only by the next one to start
+
+        """
+        recovered = time.monotonic()
+        while True:
+            if time.monotonic() - recovered >= self.RECOVER:
+                self.queue.recover()
+                recovered = time.monotonic()
+            job = self.queue.claim(timeout=1)
+            if job is not None:
+                self.run_job(job)
+
+    def create_pool(self):
+        return multiprocessing.Pool(processes=self.workers,
+                                    initializer=worker_init)
+
+    def run_job(self, job):
+        """run the yaml of job like harbinger run would, in this process"""
+        if self.pool is None:
+            self.pool = self.create_pool()
+
+        LOG.info('Starting job %s', job.job_id)
+        run = Run(self.app, argparse.Namespace())
+        run.pool = self.pool
+        run.pool_size = self.workers
+        self.log_handler.job = job
+        state, result = PASSED, None
+        try:
+            run.take_action(
+                argparse.Namespace(yaml=job.yaml_path, resume=job.resume,
+                                   run_id=job.run_id))
+        except Cancelled as ex:
+            state, result = CANCELLED, str(ex)
+        except Exception as ex:
+            LOG.error('Job %s failed: %s', job.job_id, ex)
+            state, result = FAILED, '%s: %s' % (ex.__class__.__name__, ex)
+        finally:
+            # a cancelled run terminates the pool, the next job gets a new one
+            self.pool = run.pool
+
+        self.drain_logs()
+        self.log_handler.job = None
+        self.queue.finish(job, state, result)
+
+    def drain_logs(self, timeout=2):
+        """give records still in flight from the workers time to arrive"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and \
+                self.mp_log_handler.queue.qsize():
+            time.sleep(0.05)
+        # the last record may still be being emitted
+        time.sleep(0.05)
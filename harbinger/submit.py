@@ -0,0 +1,82 @@
+"""
+Submit class:
+    - submits a yaml file to a running harbinger serve and optionally
+    follows the run until it finishes
+"""
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from harbinger import base
+from harbinger.common.job_server import JobClient
+from harbinger.common.jobs import PASSED
+
+LOG = logging.getLogger(__name__)
+CONF = cfg.CONF
+
+
+class Submit(base.CommandBase):
+    description = "submit a yaml file to a running harbinger serve"
+
+    def get_description(self):
+        return self.description
+
+    def get_parser(self, prog_name):
+        parser = super(Submit, self).get_parser(prog_name)
+        parser.add_argument(
+            '--socket',
+            metavar='<path>',
+            default=CONF.DEFAULT.serve_socket,
+            help='Unix socket harbinger serve listens on',
+        )
+        parser.add_argument(
+            '--resume',
+            metavar='<run-id>',
+            default=None,
+            help='Resume an interrupted run instead of starting a new one',
+        )
+        parser.add_argument(
+            '--priority',
+            metavar='<priority>',
+            type=int,
+            default=0,
+            help=('Jobs with a higher priority are run first, jobs of the '
+                  'same priority in the order they were submitted'),
+        )
+        parser.add_argument(
+            '--wait',
+            action='store_true',
+            help=('Stream the log of the run until it finishes, fail if '
+                  'the run does not pass'),
+        )
+
+        return parser
+
+    def take_action(self, parsed_args):
+        with open(parsed_args.yaml, 'r') as yaml_file:
+            yaml_text = yaml_file.read()
+
+        client = JobClient(parsed_args.socket)
+        answer = client.submit(yaml_text, parsed_args.resume,
+                               parsed_args.priority)
+        job_id = answer['job']['job']
+        LOG.info('Submitted job %s, %s jobs ahead of it', job_id,
+                 answer['position'])
+        print(job_id)
+
+        if parsed_args.wait:
+            self.wait(client, job_id)
+
+    def wait(self, client, job_id):
+        job = None
+        for answer in client.watch(job_id):
+            event = answer.get('event', {})
+            if 'log' in event:
+                print(event['log'])
+            elif 'state' in event:
+                LOG.info('Job %s is %s', job_id, event['state'])
+            job = answer.get('job', job)
+
+        if job is None or job['state'] != PASSED:
+            raise RuntimeError('Job %s %s: %s' % (
+                job_id, job['state'] if job else 'was lost',
+                job['result'] if job else ''))
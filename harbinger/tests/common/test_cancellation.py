@@ -0,0 +1,77 @@
+import signal
+import subprocess
+import threading
+import unittest
+
+import mock
+
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.cancellation import ProcessGroups
+
+
+class TestProcessGroups(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(ProcessGroups.reset)
+
+    def test_check(self):
+        ProcessGroups.check()
+        ProcessGroups.cancelled = signal.SIGTERM
+        with self.assertRaises(Cancelled) as context:
+            ProcessGroups.check()
+        self.assertEqual(str(context.exception),
+                         'cancelled by signal %s' % signal.SIGTERM)
+
+    def test_cancel(self):
+        popen = subprocess.Popen(['/bin/sh', '-c', 'sleep 30 & sleep 30'],
+                                 start_new_session=True)
+        self.addCleanup(popen.wait)
+        ProcessGroups.add(popen)
+        self.addCleanup(ProcessGroups.remove, popen)
+        ProcessGroups.cancel(signal.SIGINT, grace=5)
+        self.assertIsNotNone(popen.poll())
+        self.assertEqual(popen.returncode, -signal.SIGTERM)
+        self.assertRaises(Cancelled, ProcessGroups.check)
+
+    def test_cancel_in_lock(self):
+        def handler():
+            # a signal handled while the main thread tracks a command
+            with ProcessGroups.lock:
+                ProcessGroups.cancel(signal.SIGINT, grace=0)
+
+        thread = threading.Thread(target=handler)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertRaises(Cancelled, ProcessGroups.check)
+
+    def test_stop(self):
+        popen = subprocess.Popen(['sleep', '30'], start_new_session=True)
+        self.addCleanup(popen.wait)
+        ProcessGroups.add(popen)
+        self.addCleanup(ProcessGroups.remove, popen)
+        ProcessGroups.stop(grace=0)
+        self.assertLess(popen.wait(5), 0)
+        # the commands are stopped without cancelling the run
+        ProcessGroups.check()
+
+    @mock.patch('harbinger.common.cancellation.time.sleep')
+    @mock.patch('harbinger.common.cancellation.os.killpg')
+    def test_terminate(self, mock_killpg, mock_sleep):
+        def killpg(pgid, signal_num):
+            if pgid == 2:
+                raise ProcessLookupError()
+
+        mock_killpg.side_effect = killpg
+        ProcessGroups.terminate([1, 2], grace=0)
+        mock_killpg.assert_has_calls([
+            mock.call(1, signal.SIGTERM),
+            mock.call(2, signal.SIGTERM),
+            mock.call(1, signal.SIGKILL),
+        ])
+        self.assertEqual(mock_killpg.call_count, 3)
+
+        mock_killpg.reset_mock()
+        ProcessGroups.terminate([2])
+        mock_killpg.assert_called_once_with(2, signal.SIGTERM)
+        mock_sleep.assert_not_called()
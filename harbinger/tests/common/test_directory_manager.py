@@ -1,4 +1,7 @@
 import argparse
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -56,3 +59,34 @@ class TestDirectoryManager(unittest.TestCase):
         with mock.patch("builtins.open") as mock_file:
             self.test_object.archive_outputs()
             mock_file.assert_not_called()
+
+    def test_archive_outputs_targets(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.test_object.outputs_dir = temp_dir
+        for path in ['shaker-results.json', 'east/yardstick.out',
+                     'east/yardstick-output.log.1.gz',
+                     'east/deeper/untouched.log']:
+            path = os.path.join(temp_dir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+        with mock.patch('harbinger.common.directory_manager.uuid') as uuid:
+            uuid.uuid4.return_value = '12345-uuid'
+            self.test_object.archive_outputs()
+
+        self.assertTrue(
+            os.path.exists(os.path.join(temp_dir,
+                                        'shaker-results-12345-hrb.json')))
+        self.assertTrue(
+            os.path.exists(os.path.join(temp_dir, 'east',
+                                        'yardstick-12345-hrb.out')))
+        self.assertTrue(
+            os.path.exists(os.path.join(
+                temp_dir, 'east', 'yardstick-output-12345-hrb.log.1.gz')))
+        self.assertTrue(
+            os.path.exists(os.path.join(temp_dir, 'east', 'deeper',
+                                        'untouched.log')))
+        with open(os.path.join(temp_dir, 'archive-hrb.log')) as archive:
+            self.assertIn('east/yardstick-12345-hrb.out', archive.read())
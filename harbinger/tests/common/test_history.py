@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from harbinger.common.history import DurationHistory
+
+
+class TestDurationHistory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.history_path = os.path.join(self.temp_dir, 'history',
+                                         'framework.json')
+        self.test_object = DurationHistory('framework',
+                                           history_path=self.history_path)
+
+    def test_load_missing(self):
+        self.assertEqual(self.test_object.load(), {})
+
+    def test_load_unreadable(self):
+        os.makedirs(os.path.dirname(self.history_path))
+        with open(self.history_path, 'w') as history_file:
+            history_file.write('not json')
+        self.assertEqual(self.test_object.load(), {})
+
+    def test_record(self):
+        self.test_object.record({})
+        self.assertFalse(os.path.exists(self.history_path))
+
+        self.test_object.record({'t1': 10, 't2': 20})
+        self.test_object.record({'t1': 30})
+
+        with open(self.history_path) as history_file:
+            self.assertEqual(json.load(history_file), {'t1': 20, 't2': 20})
+        self.assertEqual(
+            DurationHistory('framework',
+                            history_path=self.history_path).load(), {
+                't1': 20,
+                't2': 20
+            })
+
+    def test_order(self):
+        self.test_object.durations = {'t1': 5, 't2': 50, 't3': 20}
+        self.assertEqual(self.test_object.order(['t1', 'new', 't2', 't3']),
+                         ['t2', 'new', 't3', 't1'])
+
+    def test_pack(self):
+        self.test_object.durations = {
+            't1': 70,
+            't2': 40,
+            't3': 30,
+            't4': 20,
+            't5': 10
+        }
+        self.assertEqual(
+            self.test_object.pack(['t5', 't4', 't3', 't2', 't1'], 2),
+            [['t1', 't4'], ['t2', 't3', 't5']])
+
+    def test_pack_without_history(self):
+        self.test_object.durations = {}
+        self.assertEqual(self.test_object.pack(['t1', 't2', 't3'], 2),
+                         [['t1', 't3'], ['t2']])
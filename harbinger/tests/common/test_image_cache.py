@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from harbinger.common.image_cache import ImageCache
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.cache_dir = os.path.join(self.temp_dir, 'image_cache')
+        self.build_dir = os.path.join(self.temp_dir, 'workspace')
+        os.makedirs(self.build_dir)
+        self.test_object = ImageCache(10, self.cache_dir)
+
+    def build(self, name, size):
+        with open(os.path.join(self.build_dir, name), 'wb') as image_file:
+            image_file.write(b'x' * size)
+
+    def test_key(self):
+        script = os.path.join(self.temp_dir, 'script.sh')
+        with open(script, 'w') as script_file:
+            script_file.write('echo build')
+
+        key = ImageCache.key({'revision': 'abc', 'arch': 'amd64'}, [script])
+        self.assertEqual(
+            ImageCache.key({'arch': 'amd64', 'revision': 'abc'}, [script]),
+            key)
+        self.assertNotEqual(
+            ImageCache.key({'revision': 'abd', 'arch': 'amd64'}, [script]),
+            key)
+
+        with open(script, 'w') as script_file:
+            script_file.write('echo build again')
+        self.assertNotEqual(
+            ImageCache.key({'revision': 'abc', 'arch': 'amd64'}, [script]),
+            key)
+
+    def test_store_lookup(self):
+        self.assertIsNone(self.test_object.lookup('key1'))
+
+        self.build('other.img', 1)
+        self.build('test-image.img', 4)
+        build_dir = self.test_object.store('key1', 'test-image',
+                                           self.build_dir)
+        self.assertEqual(build_dir, os.path.join(self.cache_dir, 'key1'))
+        self.assertEqual(os.listdir(build_dir), ['test-image.img'])
+        self.assertEqual(self.test_object.lookup('key1'), build_dir)
+
+        # the build may be removed or modified, the cache keeps its copy
+        os.remove(os.path.join(self.build_dir, 'test-image.img'))
+        self.assertEqual(self.test_object.lookup('key1'), build_dir)
+
+        os.remove(os.path.join(build_dir, 'test-image.img'))
+        self.assertIsNone(self.test_object.lookup('key1'))
+
+    def test_store_missing(self):
+        with self.assertRaises(OSError):
+            self.test_object.store('key1', 'test-image', self.build_dir)
+
+    @mock.patch('harbinger.common.image_cache.time.time')
+    def test_evict(self, mock_time):
+        for used, key in enumerate(('key1', 'key2', 'key3')):
+            mock_time.return_value = used
+            self.build(key + '.img', 4)
+            self.test_object.store(key, key, self.build_dir)
+
+        # key1 was the least recently used when key3 needed room
+        self.assertIsNone(self.test_object.lookup('key1'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir,
+                                                     'key1')))
+
+        mock_time.return_value = 3
+        self.assertIsNotNone(self.test_object.lookup('key2'))
+        mock_time.return_value = 4
+        self.build('key4.img', 4)
+        self.test_object.store('key4', 'key4', self.build_dir)
+        self.assertIsNone(self.test_object.lookup('key3'))
+        self.assertIsNotNone(self.test_object.lookup('key2'))
+        self.assertIsNotNone(self.test_object.lookup('key4'))
+
+    def test_evict_oversized(self):
+        self.build('big.img', 20)
+        build_dir = self.test_object.store('key1', 'big', self.build_dir)
+        # the image just built is kept even if it alone fills the cache
+        self.assertEqual(self.test_object.lookup('key1'), build_dir)
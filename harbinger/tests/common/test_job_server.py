@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from harbinger.common.job_server import JobClient
+from harbinger.common.job_server import JobServer
+from harbinger.common.jobs import JobQueue
+from harbinger.common.jobs import PASSED
+
+
+class TestJobServer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.socket_path = os.path.join(self.temp_dir, 'run', 'test.sock')
+        self.queue = JobQueue(os.path.join(self.temp_dir, 'jobs'))
+        self.server = JobServer(self.socket_path, self.queue)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = JobClient(self.socket_path)
+
+    def test_submit_and_watch(self):
+        answer = self.client.submit('yaml', 'abc')
+        self.assertEqual(answer['position'], 0)
+        self.assertEqual(answer['job']['resume'], 'abc')
+        self.assertEqual([job['job'] for job in self.client.list()],
+                         [answer['job']['job']])
+
+        job = self.queue.claim()
+        threading.Timer(0.05, self.queue.finish,
+                        [job, PASSED, None, 'def']).start()
+        answers = list(self.client.watch(job.job_id))
+        self.assertEqual(answers[-2], {'event': {
+            'state': PASSED, 'result': None, 'run_id': 'def'}})
+        self.assertEqual(answers[-1]['job']['state'], PASSED)
+
+    def test_errors(self):
+        with self.assertRaises(RuntimeError) as context:
+            list(self.client.request({'action': 'dance'}))
+        self.assertEqual(str(context.exception),
+                         'RuntimeError: Unknown action dance')
+        self.assertRaises(RuntimeError, list, self.client.watch('missing'))
+
+    def test_already_running(self):
+        self.assertTrue(self.client.alive())
+        self.assertRaises(RuntimeError, JobServer, self.socket_path,
+                          self.queue)
+
+    def test_server_close(self):
+        self.server.server_close()
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(self.client.alive())
+        self.assertRaises(RuntimeError, self.client.list)
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from harbinger.common.jobs import FAILED
+from harbinger.common.jobs import JobQueue
+from harbinger.common.jobs import QUEUED
+from harbinger.common.jobs import RUNNING
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.jobs_dir = os.path.join(self.temp_dir, 'jobs')
+        self.test_object = JobQueue(self.jobs_dir)
+        self.test_object.POLL = 0.01
+
+    def test_submit(self):
+        job = self.test_object.submit('Options: {}\n', resume='abc')
+        self.assertEqual(job.state, QUEUED)
+        with open(job.yaml_path) as yaml_file:
+            self.assertEqual(yaml_file.read(), 'Options: {}\n')
+
+        # the job is stored, another queue on the same database sees it
+        stored = JobQueue(self.jobs_dir).get(job.job_id)
+        self.assertEqual(stored.to_dict(), job.to_dict())
+        self.assertEqual(stored.resume, 'abc')
+        self.assertRaises(RuntimeError, self.test_object.get, 'missing')
+
+    def test_claim(self):
+        self.assertIsNone(self.test_object.claim(timeout=0))
+        nightly = self.test_object.submit('nightly', priority=-1)
+        first = self.test_object.submit('first')
+        gating = self.test_object.submit('gating', priority=10)
+        second = self.test_object.submit('second')
+        self.assertEqual(self.test_object.position(gating), 0)
+        self.assertEqual(self.test_object.position(second), 2)
+        self.assertEqual(self.test_object.position(nightly), 3)
+
+        claimed = [self.test_object.claim().job_id for _ in range(4)]
+        self.assertEqual(claimed, [gating.job_id, first.job_id,
+                                   second.job_id, nightly.job_id])
+        self.assertIsNone(self.test_object.claim(timeout=0.01))
+
+        job = self.test_object.get(first.job_id)
+        self.assertEqual(job.state, RUNNING)
+        self.assertEqual(job.owner, os.getpid())
+        self.assertEqual(job.run_id, first.job_id)
+        self.assertEqual([item.job_id for item in self.test_object.list()],
+                         [nightly.job_id, first.job_id, gating.job_id,
+                          second.job_id])
+
+    def test_claim_once(self):
+        jobs = set(self.test_object.submit(str(index)).job_id
+                   for index in range(20))
+        claimed = []
+
+        def claim():
+            queue = JobQueue(self.jobs_dir)
+            while True:
+                job = queue.claim(timeout=0)
+                if job is None:
+                    return
+                claimed.append(job.job_id)
+
+        threads = [threading.Thread(target=claim) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), sorted(jobs))
+
+    @mock.patch('harbinger.common.jobs.RunJournal')
+    @mock.patch.object(JobQueue, '_alive')
+    def test_recover(self, mock_alive, mock_journal):
+        journaled = self.test_object.submit('journaled')
+        lost = self.test_object.submit('lost')
+        alive = self.test_object.submit('alive')
+        for _ in range(3):
+            self.test_object.claim()
+
+        mock_alive.side_effect = lambda pid: False
+        mock_journal.side_effect = lambda run_id: mock.Mock(**{
+            'exists.return_value': run_id == journaled.job_id})
+        self.test_object.finish(self.test_object.get(alive.job_id), FAILED)
+
+        self.assertEqual(sorted(self.test_object.recover()),
+                         sorted([journaled.job_id, lost.job_id]))
+        journaled = self.test_object.get(journaled.job_id)
+        self.assertEqual(journaled.state, QUEUED)
+        self.assertEqual(journaled.resume, journaled.job_id)
+        self.assertIsNone(self.test_object.get(lost.job_id).resume)
+        self.assertEqual(self.test_object.get(alive.job_id).state, FAILED)
+
+        self.test_object.claim()
+        mock_alive.side_effect = lambda pid: True
+        self.assertEqual(self.test_object.recover(), [])
+
+    def test_alive(self):
+        self.assertTrue(JobQueue._alive(os.getpid()))
+        with mock.patch('harbinger.common.jobs.os.kill') as mock_kill:
+            mock_kill.side_effect = ProcessLookupError()
+            self.assertFalse(JobQueue._alive(1234567))
+
+    def test_watch(self):
+        self.test_object.submit('yaml')
+        job = self.test_object.claim()
+
+        def finish():
+            self.test_object.log(job, 'test_log')
+            self.test_object.finish(job, FAILED, 'test_error')
+
+        threading.Timer(0.05, finish).start()
+        events = list(self.test_object.watch(job.job_id))
+        self.assertEqual(events, [
+            {'state': QUEUED},
+            {'state': RUNNING},
+            {'log': 'test_log'},
+            {'state': FAILED, 'result': 'test_error', 'run_id': job.job_id},
+        ])
+
+    def test_events(self):
+        self.test_object.MAX_EVENTS = 2
+        job = self.test_object.submit('yaml')
+        for index in range(3):
+            self.test_object.log(job, 'log %s' % index)
+        job_events = self.test_object.events[job.job_id]
+        self.assertEqual(job_events.count, 4)
+        self.assertEqual(job_events.since(0),
+                         [{'log': 'log 1'}, {'log': 'log 2'}])
+        self.assertEqual(job_events.since(3), [{'log': 'log 2'}])
+
+        # the events of a finished job nobody watches are dropped
+        self.test_object.finish(job, FAILED, 'test_error')
+        self.assertEqual(self.test_object.events, {})
+
+        # a late watcher gets the state from the database
+        events = list(self.test_object.watch(job.job_id))
+        self.assertEqual(events, [
+            {'state': FAILED, 'result': 'test_error', 'run_id': None}])
+        self.assertEqual(self.test_object.events, {})
+
+    def test_watch_closed(self):
+        job = self.test_object.submit('yaml')
+        events = self.test_object.watch(job.job_id)
+        self.assertEqual(next(events), {'state': QUEUED})
+        self.assertEqual(self.test_object.events[job.job_id].watchers, 1)
+
+        # the watcher went away before the job finished
+        events.close()
+        self.assertEqual(self.test_object.events[job.job_id].watchers, 0)
+        self.test_object.finish(job, FAILED)
+        self.assertEqual(self.test_object.events, {})
+
+    def test_watch_other_daemon(self):
+        job = self.test_object.submit('yaml')
+        other = JobQueue(self.jobs_dir)
+        other.POLL = 0.01
+
+        def run():
+            claimed = self.test_object.claim()
+            self.test_object.finish(claimed, FAILED, 'test_error')
+
+        threading.Timer(0.05, run).start()
+        events = list(other.watch(job.job_id))
+        self.assertEqual(events[0]['state'], QUEUED)
+        self.assertEqual(events[-1], {
+            'state': FAILED, 'result': 'test_error', 'run_id': job.job_id})
+        self.assertEqual(other.events, {})
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from harbinger.common.journal import COMPLETED
+from harbinger.common.journal import RunJournal
+from harbinger.common.journal import RUNNING
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.journal_path = os.path.join(self.temp_dir, 'runs', 'abc.json')
+        self.test_object = RunJournal('abc', journal_path=self.journal_path)
+
+    def test_new_run_id(self):
+        self.assertEqual(len(RunJournal.new_run_id()), 8)
+        self.assertNotEqual(RunJournal.new_run_id(), RunJournal.new_run_id())
+
+    def test_unit_name(self):
+        self.assertEqual(RunJournal.unit_name('shaker'), 'shaker')
+        self.assertEqual(RunJournal.unit_name('shaker', 'east'),
+                         'shaker@east')
+
+    def test_create(self):
+        self.assertFalse(self.test_object.exists())
+        self.test_object.create('test.yaml')
+        self.assertTrue(self.test_object.exists())
+        journal = self.test_object.load()
+        self.assertEqual(journal['run_id'], 'abc')
+        self.assertEqual(journal['yaml'], 'test.yaml')
+        self.assertEqual(journal['units'], {})
+        # there is no yaml to compare a resumed run with
+        self.assertIsNone(journal['yaml_digest'])
+        self.assertTrue(self.test_object.matches('other.yaml'))
+
+    def test_matches(self):
+        yaml_path = os.path.join(self.temp_dir, 'test.yaml')
+        with open(yaml_path, 'w') as yaml_file:
+            yaml_file.write('frameworks: {}\n')
+        self.test_object.create(yaml_path)
+        self.assertTrue(self.test_object.matches(yaml_path))
+
+        # a copy of the same yaml resumes the run, e.g. a submitted job
+        copy_path = os.path.join(self.temp_dir, 'copy.yaml')
+        shutil.copyfile(yaml_path, copy_path)
+        self.assertTrue(self.test_object.matches(copy_path))
+
+        other_path = os.path.join(self.temp_dir, 'other.yaml')
+        with open(other_path, 'w') as yaml_file:
+            yaml_file.write('frameworks: {shaker: {}}\n')
+        self.assertFalse(self.test_object.matches(other_path))
+        self.assertFalse(self.test_object.matches(None))
+
+    def test_set_state(self):
+        self.test_object.create('test.yaml')
+        self.assertIsNone(self.test_object.state('shaker'))
+
+        self.test_object.set_state('shaker', RUNNING)
+        self.test_object.set_state('shaker', COMPLETED, 1)
+        self.assertEqual(self.test_object.state('shaker'), RUNNING)
+        self.assertFalse(self.test_object.completed('shaker'))
+        self.assertTrue(self.test_object.completed('shaker', 1))
+        self.assertFalse(self.test_object.completed('shaker', 0))
+
+        self.test_object.set_state('shaker', COMPLETED)
+        self.assertTrue(
+            RunJournal('abc', self.journal_path).completed('shaker'))
+
+    def test_shard_groups(self):
+        self.test_object.create('test.yaml')
+        self.assertIsNone(self.test_object.shard_groups('shaker'))
+        self.test_object.set_shard_groups('shaker', [['t1'], ['t2']])
+        self.assertEqual(self.test_object.shard_groups('shaker'),
+                         [['t1'], ['t2']])
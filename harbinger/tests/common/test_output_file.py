@@ -0,0 +1,88 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from harbinger.common import output_file
+from harbinger.common.output_file import OutputFile
+
+
+class TestOutputFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, 'shaker-output.log')
+
+    def test_write(self):
+        # every command appends to the file
+        for command in ('first', 'second'):
+            test_object = OutputFile(self.path)
+            test_object.write('stdout', [command, 'done'])
+            test_object.close()
+
+        self.assertEqual(test_object.path, self.path)
+        with open(self.path) as log_file:
+            self.assertEqual(log_file.read(),
+                             'first\ndone\nsecond\ndone\n')
+
+    def test_write_gzip(self):
+        for command in ('first', 'second'):
+            test_object = OutputFile(self.path, 'gzip')
+            test_object.write('stderr', [command])
+            test_object.close()
+
+        self.assertEqual(test_object.path, self.path + '.gz')
+        with gzip.open(test_object.path) as log_file:
+            self.assertEqual(log_file.read(), b'first\nsecond\n')
+
+    @unittest.skipIf(output_file.zstandard is None,
+                     'zstandard is not installed')
+    def test_write_zstd(self):
+        test_object = OutputFile(self.path, 'zstd')
+        test_object.write('stdout', ['first'])
+        test_object.close()
+
+        self.assertEqual(test_object.path, self.path + '.zst')
+        with open(test_object.path, 'rb') as log_file:
+            reader = output_file.zstandard.ZstdDecompressor().stream_reader(
+                log_file)
+            self.assertEqual(reader.read(), b'first\n')
+
+    def test_rotate(self):
+        test_object = OutputFile(self.path, rotate_size=10, rotate_count=2)
+        for index in range(4):
+            test_object.write('stdout', ['line %s...' % index])
+        test_object.write('stdout', ['last'])
+        test_object.close()
+
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ['shaker-output.log', 'shaker-output.log.1',
+                          'shaker-output.log.2'])
+        with open(self.path + '.2') as log_file:
+            self.assertEqual(log_file.read(), 'line 2...\n')
+        with open(self.path) as log_file:
+            self.assertEqual(log_file.read(), 'last\n')
+
+        # without older files to keep the output starts over
+        test_object = OutputFile(self.path, rotate_size=10, rotate_count=0)
+        test_object.write('stdout', ['line 4...'])
+        test_object.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_compression(self):
+        with self.assertRaises(RuntimeError) as context:
+            OutputFile(self.path, 'bzip2')
+        self.assertEqual(str(context.exception),
+                         'output_compression must be one of gzip, none, '
+                         'zstd, got bzip2')
+
+        with mock.patch.object(output_file, 'zstandard', None):
+            with self.assertRaises(RuntimeError) as context:
+                OutputFile(self.path, 'zstd')
+        self.assertEqual(str(context.exception),
+                         'output_compression zstd needs the zstandard '
+                         'package')
+        self.assertEqual(os.listdir(self.temp_dir), [])
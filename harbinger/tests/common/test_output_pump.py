@@ -0,0 +1,119 @@
+import subprocess
+import sys
+import unittest
+
+import mock
+from testfixtures import log_capture
+
+from harbinger.common.output_pump import LogSink
+from harbinger.common.output_pump import OutputPump
+from harbinger.common.output_pump import TailSink
+
+
+class TestOutputPump(unittest.TestCase):
+    def popen(self, script):
+        return subprocess.Popen([sys.executable, '-c', script],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+    def test_run(self):
+        sink = mock.Mock()
+        on_output = mock.Mock()
+        popen = self.popen(
+            'import sys\n'
+            'sys.stdout.write("one\\ntw")\n'
+            'sys.stdout.flush()\n'
+            'sys.stderr.write("warning\\n")\n'
+            'sys.stderr.flush()\n'
+            'sys.stdout.write("o\\n\\nthree")\n'
+            'sys.exit(3)\n')
+        result = OutputPump(popen, [sink], on_output).run('test_command')
+
+        self.assertEqual(result.command, 'test_command')
+        self.assertEqual(result.returncode, 3)
+        self.assertGreaterEqual(result.duration, 0)
+        self.assertEqual(result.bytes, {'stdout': 14, 'stderr': 8})
+        self.assertEqual(result.lines, {'stdout': 4, 'stderr': 1})
+        on_output.assert_called()
+        sink.close.assert_called_once_with()
+
+        # lines split across chunks are put back together
+        lines = {}
+        for (stream, chunk), _ in sink.write.call_args_list:
+            lines.setdefault(stream, []).extend(chunk)
+        self.assertEqual(lines, {'stdout': ['one', 'two', '', 'three'],
+                                 'stderr': ['warning']})
+        self.assertIn('returned 3', repr(result))
+
+    def test_run_large(self):
+        sink = mock.Mock()
+        popen = self.popen('for i in range(100000): print(i)')
+        result = OutputPump(popen, [sink]).run()
+        self.assertEqual(result.lines['stdout'], 100000)
+
+        lines = []
+        for (stream, chunk), _ in sink.write.call_args_list:
+            lines.extend(chunk)
+        self.assertEqual(lines, [str(i) for i in range(100000)])
+
+    def test_run_no_line_break(self):
+        sink = mock.Mock()
+        popen = self.popen(
+            'import sys\n'
+            'for i in range(10): sys.stdout.write("." * 1000); '
+            'sys.stdout.flush()\n'
+            'sys.stdout.write("\\ndone\\n")\n')
+        test_object = OutputPump(popen, [sink])
+        test_object.CHUNK_SIZE = 4096
+        test_object.run()
+
+        # the output held back never grows past CHUNK_SIZE
+        lines = []
+        for (stream, chunk), _ in sink.write.call_args_list:
+            lines.extend(chunk)
+        self.assertGreater(len(lines), 3)
+        self.assertTrue(all(len(line) < 2 * 4096 for line in lines))
+        self.assertEqual(''.join(lines[:-1]), '.' * 10000)
+        self.assertEqual(lines[-1], 'done')
+
+    def test_run_undecodable(self):
+        sink = mock.Mock()
+        popen = self.popen('import sys; sys.stdout.buffer.write(b"\\xff\\n")')
+        OutputPump(popen, [sink]).run()
+        sink.write.assert_called_once_with('stdout', ['�'])
+
+    @log_capture()
+    def test_log_sink(self, capture):
+        LogSink().write('stdout', ['one', 'two  '])
+        capture.check(('harbinger.common.output_pump', 'INFO', 'one\ntwo'))
+        self.assertTrue(capture.records[0].plainOutput)
+
+
+class TestTailSink(unittest.TestCase):
+    def test_write(self):
+        sink = TailSink(10)
+        sink.write('stdout', ['one', 'two'])
+        self.assertEqual(sink.text(), 'one\ntwo')
+        self.assertFalse(sink.dropped)
+
+        sink.write('stderr', ['three'])
+        self.assertEqual(sink.text(), 'two\nthree')
+        self.assertTrue(sink.dropped)
+        self.assertLessEqual(sink.size, 10)
+
+        # a long line keeps its end, a large chunk only its last lines
+        sink.write('stdout', ['0123456789abcdef'])
+        self.assertEqual(sink.text(), '789abcdef')
+        sink.write('stdout', [str(i) for i in range(100000)])
+        self.assertEqual(sink.text(), '99999')
+
+    def test_run(self):
+        sink = TailSink(1024)
+        popen = subprocess.Popen(
+            [sys.executable, '-c',
+             'for i in range(100000): print("line", i)'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        OutputPump(popen, [sink]).run()
+        # the memory used does not grow with the output
+        self.assertLessEqual(sink.size, 1024)
+        self.assertTrue(sink.text().endswith('line 99998\nline 99999'))
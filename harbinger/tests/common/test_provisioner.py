@@ -0,0 +1,76 @@
+import subprocess
+import threading
+import unittest
+
+import mock
+from testfixtures import log_capture
+
+from harbinger.common.cancellation import ProcessGroups
+from harbinger.common.provisioner import Provisioner
+
+
+class TestProvisioner(unittest.TestCase):
+    @log_capture()
+    def test_wait(self, capture):
+        started = threading.Event()
+        release = threading.Event()
+
+        def provision(name):
+            started.set()
+            release.wait(5)
+            if name == 'broken':
+                raise RuntimeError('no quota')
+
+        test_object = Provisioner(provision, 2)
+        self.addCleanup(test_object.stop)
+        test_object.submit('shaker', ('shaker',))
+        test_object.submit('broken', ('broken',))
+        self.assertTrue(started.wait(5))
+        release.set()
+
+        test_object.wait('shaker')
+        # a failure is left for the framework to meet again
+        test_object.wait_all()
+        test_object.wait('unknown')
+        capture.check_present(
+            ('harbinger.common.provisioner', 'INFO',
+             'Resources of shaker are ready'),
+            ('harbinger.common.provisioner', 'WARNING',
+             'Provisioning broken failed: no quota'))
+        self.assertEqual(test_object.results, {})
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(3, timeout=5)
+        test_object = Provisioner(lambda: barrier.wait(), 3)
+        self.addCleanup(test_object.stop)
+        for name in ('a', 'b', 'c'):
+            test_object.submit(name, ())
+        # the three only get past the barrier when they run at once
+        with mock.patch('harbinger.common.provisioner.LOG') as mock_log:
+            test_object.wait_all()
+        mock_log.warning.assert_not_called()
+
+    def test_stop(self):
+        started = threading.Event()
+        provisioned = []
+
+        def provision(name):
+            popen = subprocess.Popen(['sleep', '30'], start_new_session=True)
+            ProcessGroups.add(popen)
+            try:
+                started.set()
+                popen.wait()
+            finally:
+                ProcessGroups.remove(popen)
+            provisioned.append((name, popen.returncode))
+
+        test_object = Provisioner(provision, 1)
+        for name in ('a', 'b'):
+            test_object.submit(name, (name,))
+        self.assertTrue(started.wait(5))
+
+        # the upload of a is killed, b is not provisioned
+        test_object.stop()
+        self.assertEqual(len(provisioned), 1)
+        self.assertEqual(provisioned[0][0], 'a')
+        self.assertLess(provisioned[0][1], 0)
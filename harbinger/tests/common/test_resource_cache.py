@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from harbinger.common.resource_cache import FLAVORS
+from harbinger.common.resource_cache import IMAGES
+from harbinger.common.resource_cache import ResourceCache
+
+
+class TestResourceCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.cache_path = os.path.join(self.temp_dir, 'resources',
+                                       'project.json')
+        self.test_object = ResourceCache('auth_url/project', 60, 'run1',
+                                         cache_path=self.cache_path)
+
+    def test_cache_path(self):
+        with mock.patch('harbinger.common.resource_cache.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = self.temp_dir
+            first = ResourceCache('auth_url/project', 60)
+            self.assertEqual(os.path.dirname(first.cache_path),
+                             os.path.join(self.temp_dir, 'resources'))
+            self.assertEqual(
+                ResourceCache('auth_url/project', 60).cache_path,
+                first.cache_path)
+            self.assertNotEqual(
+                ResourceCache('auth_url/other', 60).cache_path,
+                first.cache_path)
+
+    def test_lookup(self):
+        self.assertIsNone(self.test_object.lookup(IMAGES))
+
+        self.test_object.store(IMAGES, {'image': 'id1'})
+        self.assertEqual(self.test_object.lookup(IMAGES), {'image': 'id1'})
+        self.assertIsNone(self.test_object.lookup(FLAVORS))
+
+        # another run finds them too while they are fresh
+        other = ResourceCache('auth_url/project', 60, 'run2',
+                              cache_path=self.cache_path)
+        self.assertEqual(other.lookup(IMAGES), {'image': 'id1'})
+
+    @mock.patch('harbinger.common.resource_cache.time.time')
+    def test_lookup_expired(self, mock_time):
+        mock_time.return_value = 1000
+        self.test_object.store(IMAGES, {'image': 'id1'})
+
+        mock_time.return_value = 1060
+        self.assertEqual(self.test_object.lookup(IMAGES), {'image': 'id1'})
+        mock_time.return_value = 1061
+        self.assertIsNone(self.test_object.lookup(IMAGES))
+
+    def test_refresh(self):
+        list_resources = mock.Mock(return_value={'image': 'id1'})
+        self.assertEqual(self.test_object.refresh(IMAGES, list_resources),
+                         {'image': 'id1'})
+        self.assertEqual(self.test_object.refresh(IMAGES, list_resources),
+                         {'image': 'id1'})
+        list_resources.assert_called_once_with()
+
+        # the next run lists them again
+        list_resources.return_value = {'image': 'id2'}
+        other = ResourceCache('auth_url/project', 60, 'run2',
+                              cache_path=self.cache_path)
+        self.assertEqual(other.refresh(IMAGES, list_resources),
+                         {'image': 'id2'})
+        self.assertEqual(list_resources.call_count, 2)
+
+    def test_invalidate(self):
+        self.test_object.store(IMAGES, {'image': 'id1'})
+        self.test_object.store(FLAVORS, {'flavor': 'id2'})
+        self.test_object.invalidate(IMAGES)
+        self.assertIsNone(self.test_object.lookup(IMAGES))
+        self.assertEqual(self.test_object.lookup(FLAVORS), {'flavor': 'id2'})
@@ -0,0 +1,161 @@
+import unittest
+
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.scheduler import DependencyError
+from harbinger.common.scheduler import Scheduler
+
+
+class FakePool():
+    """runs units when told to, so admission order can be inspected"""
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self.max_running = 0
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        self.started.append(args[0])
+        self.max_running = max(self.max_running, self.scheduler.running)
+        try:
+            result = func(*args)
+        except Exception as ex:
+            error_callback(ex)
+        else:
+            callback(result)
+
+
+class TestScheduler(unittest.TestCase):
+    def test_fits(self):
+        test_object = Scheduler({'vms': 10}, 2)
+        self.assertTrue(test_object.fits({'vms': 20}))
+
+        test_object.acquire('a', {'vms': 6})
+        self.assertTrue(test_object.fits({'vms': 4}))
+        self.assertFalse(test_object.fits({'vms': 5}))
+        self.assertTrue(test_object.fits({'ram': 1024}))
+
+        test_object.acquire('b', {'vms': 1})
+        self.assertFalse(test_object.fits({}))
+
+        test_object.release({'vms': 6})
+        self.assertEqual(test_object.in_use, {'vms': 1})
+        self.assertEqual(test_object.running, 1)
+
+    def test_run(self):
+        test_object = Scheduler({'vms': 10})
+        pool = FakePool(test_object)
+        test_object.add('heavy', {'vms': 8}, 'heavy')
+        test_object.add('light', {'vms': 2}, 'light')
+        test_object.add('broken', None, 'broken')
+
+        def func(name):
+            if name == 'broken':
+                raise RuntimeError(name)
+            return name + '-done'
+
+        results = test_object.run(pool, func)
+
+        self.assertEqual(pool.started, ['heavy', 'light', 'broken'])
+        self.assertEqual(results['heavy'], 'heavy-done')
+        self.assertEqual(results['light'], 'light-done')
+        self.assertIsInstance(results['broken'], RuntimeError)
+        self.assertEqual(test_object.running, 0)
+        self.assertEqual(test_object.in_use, {'vms': 0})
+
+    def test_run_max_parallel(self):
+        test_object = Scheduler(max_parallel=1)
+        pool = FakePool(test_object)
+        for name in ['a', 'b', 'c']:
+            test_object.add(name, None, name)
+
+        results = test_object.run(pool, lambda name: name)
+
+        self.assertEqual(list(results.values()), ['a', 'b', 'c'])
+        self.assertEqual(pool.max_running, 1)
+
+    def test_order(self):
+        test_object = Scheduler()
+        test_object.add('data_plane', None, None, ['warmup'])
+        test_object.add('independent', None, None)
+        test_object.add('warmup', None, None)
+        test_object.add('report', None, None, ['data_plane', 'independent'])
+        self.assertEqual(test_object.order(),
+                         ['independent', 'warmup', 'data_plane', 'report'])
+
+    def test_order_unknown(self):
+        test_object = Scheduler()
+        test_object.add('a', None, None, ['missing'])
+        with self.assertRaises(RuntimeError) as context:
+            test_object.order()
+        self.assertIn('a -> missing', str(context.exception))
+
+    def test_order_cycle(self):
+        test_object = Scheduler()
+        test_object.add('a', None, None, ['b'])
+        test_object.add('b', None, None, ['a'])
+        test_object.add('c', None, None)
+        with self.assertRaises(RuntimeError) as context:
+            test_object.order()
+        self.assertIn('dependency cycle', str(context.exception))
+
+    def test_run_dependencies(self):
+        test_object = Scheduler()
+        pool = FakePool(test_object)
+        test_object.add('after_broken', None, 'after_broken', ['broken'])
+        test_object.add('broken', None, 'broken')
+        test_object.add('after_after', None, 'after_after', ['after_broken'])
+        test_object.add('warmup', None, 'warmup')
+        test_object.add('data_plane', None, 'data_plane', ['warmup'])
+
+        def func(name):
+            if name == 'broken':
+                raise RuntimeError(name)
+            return name
+
+        results = test_object.run(pool, func)
+
+        self.assertEqual(pool.started, ['broken', 'warmup', 'data_plane'])
+        self.assertIsInstance(results['broken'], RuntimeError)
+        self.assertIsInstance(results['after_broken'], DependencyError)
+        self.assertIsInstance(results['after_after'], DependencyError)
+        self.assertEqual(results['data_plane'], 'data_plane')
+
+    def test_run_completed(self):
+        test_object = Scheduler()
+        pool = FakePool(test_object)
+        test_object.add('first', None, 'first')
+        test_object.add('second', None, 'second', ['first'])
+        test_object.mark_completed('first', 'resumed')
+
+        results = test_object.run(pool, lambda name: name)
+
+        self.assertEqual(pool.started, ['second'])
+        self.assertEqual(list(results.items()),
+                         [('first', 'resumed'), ('second', 'second')])
+
+    def test_run_cancelled(self):
+        test_object = Scheduler(max_parallel=1)
+        pool = FakePool(test_object)
+        test_object.add('first', None, 'first')
+        test_object.add('second', None, 'second')
+
+        def func(name):
+            test_object.cancel(10)
+            raise Cancelled(name)
+
+        results = test_object.run(pool, func)
+
+        self.assertEqual(pool.started, ['first'])
+        self.assertIsInstance(results['first'], Cancelled)
+        self.assertIsInstance(results['second'], Cancelled)
+
+    def test_run_cancelled_grace(self):
+        test_object = Scheduler()
+        test_object.add('hung', None, 'hung')
+
+        class HungPool():
+            def apply_async(self, func, args, callback=None,
+                            error_callback=None):
+                test_object.cancel(0.1)
+
+        results = test_object.run(HungPool(), None)
+        self.assertIn('did not stop', str(results['hung']))
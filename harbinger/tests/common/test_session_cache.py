@@ -0,0 +1,102 @@
+import datetime
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+from keystoneauth1 import access
+from keystoneauth1.identity.generic import password
+
+from harbinger.common.session_cache import CachedPassword
+from harbinger.common.session_cache import SessionCache
+
+
+def auth_ref(token, expires_in):
+    expires_at = datetime.datetime.utcnow() + \
+        datetime.timedelta(seconds=expires_in)
+    return access.create(
+        body={'token': {'expires_at': expires_at.isoformat() + 'Z',
+                        'methods': ['password']}},
+        auth_token=token)
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.addCleanup(SessionCache.reset)
+        SessionCache.reset()
+        self.creds = {'auth_url': 'http://keystone/v3',
+                      'username': 'user',
+                      'password': 'secret',  # nosec
+                      'project_name': 'project'}
+
+    def test_session(self):
+        first = SessionCache.session(self.temp_dir, **self.creds)
+        self.assertIs(SessionCache.session(self.temp_dir, **self.creds),
+                      first)
+        self.assertIsInstance(first.auth, CachedPassword)
+
+        self.creds['project_name'] = 'other_project'
+        self.assertIsNot(SessionCache.session(self.temp_dir, **self.creds),
+                         first)
+
+        SessionCache.reset()
+        self.assertIsNot(SessionCache.session(self.temp_dir, **self.creds),
+                         first)
+
+    def test_session_forked(self):
+        first = SessionCache.session(self.temp_dir, **self.creds)
+        # a forked worker gets sessions of its own
+        with mock.patch('harbinger.common.session_cache.os.getpid',
+                        return_value=SessionCache.pid + 1):
+            forked = SessionCache.session(self.temp_dir, **self.creds)
+            self.assertIsNot(forked, first)
+            self.assertIs(SessionCache.session(self.temp_dir, **self.creds),
+                          forked)
+
+    def test_cache_path(self):
+        auth = CachedPassword(self.temp_dir, **self.creds)
+        self.assertEqual(os.path.dirname(auth.cache_path), self.temp_dir)
+        self.assertNotIn('secret', auth.cache_path)
+        self.assertEqual(auth.cache_path,
+                         CachedPassword(self.temp_dir,
+                                        **self.creds).cache_path)
+
+        self.creds['password'] = 'changed'  # nosec
+        self.assertNotEqual(auth.cache_path,
+                            CachedPassword(self.temp_dir,
+                                           **self.creds).cache_path)
+
+    @mock.patch.object(password.Password, 'get_auth_ref')
+    def test_get_auth_ref(self, mock_get_auth_ref):
+        mock_get_auth_ref.return_value = auth_ref('token1', 3600)
+        auth = CachedPassword(self.temp_dir, **self.creds)
+
+        self.assertEqual(auth.get_auth_ref('session').auth_token, 'token1')
+        self.assertEqual(mock_get_auth_ref.call_count, 1)
+        self.assertEqual(stat.S_IMODE(os.stat(auth.cache_path).st_mode),
+                         0o600)
+
+        # another worker finds the token on disk
+        other = CachedPassword(self.temp_dir, **self.creds)
+        self.assertEqual(other.get_auth_ref('session').auth_token, 'token1')
+        self.assertEqual(mock_get_auth_ref.call_count, 1)
+
+    @mock.patch.object(password.Password, 'get_auth_ref')
+    def test_get_auth_ref_expiring(self, mock_get_auth_ref):
+        mock_get_auth_ref.side_effect = [auth_ref('token1', 60),
+                                         auth_ref('token2', 3600)]
+        auth = CachedPassword(self.temp_dir, **self.creds)
+        self.assertEqual(auth.get_auth_ref('session').auth_token, 'token1')
+
+        # the cached token expires within the refresh margin
+        other = CachedPassword(self.temp_dir, **self.creds)
+        self.assertEqual(other.get_auth_ref('session').auth_token, 'token2')
+        self.assertEqual(mock_get_auth_ref.call_count, 2)
+        self.assertEqual(
+            CachedPassword(self.temp_dir,
+                           **self.creds).get_auth_ref('session').auth_token,
+            'token2')
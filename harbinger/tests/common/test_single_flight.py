@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.single_flight import SingleFlight
+from harbinger.common.utils import Utils
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.lock_path = os.path.join(self.temp_dir, 'locks', 'image.json')
+
+    def _get_test_object(self):
+        return SingleFlight('cloud/images', 'image',
+                            lock_path=self.lock_path)
+
+    def test_lock_path(self):
+        with mock.patch('harbinger.common.single_flight.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = self.temp_dir
+            test_object = SingleFlight('cloud/images', 'image')
+            self.assertEqual(os.path.dirname(test_object.lock_path),
+                             os.path.join(self.temp_dir, 'locks'))
+            self.assertNotEqual(
+                SingleFlight('cloud/flavors', 'image').lock_path,
+                test_object.lock_path)
+
+    def test_run(self):
+        build = mock.Mock()
+        self.assertFalse(self._get_test_object().run(lambda: True, build))
+        build.assert_not_called()
+        self.assertFalse(os.path.exists(self.lock_path))
+
+        self.assertTrue(self._get_test_object().run(lambda: False, build))
+        build.assert_called_once_with()
+
+    def test_run_concurrent(self):
+        built = []
+
+        def build():
+            time.sleep(0.2)
+            built.append(True)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self._get_test_object().run(lambda: bool(built), build)))
+            for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(built, [True])
+        self.assertEqual(sorted(results), [False, False, True])
+
+    def test_run_failed(self):
+        started = threading.Event()
+
+        def build():
+            started.set()
+            time.sleep(0.2)
+            raise OSError('no space left')
+
+        errors = []
+
+        def run():
+            try:
+                self._get_test_object().run(lambda: False, build)
+            except Exception as ex:
+                errors.append(ex)
+
+        first = threading.Thread(target=run)
+        first.start()
+        started.wait()
+        # the workers waiting for the build get its error without building
+        waiting = threading.Thread(target=run)
+        waiting.start()
+        first.join()
+        waiting.join()
+        self.assertIsInstance(errors[0], OSError)
+        self.assertEqual(str(errors[1]),
+                         'Building image failed in another worker: '
+                         'OSError: no space left')
+
+        # a worker coming later, e.g. of a resumed run, tries again
+        retry = mock.Mock()
+        self.assertTrue(self._get_test_object().run(lambda: False, retry))
+        retry.assert_called_once_with()
+
+    def test_run_cancelled(self):
+        build = mock.Mock(side_effect=Cancelled('cancelled by signal 2'))
+        with self.assertRaises(Cancelled):
+            self._get_test_object().run(lambda: False, build)
+        self.assertIsNone(Utils.read_json(self.lock_path).get('error'))
+
+        build.side_effect = None
+        self.assertTrue(self._get_test_object().run(lambda: False, build))
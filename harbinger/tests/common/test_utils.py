@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -98,12 +100,75 @@ class TestUtils(unittest.TestCase):
                          'test_val')
         self.assertEqual(mock_conf.call_count, 0)
 
-    @mock.patch.object(os._Environ, '__setitem__')
+    @mock.patch('harbinger.common.utils.CONF')
+    @mock.patch('harbinger.executors.base.BaseExecutor')
+    def test_hierarchy_lookup_environment(self, mock_executor, mock_conf):
+        mock_executor.options = mock.MagicMock(spec=BaseFactory)
+        mock_executor.options.username = 'options_user'
+        mock_executor.environment = mock.MagicMock(spec=BaseFactory)
+        mock_executor.environment.username = 'target_user'
+        self.assertEqual(Utils.hierarchy_lookup(mock_executor, 'username'),
+                         'target_user')
+
+        mock_executor.framework.options_override = {'username': 'override'}
+        self.assertEqual(Utils.hierarchy_lookup(mock_executor, 'username'),
+                         'override')
+
     @mock.patch.object(Utils, 'hierarchy_lookup')
-    def test_source_openrc(self, mock_hierarchy, mock_setitem):
+    def test_openrc_environ(self, mock_hierarchy):
         mock_hierarchy.side_effect = [
-            'username', 'password', 'project_name', 'external_network'
+            'username', 'password', None, 'external_network'
         ]
-        Utils.source_openrc(None)
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(Utils.openrc_environ(None), {
+                'OS_USERNAME': 'username', 'OS_PASSWORD': 'password',
+                'EXTERNAL_NETWORK': 'external_network'})
+            self.assertEqual(len(os.environ), 0)
         self.assertEqual(mock_hierarchy.call_count, 4)
-        self.assertEqual(mock_setitem.call_count, 4)
+
+    def test_locked_json(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'sub', 'test.json')
+        self.assertEqual(Utils.read_json(path), {})
+
+        with Utils.locked_json(path) as document:
+            self.assertEqual(document, {})
+            document['key'] = 'value'
+        with Utils.locked_json(path) as document:
+            document['other'] = 1
+        self.assertEqual(Utils.read_json(path), {'key': 'value', 'other': 1})
+
+        with open(path, 'w') as json_file:
+            json_file.write('not json')
+        self.assertEqual(Utils.read_json(path), {})
+
+    def test_replace_file(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, 'image.img')
+        with open(path, 'w') as image_file:
+            image_file.write('old')
+        partials = []
+
+        def write(partial):
+            partials.append(partial)
+            # the file in place is left alone while it is written
+            with open(path) as image_file:
+                self.assertEqual(image_file.read(),
+                                 'new' if len(partials) > 1 else 'old')
+            with open(partial, 'w') as partial_file:
+                partial_file.write('new')
+
+        Utils.replace_file(path, write)
+        Utils.replace_file(path, write)
+        self.assertNotEqual(partials[0], partials[1])
+        self.assertEqual(os.listdir(temp_dir), ['image.img'])
+
+        def fail(partial):
+            raise OSError('disk full')
+
+        self.assertRaises(OSError, Utils.replace_file, path, fail)
+        self.assertEqual(os.listdir(temp_dir), ['image.img'])
+        with open(path) as image_file:
+            self.assertEqual(image_file.read(), 'new')
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from harbinger.common.virtualenv import VirtualEnv
+
+
+class TestVirtualEnv(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.test_object = VirtualEnv(self.temp_dir)
+        os.makedirs(self.test_object.bin_dir)
+
+    def test_get(self):
+        venv = VirtualEnv.get(self.temp_dir)
+        self.assertIs(VirtualEnv.get(self.temp_dir), venv)
+        self.assertIsNot(VirtualEnv.get(self.temp_dir + '/other'), venv)
+        self.assertEqual(venv.bin_dir, os.path.join(self.temp_dir, 'bin'))
+
+    def test_environ(self):
+        base = {'PATH': '/usr/bin', 'PYTHONHOME': '/usr', 'OS_CLOUD': 'a'}
+        environ = self.test_object.environ(base)
+        self.assertEqual(environ, {
+            'PATH': self.test_object.bin_dir + ':/usr/bin',
+            'VIRTUAL_ENV': self.temp_dir,
+            'OS_CLOUD': 'a'})
+        # base is left as it was
+        self.assertEqual(base['PATH'], '/usr/bin')
+        self.assertIn('PYTHONHOME', base)
+
+    def test_resolve(self):
+        program = os.path.join(self.test_object.bin_dir, 'yardstick')
+        path = self.test_object.bin_dir + ':/usr/bin'
+        self.assertEqual(self.test_object.resolve('yardstick', path),
+                         'yardstick')
+
+        open(program, 'w').close()
+        os.chmod(program, 0o755)
+        self.assertEqual(self.test_object.resolve('yardstick', path),
+                         program)
+        self.assertEqual(self.test_object.resolve('./yardstick', path),
+                         './yardstick')
+
+        # resolved once
+        os.remove(program)
+        self.assertEqual(self.test_object.resolve('yardstick', path),
+                         program)
@@ -0,0 +1,49 @@
+import subprocess
+import unittest
+
+import mock
+
+from harbinger.common.watchdog import STALL
+from harbinger.common.watchdog import Watchdog
+from harbinger.common.watchdog import WALL_CLOCK
+
+
+class TestWatchdog(unittest.TestCase):
+    @mock.patch('harbinger.common.watchdog.time.monotonic')
+    def test_expired(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        test_object = Watchdog(mock.Mock(), timeout=60, stall_timeout=10)
+        self.assertIsNone(test_object.expired())
+
+        mock_monotonic.return_value = 111
+        self.assertEqual(test_object.expired(), STALL)
+        test_object.feed()
+        self.assertIsNone(test_object.expired())
+
+        mock_monotonic.return_value = 161
+        self.assertEqual(test_object.expired(), WALL_CLOCK)
+
+    def test_start_disabled(self):
+        test_object = Watchdog(mock.Mock())
+        test_object.start()
+        self.assertIsNone(test_object.thread)
+        test_object.stop()
+
+    def test_kill_process_group(self):
+        popen = subprocess.Popen(['/bin/sh', '-c', 'sleep 30 & sleep 30'],
+                                 start_new_session=True)
+        self.addCleanup(popen.wait)
+        test_object = Watchdog(popen, timeout=0.1, grace=1, interval=0.05)
+        test_object.start()
+        popen.wait(timeout=10)
+        test_object.stop()
+        self.assertEqual(test_object.reason, WALL_CLOCK)
+        self.assertIn('running for 0.1 seconds',
+                      test_object.describe('sleep'))
+
+    def test_describe(self):
+        test_object = Watchdog(mock.Mock(), timeout=60, stall_timeout=10)
+        test_object.reason = STALL
+        self.assertEqual(test_object.describe('cmd'),
+                         'command <cmd> was killed after 10 seconds '
+                         'without output')
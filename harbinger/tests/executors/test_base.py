@@ -1,11 +1,22 @@
+import json
 import os
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import unittest
 
 import mock
 from testfixtures import log_capture
 
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.cancellation import ProcessGroups
+from harbinger.common.image_cache import ImageCache
+from harbinger.common.output_file import OutputFile
+from harbinger.common.output_pump import LogSink
 from harbinger.common.utils import Utils
+from harbinger.common.watchdog import CommandTimeout
 from harbinger.executors.base import BaseExecutor
 
 
@@ -13,18 +24,27 @@ class TestBaseExecutor(unittest.TestCase):
     def setUp(self):
         self.mock_framework = mock.Mock()
         self.mock_framework.name = 'test_framework_name'
+        self.mock_framework.environment_overrides = None
 
         self.mock_environment = mock.Mock()
+        self.mock_environment.target = None
         self.mock_environment.OS_AUTH_URL = 'test_os_auth_url'
         self.mock_environment.OS_API_VERSION = 'test_os_api_version'
 
         self.mock_options = mock.Mock()
+        self.mock_options.run_id = None
 
     def _get_test_object(self):
         with mock.patch('harbinger.executors.base.CONF') as mock_conf:
             mock_conf.DEFAULT.files_dir = 'test_files_dir'
             with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
-                mock_lookup.return_value = 'test_paths'
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': 'log',
+                    'resource_cache_ttl': '0',
+                    'image_cache_size': '0', 'image_home_project_id': '',
+                    'image_home_project_name': ''}.get(prop, 'test_paths')
                 with mock.patch('harbinger.executors.base.FlavorManager'):
                     with mock.patch('harbinger.executors.base.ImageManager'):
                         test_object = BaseExecutor(self.mock_framework,
@@ -40,13 +60,465 @@ class TestBaseExecutor(unittest.TestCase):
             test_object.relative_path, 'test_files_dir/frameworks/'
             'test_framework_name/test_paths')
 
-    @mock.patch.object(BaseExecutor, 'export_environment')
-    def test_setup(self, mock_export_environment):
+    def test_setup(self):
         test_object = self._get_test_object()
+        self.assertFalse(test_object.resource_prefetch)
         test_object.setup()
-        mock_export_environment.assert_called()
+        # images are looked up by name unless the catalogs are prefetched
+        test_object.image.prefetch.assert_not_called()
+        test_object.flavor.prefetch.assert_not_called()
+
+        test_object.resource_prefetch = True
+        test_object.setup()
+        test_object.image.prefetch.assert_called_once_with()
+        test_object.flavor.prefetch.assert_called_once_with()
+
+    @log_capture()
+    def test_prefetch_resources(self, capture):
+        test_object = self._get_test_object()
+        test_object.resource_prefetch = True
+        test_object.image.prefetch.side_effect = RuntimeError('unreachable')
+        test_object.prefetch_resources()
+        test_object.flavor.prefetch.assert_called_once_with()
+        capture.check_present(
+            ('harbinger.executors.base', 'WARNING',
+             'Could not prefetch the images of test_framework_name: '
+             'unreachable'))
+
+    def test___init___resource_cache(self):
+        with mock.patch('harbinger.executors.base.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = 'test_files_dir'
+            with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': 'log',
+                    'image_cache_size': '0',
+                    'image_home_project_id': '',
+                    'image_home_project_name': '',
+                    'resource_cache_ttl': '300',
+                    'resource_prefetch': True}.get(prop, 'test_paths')
+                with mock.patch('harbinger.executors.base.ResourceCache') \
+                        as mock_cache:
+                    with mock.patch(
+                            'harbinger.executors.base.FlavorManager') \
+                            as mock_flavor:
+                        with mock.patch(
+                                'harbinger.executors.base.ImageManager') \
+                                as mock_image:
+                            BaseExecutor(self.mock_framework,
+                                         self.mock_environment,
+                                         self.mock_options)
+
+        mock_cache.assert_called_once_with(
+            'test_os_auth_urltest_os_api_version/'
+            'test_paths/test_paths/test_paths/test_paths', 300.0, None)
+        self.assertIs(mock_image.call_args[0][2], mock_cache.return_value)
+        self.assertIs(mock_flavor.call_args[0][2], mock_cache.return_value)
+        # both clients share one keystone session
+        self.assertIs(mock_image.call_args[0][1], mock_flavor.call_args[0][1])
+
+    @mock.patch.object(BaseExecutor, 'optimize_image',
+                       return_value=('raw_path', 'raw'))
+    @mock.patch('harbinger.executors.base.SingleFlight')
+    @mock.patch.object(BaseExecutor, 'create_image')
+    def test_ensure_image(self, mock_create_image, mock_single_flight,
+                          mock_optimize_image):
+        test_object = self._get_test_object()
+        test_object.image.check_image.return_value = True
+        self.assertFalse(test_object.ensure_image('image'))
+        mock_single_flight.assert_not_called()
+
+        test_object.image.check_image.return_value = False
+        mock_single_flight.return_value.run.return_value = True
+        self.assertTrue(test_object.ensure_image('image', 'image_path'))
+        scope, name = mock_single_flight.call_args[0]
+        self.assertTrue(scope.endswith('/images'))
+        self.assertEqual(name, 'image')
+
+        done, build_here = mock_single_flight.return_value.run.call_args[0]
+        self.assertFalse(done())
+        test_object.image.forget.assert_called_once_with()
+        build_here()
+        # built in the flight of the build directory, whatever the project
+        mock_single_flight.assert_called_with(
+            'builds', os.path.abspath('image_path'))
+        done, build = mock_single_flight.return_value.run.call_args[0]
+        self.assertFalse(done())
+        build()
+        mock_create_image.assert_called_once_with()
+        mock_optimize_image.assert_called_once_with('image', 'image_path')
+        test_object.image.upload_image.assert_called_once_with(
+            'image', 'raw', 'bare', 'raw_path')
+
+    @mock.patch.object(BaseExecutor, 'optimize_image',
+                       return_value=('path', 'qcow2'))
+    @mock.patch.object(BaseExecutor, 'create_image')
+    def test_ensure_image_targets(self, mock_create_image,
+                                  mock_optimize_image):
+        east = self._get_test_object()
+        west = self._get_test_object()
+        west.project = 'west'
+        for test_object in (east, west):
+            test_object.image.check_image.return_value = False
+        building = []
+        overlaps = []
+
+        def create_image():
+            building.append(None)
+            overlaps.append(len(building))
+            time.sleep(0.05)
+            building.pop()
+
+        mock_create_image.side_effect = create_image
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with mock.patch('harbinger.common.single_flight.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = temp_dir
+            threads = [
+                threading.Thread(target=test_object.ensure_image,
+                                 args=('image', 'image_path'))
+                for test_object in (east, west)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # each project uploads, the builds into image_path do not overlap
+        self.assertEqual(overlaps, [1, 1])
+        east.image.upload_image.assert_called_once_with(
+            'image', 'qcow2', 'bare', 'path')
+        west.image.upload_image.assert_called_once_with(
+            'image', 'qcow2', 'bare', 'path')
+
+    def _get_image_home_object(self, sharing='membership', home_id='',
+                               home_name='images'):
+        with mock.patch('harbinger.executors.base.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = 'test_files_dir'
+            with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': 'log',
+                    'resource_cache_ttl': '0',
+                    'image_cache_size': '0', 'image_home_project_id': home_id,
+                    'image_home_project_name': home_name,
+                    'image_sharing': sharing}.get(prop, 'test_paths')
+                with mock.patch('harbinger.executors.base.FlavorManager'):
+                    with mock.patch(
+                            'harbinger.executors.base.ImageManager') \
+                            as mock_image:
+                        mock_image.side_effect = \
+                            lambda *args, **kwargs: mock.Mock()
+                        return BaseExecutor(self.mock_framework,
+                                            self.mock_environment,
+                                            self.mock_options)
+
+    def test___init___image_home(self):
+        test_object = self._get_image_home_object()
+        self.assertIsNotNone(test_object.image_home)
+        self.assertIsNot(test_object.image_home, test_object.image)
+        self.assertEqual(test_object.image_sharing, 'membership')
+        self.assertEqual(test_object.image_home_project,
+                         'test_os_auth_urltest_os_api_version/'
+                         '/images/test_paths/test_paths')
+        self.assertIsNone(self._get_test_object().image_home)
+
+        with self.assertRaises(RuntimeError):
+            self._get_image_home_object('public')
+
+        # the target is the image home
+        test_object = self._get_image_home_object(home_id='test_paths',
+                                                  home_name='test_paths')
+        self.assertIsNone(test_object.image_home)
+        self.assertIsNone(test_object.image_home_project)
+
+    def _get_output_file_object(self, command_output='file'):
+        with mock.patch('harbinger.executors.base.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = 'test_files_dir'
+            with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': command_output,
+                    'output_compression': 'gzip',
+                    'output_rotate_size': '0.5', 'output_rotate_count': '',
+                    'resource_cache_ttl': '0',
+                    'image_cache_size': '0', 'image_home_project_id': '',
+                    'image_home_project_name': ''}.get(prop, 'test_paths')
+                with mock.patch('harbinger.executors.base.FlavorManager'):
+                    with mock.patch('harbinger.executors.base.ImageManager'):
+                        return BaseExecutor(self.mock_framework,
+                                            self.mock_environment,
+                                            self.mock_options)
+
+    def test___init___command_output(self):
+        test_object = self._get_output_file_object()
+        self.assertEqual(test_object.command_output, 'file')
+        self.assertEqual(test_object.output_options,
+                         {'compression': 'gzip', 'rotate_size': 524288,
+                          'rotate_count': 5})
+        self.assertEqual(self._get_test_object().output_options, {})
+
+        with self.assertRaises(RuntimeError) as context:
+            self._get_output_file_object('stdout')
+        self.assertEqual(str(context.exception),
+                         'command_output of test_framework_name must be log '
+                         'or file, got stdout')
+
+    @log_capture()
+    @mock.patch('harbinger.executors.base.OutputPump')
+    @mock.patch('subprocess.Popen')
+    def test__exec_cmd_argv(self, mock_popen_init, mock_pump, capture):
+        result = mock_pump.return_value.run.return_value
+        result.returncode = 0
+        files_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, files_dir)
+        bin_dir = os.path.join(files_dir, 'venvs', 'test_framework_name',
+                               'bin')
+        os.makedirs(bin_dir)
+        program = os.path.join(bin_dir, 'shaker')
+        open(program, 'w').close()
+        os.chmod(program, 0o755)
 
-    def test_export_environment(self):
+        test_object = self._get_test_object()
+        with mock.patch('harbinger.executors.base.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = files_dir
+            test_object._exec_cmd(['shaker', '--config-file', 'a file.cfg'])
+            # a list is run directly, its program found in the venv
+            self.assertEqual(mock_popen_init.call_args[0][0],
+                             [program, '--config-file', 'a file.cfg'])
+            environ = mock_popen_init.call_args[1]['env']
+            self.assertEqual(environ['VIRTUAL_ENV'],
+                             os.path.dirname(bin_dir))
+            self.assertTrue(environ['PATH'].startswith(bin_dir + ':'))
+            capture.check_present(
+                ('harbinger.executors.base', 'INFO',
+                 "Executing {shaker --config-file 'a file.cfg'}:\n"))
+            mock_pump.return_value.run.assert_called_with(
+                "shaker --config-file 'a file.cfg'")
+
+            # a program outside of the venv is found on the PATH
+            test_object._exec_cmd(['sh', '-c', 'true'])
+            self.assertTrue(os.path.isabs(mock_popen_init.call_args[0][0][0]))
+
+    @log_capture()
+    @mock.patch('harbinger.executors.base.OutputPump')
+    @mock.patch('subprocess.Popen')
+    def test__exec_cmd_output_file(self, mock_popen_init, mock_pump,
+                                   capture):
+        result = mock_pump.return_value.run.return_value
+        result.returncode = 0
+        test_object = self._get_output_file_object()
+        test_object.outputs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_object.outputs_dir)
+
+        with mock.patch('harbinger.executors.base.CONF'):
+            test_object._exec_cmd('test_command', shard=1)
+        output_file = mock_pump.call_args[0][1][0]
+        self.assertIsInstance(output_file, OutputFile)
+        self.assertEqual(output_file.path,
+                         os.path.join(test_object.outputs_dir,
+                                      'test_framework_name-output-1.log.gz'))
+        self.assertEqual(output_file.rotate_size, 524288)
+        # the output is not logged, only where it went
+        capture.check_present(
+            ('harbinger.executors.base', 'INFO',
+             'Output of {test_command} written to %s: %s'
+             % (output_file.path, result)))
+
+    def test_output_path(self):
+        test_object = self._get_test_object()
+        test_object.outputs_dir = 'outputs'
+        self.assertEqual(test_object.output_path(),
+                         'outputs/test_framework_name-output.log')
+        self.assertEqual(test_object.output_path(2),
+                         'outputs/test_framework_name-output-2.log')
+
+    @mock.patch.object(BaseExecutor, 'optimize_image',
+                       return_value=('raw_path', 'raw'))
+    @mock.patch('harbinger.executors.base.SingleFlight')
+    @mock.patch.object(BaseExecutor, 'create_image')
+    def test_ensure_image_home(self, mock_create_image, mock_single_flight,
+                               mock_optimize_image):
+        test_object = self._get_image_home_object()
+        home = test_object.image_home
+        home.project_id = 'home_id'
+        test_object.image.project_id = 'project_id'
+        test_object.image.check_image.return_value = False
+        home.check_image.return_value = False
+        home.share_image.return_value = 'image_id'
+        mock_single_flight.return_value.run.side_effect = \
+            lambda done, build: build()
+
+        test_object.ensure_image('image', 'image_path')
+        test_object.image.check_image.assert_called_with('image',
+                                                         owner='home_id')
+        # built and uploaded once into the image home, then shared
+        self.assertEqual(mock_single_flight.call_args_list[1][0][0],
+                         test_object.image_home_project + '/images')
+        mock_create_image.assert_called_once_with()
+        home.upload_image.assert_called_once_with('image', 'raw', 'bare',
+                                                  'raw_path')
+        test_object.image.upload_image.assert_not_called()
+        home.share_image.assert_called_once_with('image', 'project_id',
+                                                 'membership')
+        test_object.image.accept_image.assert_called_once_with('image',
+                                                               'image_id')
+
+    @mock.patch.object(BaseExecutor, 'optimize_image',
+                       return_value=('path', 'qcow2'))
+    @mock.patch.object(BaseExecutor, 'create_image')
+    def test_ensure_image_home_target(self, mock_create_image,
+                                      mock_optimize_image):
+        test_object = self._get_image_home_object()
+        home = test_object.image_home
+        # the image home under another name than the target
+        home.project_id = test_object.image.project_id = 'project_id'
+        test_object.image.check_image.return_value = False
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with mock.patch('harbinger.common.single_flight.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = temp_dir
+            # a flight nested in one on the same lock would never return
+            test_object.ensure_image('image', 'image_path')
+        test_object.image.upload_image.assert_called_once_with(
+            'image', 'qcow2', 'bare', 'path')
+        home.check_image.assert_not_called()
+        home.share_image.assert_not_called()
+
+    @mock.patch('harbinger.executors.base.SingleFlight')
+    def test_ensure_image_home_community(self, mock_single_flight):
+        test_object = self._get_image_home_object('community')
+        test_object.image.check_image.return_value = False
+        # an earlier run already uploaded the image into the image home
+        test_object.image_home.check_image.return_value = True
+        mock_single_flight.return_value.run.side_effect = \
+            lambda done, build: build()
+
+        test_object.ensure_image('image')
+        self.assertEqual(mock_single_flight.call_count, 1)
+        test_object.image_home.upload_image.assert_not_called()
+        test_object.image_home.share_image.assert_called_once_with(
+            'image', test_object.image.project_id, 'community')
+        test_object.image.accept_image.assert_not_called()
+
+    @mock.patch('harbinger.executors.base.ImageOptimizer')
+    def test_optimize_image(self, mock_optimizer):
+        test_object = self._get_test_object()
+        mock_optimizer.return_value.optimize.return_value = ('path', 'raw')
+        with mock.patch.object(Utils, 'hierarchy_lookup',
+                               return_value='raw') as mock_lookup:
+            self.assertEqual(test_object.optimize_image('image', 'path'),
+                             ('path', 'raw'))
+        mock_lookup.assert_called_once_with(test_object,
+                                            'image_optimization')
+        mock_optimizer.assert_called_once_with('raw')
+        mock_optimizer.return_value.optimize.assert_called_once_with(
+            'image', 'path', test_object._exec_cmd)
+
+    @mock.patch('harbinger.executors.base.SingleFlight')
+    def test_ensure_flavor(self, mock_single_flight):
+        test_object = self._get_test_object()
+        test_object.flavor.check_flavor.return_value = False
+        test_object.flavor.match_flavor.return_value = None
+        with mock.patch.object(Utils, 'hierarchy_lookup', return_value=None):
+            self.assertEqual(test_object.ensure_flavor('flavor', ram=512),
+                             'flavor')
+        # flavors are only reused when flavor_reuse asks for it
+        test_object.flavor.match_flavor.assert_called_once_with(
+            {'ram': 512}, None, 'none')
+        self.assertTrue(mock_single_flight.call_args[0][0].endswith(
+            '/flavors'))
+
+        done, build = mock_single_flight.return_value.run.call_args[0]
+        build()
+        test_object.flavor.create_flavor.assert_called_once_with(
+            name='flavor', extra_specs=None, ram=512)
+
+    @mock.patch('harbinger.executors.base.SingleFlight')
+    def test_ensure_flavor_reuse(self, mock_single_flight):
+        test_object = self._get_test_object()
+        test_object.flavor.check_flavor.return_value = False
+        test_object.flavor.match_flavor.return_value = 'm1.small'
+        spec = {'ram': 2048, 'extra_specs': {'hw:mem_page_size': 'large'}}
+        with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
+            mock_lookup.side_effect = lambda executor, prop: {
+                'flavor_spec': spec, 'flavor_reuse': 'exact'}.get(prop)
+            self.assertEqual(
+                test_object.ensure_flavor('flavor', ram=512, vcpus=1),
+                'm1.small')
+        # the flavor_spec of the input yaml overrides the default spec
+        test_object.flavor.match_flavor.assert_called_once_with(
+            {'ram': 2048, 'vcpus': 1}, {'hw:mem_page_size': 'large'},
+            'exact')
+        mock_single_flight.assert_not_called()
+
+        test_object.flavor.check_flavor.return_value = True
+        with mock.patch.object(Utils, 'hierarchy_lookup', return_value=None):
+            self.assertEqual(test_object.ensure_flavor('flavor', ram=512),
+                             'flavor')
+
+    def test_ensure_flavor_invalid(self):
+        test_object = self._get_test_object()
+        with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
+            mock_lookup.side_effect = lambda executor, prop: {
+                'flavor_spec': {'cpus': 2}}.get(prop)
+            with self.assertRaises(RuntimeError):
+                test_object.ensure_flavor('flavor', ram=512)
+            mock_lookup.side_effect = lambda executor, prop: {
+                'flavor_reuse': 'any'}.get(prop)
+            with self.assertRaises(RuntimeError):
+                test_object.ensure_flavor('flavor', ram=512)
+
+    @mock.patch.object(BaseExecutor, 'image_recipe')
+    @mock.patch.object(BaseExecutor, 'create_image')
+    def test_build_image(self, mock_create_image, mock_image_recipe):
+        test_object = self._get_test_object()
+        mock_image_recipe.return_value = ({'revision': 'abc'}, [])
+        self.assertEqual(test_object.build_image('image', 'image_path'),
+                         'image_path')
+        mock_create_image.assert_called_once_with()
+
+        test_object.image_cache = mock.Mock()
+        test_object.image_cache.lookup.return_value = 'cache_dir'
+        self.assertEqual(test_object.build_image('image', 'image_path'),
+                         'cache_dir')
+        test_object.image_cache.lookup.assert_called_once_with(
+            ImageCache.key({'revision': 'abc'}, []))
+        mock_create_image.assert_called_once_with()
+
+        test_object.image_cache.lookup.return_value = None
+        test_object.image_cache.store.return_value = 'new_cache_dir'
+        self.assertEqual(test_object.build_image('image', 'image_path'),
+                         'new_cache_dir')
+        test_object.image_cache.store.assert_called_once_with(
+            ImageCache.key({'revision': 'abc'}, []), 'image', 'image_path')
+        self.assertEqual(mock_create_image.call_count, 2)
+
+        # frameworks without a recipe are built every time
+        mock_image_recipe.return_value = None
+        self.assertEqual(test_object.build_image('image', 'image_path'),
+                         'image_path')
+        self.assertEqual(mock_create_image.call_count, 3)
+
+    @mock.patch('harbinger.executors.base.subprocess.check_output')
+    def test_framework_revision(self, mock_check_output):
+        test_object = self._get_test_object()
+        mock_check_output.return_value = 'abc\n'
+        with mock.patch('harbinger.executors.base.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = 'test_files_dir'
+            self.assertEqual(test_object.framework_revision(), 'abc')
+        self.assertEqual(mock_check_output.call_args[0][0], [
+            'git', '-C', 'test_files_dir/frameworks/test_framework_name',
+            'rev-parse', 'HEAD'])
+
+        mock_check_output.side_effect = subprocess.CalledProcessError(128,
+                                                                      'git')
+        with mock.patch('harbinger.executors.base.CONF'):
+            self.assertIsNone(test_object.framework_revision())
+
+    def test_build_environ(self):
         test_object = self._get_test_object()
 
         class Empty():
@@ -55,54 +527,43 @@ class TestBaseExecutor(unittest.TestCase):
         test_object.environment = Empty()
         setattr(test_object.environment, 'ENVIRONMENT_KEY', 'ENVIRONMENT_VAL')
         setattr(test_object.environment, 'environment_key', 'environment_val')
+        setattr(test_object.environment, 'OS_USERNAME', 'environment_user')
 
         test_object.framework = Empty()
 
-        with mock.patch.dict(os.environ, {}, clear=True):
-            test_object.export_environment()
-            self.assertIn('ENVIRONMENT_KEY', os.environ)
-            self.assertEqual(os.environ['ENVIRONMENT_KEY'], 'ENVIRONMENT_VAL')
-            self.assertNotIn('environment_key', os.environ)
-            self.assertNotIn('FRAMEWORK_KEY', os.environ)
-            self.assertNotIn('framework_key', os.environ)
+        with mock.patch.dict(os.environ, {'PATH': '/usr/bin'}, clear=True):
+            with mock.patch.object(Utils, 'openrc_environ',
+                                   return_value={'OS_USERNAME': 'user'}):
+                environ = test_object.build_environ()
+            self.assertEqual(os.environ, {'PATH': '/usr/bin'})
+        self.assertEqual(environ, {'PATH': '/usr/bin',
+                                   'ENVIRONMENT_KEY': 'ENVIRONMENT_VAL',
+                                   'OS_USERNAME': 'user'})
+        with self.assertRaises(TypeError):
+            environ['KEY'] = 'value'
 
         test_object.framework.environment_overrides = {
             'framework_key': 'framework_val',
             'FRAMEWORK_KEY': 'FRAMEWORK_VAL',
+            'ENVIRONMENT_KEY': 'OVERRIDE_VAL',
         }
         with mock.patch.dict(os.environ, {}, clear=True):
-            test_object.export_environment()
-            self.assertIn('ENVIRONMENT_KEY', os.environ)
-            self.assertEqual(os.environ['ENVIRONMENT_KEY'], 'ENVIRONMENT_VAL')
-            self.assertNotIn('environment_key', os.environ)
-            self.assertIn('FRAMEWORK_KEY', os.environ)
-            self.assertEqual(os.environ['FRAMEWORK_KEY'], 'FRAMEWORK_VAL')
-            self.assertNotIn('framework_key', os.environ)
+            with mock.patch.object(Utils, 'openrc_environ', return_value={}):
+                environ = test_object.build_environ()
+        self.assertEqual(environ, {'ENVIRONMENT_KEY': 'OVERRIDE_VAL',
+                                   'OS_USERNAME': 'environment_user',
+                                   'FRAMEWORK_KEY': 'FRAMEWORK_VAL'})
 
     def test_create_image(self):
         test_object = self._get_test_object()
         self.assertRaises(NotImplementedError, test_object.create_image)
 
     @log_capture()
+    @mock.patch('harbinger.executors.base.OutputPump')
     @mock.patch('subprocess.Popen')
-    def test__exec_cmd(self, mock_popen_init, capture):
-        class TestReadline():
-            def __init__(self):
-                self.called = False
-
-            def __call__(self):
-                if self.called:
-                    return ''
-                self.called = True
-                return 'test_log_output'
-
-        attrs = {
-            'returncode': -1,
-            'communicate.return_value': 'test_output',
-            'stdout.readline': TestReadline()
-        }
-        mock_popen = mock.Mock(**attrs)
-        mock_popen_init.return_value = mock_popen
+    def test__exec_cmd(self, mock_popen_init, mock_pump, capture):
+        result = mock_pump.return_value.run.return_value
+        result.returncode = -1
         with mock.patch('harbinger.executors.base.CONF') as mock_conf:
             mock_conf.DEFAULT.files_dir = 'test_files_dir'
             test_object = self._get_test_object()
@@ -112,25 +573,261 @@ class TestBaseExecutor(unittest.TestCase):
             self.assertEqual(
                 str(exception), 'command <test_command> '
                 'failed with return code -1')
+            # a string is run by bash, in the activated venv
+            venv = 'test_files_dir/venvs/test_framework_name'
+            environ = dict(test_object.environ, VIRTUAL_ENV=venv,
+                           PATH=venv + '/bin:' + test_object.environ['PATH'])
+            environ.pop('PYTHONHOME', None)
             mock_popen_init.assert_called_once_with(
-                [
-                    '/bin/bash', '-c',
-                    'source test_files_dirvenvs/test_framework_name/'
-                    'bin/activate && test_command'
-                ],
+                ['/bin/bash', '-c', 'test_command'],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
+                stderr=subprocess.PIPE,
+                start_new_session=True,
+                env=environ,
             )
-            capture.check(
+            capture.check_present(
                 ('harbinger.executors.base', 'INFO',
-                 'Executing {test_command}:\n'),
-                ('harbinger.executors.base', 'INFO', 'test_log_output'),
-            )
+                 'Executing {test_command}:\n'))
+            popen, sinks, on_output = mock_pump.call_args[0]
+            self.assertIs(popen, mock_popen_init.return_value)
+            self.assertEqual([type(sink) for sink in sinks], [LogSink])
+            mock_pump.return_value.run.assert_called_with('test_command')
+
+            # the end of the output is kept with the error
+            def run(command):
+                tail = mock_pump.call_args[0][1][-1]
+                self.assertEqual(tail.max_size, 2048)
+                tail.write('stderr', ['Traceback', 'ValueError'])
+                return result
+
+            test_object.failure_tail_size = 2
+            mock_pump.return_value.run.side_effect = run
+            with self.assertRaises(RuntimeError) as context:
+                test_object._exec_cmd('test_command')
+            self.assertEqual(context.exception.output_tail,
+                             'Traceback\nValueError')
+            mock_pump.return_value.run.side_effect = None
+            test_object.failure_tail_size = None
+
+            result.returncode = 0
+            sink = mock.Mock()
+            self.assertIs(test_object._exec_cmd('test_command',
+                                                sinks=[sink]), result)
+            self.assertIs(mock_pump.call_args[0][1][1], sink)
+
+    @mock.patch('harbinger.executors.base.OutputPump')
+    @mock.patch('harbinger.executors.base.Watchdog')
+    @mock.patch('harbinger.executors.base.subprocess.Popen')
+    def test__exec_cmd_timeout(self, mock_popen_init, mock_watchdog,
+                               mock_pump):
+        mock_pump.return_value.run.return_value.returncode = -15
+        mock_watchdog.return_value.reason = 'stall'
+        mock_watchdog.return_value.describe.return_value = 'test_timeout'
+        test_object = self._get_test_object()
+        test_object.stall_timeout = 30
+        with mock.patch('harbinger.executors.base.CONF'):
+            with self.assertRaises(CommandTimeout) as context:
+                test_object._exec_cmd('test_command', timeout=10)
+        self.assertEqual(str(context.exception), 'test_timeout')
+        mock_watchdog.assert_called_once_with(
+            mock_popen_init.return_value, 10, 30)
+        mock_watchdog.return_value.start.assert_called_once()
+        mock_watchdog.return_value.stop.assert_called_once()
+        # the watchdog is fed whenever the command writes
+        self.assertEqual(mock_pump.call_args[0][2],
+                         mock_watchdog.return_value.feed)
+
+    @mock.patch('harbinger.executors.base.OutputPump')
+    @mock.patch('harbinger.executors.base.subprocess.Popen')
+    def test__exec_cmd_cancelled(self, mock_popen_init, mock_pump):
+        mock_pump.return_value.run.return_value.returncode = -15
+        test_object = self._get_test_object()
+        self.addCleanup(ProcessGroups.reset)
+        with mock.patch.object(ProcessGroups, 'remove') as mock_remove:
+            # the signal arrives while the command runs
+            with mock.patch.object(ProcessGroups, 'add') as mock_add:
+                mock_add.side_effect = lambda popen: setattr(
+                    ProcessGroups, 'cancelled', 15)
+                with mock.patch('harbinger.executors.base.CONF'):
+                    self.assertRaises(Cancelled, test_object._exec_cmd,
+                                      'test_command')
+            mock_remove.assert_called_once_with(mock_popen_init.return_value)
+
+        mock_popen_init.reset_mock()
+        self.assertRaises(Cancelled, test_object._exec_cmd, 'test_command')
+        mock_popen_init.assert_not_called()
+
+    def test_lookup_seconds(self):
+        test_object = self._get_test_object()
+        for value, seconds in ((None, None), ('0', None), ('90', 90),
+                               (1.5, 1.5)):
+            with mock.patch.object(Utils, 'hierarchy_lookup',
+                                   return_value=value):
+                self.assertEqual(test_object.lookup_seconds('timeout'),
+                                 seconds)
+
+        with mock.patch.object(Utils, 'hierarchy_lookup',
+                               return_value='soon'):
+            self.assertRaises(RuntimeError, test_object.lookup_seconds,
+                              'timeout')
+
+    @mock.patch('harbinger.executors.base.time.monotonic')
+    def test_command_timeouts(self, mock_monotonic):
+        test_object = self._get_test_object()
+        self.assertEqual(test_object.command_timeouts('cmd'), (None, None))
+
+        test_object.command_timeout = 60
+        test_object.stall_timeout = 30
+        self.assertEqual(test_object.command_timeouts('cmd'), (60, 30))
+        self.assertEqual(test_object.command_timeouts('cmd', 10, 5), (10, 5))
+
+        test_object.timeout = 100
+        test_object.deadline = 100
+        mock_monotonic.return_value = 80
+        self.assertEqual(test_object.command_timeouts('cmd'), (20, 30))
+        test_object.command_timeout = None
+        self.assertEqual(test_object.command_timeouts('cmd'), (20, 30))
+
+        mock_monotonic.return_value = 100
+        self.assertRaises(CommandTimeout, test_object.command_timeouts,
+                          'cmd')
+
+    @mock.patch.object(BaseExecutor, '_exec_cmd')
+    def test_execute_commands(self, mock_exec_cmd):
+        test_object = self._get_test_object()
+        mock_exec_cmd.side_effect = \
+            lambda command, shard: '%s_output_%s' % (command, shard)
+        self.assertEqual(test_object.execute_commands(['cmd1']),
+                         ['cmd1_output_None'])
+        self.assertEqual(test_object.execute_commands(['cmd1', 'cmd2']),
+                         ['cmd1_output_0', 'cmd2_output_1'])
+
+        mock_exec_cmd.side_effect = RuntimeError('test_error')
+        self.assertRaises(RuntimeError, test_object.execute_commands,
+                          ['cmd1', 'cmd2'])
+
+    def test_shard_tests(self):
+        test_object = self._get_test_object()
+        tests = ['t1', 't2', 't3', 't4', 't5']
+        self.assertEqual(test_object.shard_tests(tests), [tests])
+
+        test_object.shards = 2
+        self.assertEqual(test_object.shard_tests(tests),
+                         [['t1', 't3', 't5'], ['t2', 't4']])
 
-            mock_popen.returncode = 0
-            output = test_object._exec_cmd('test_command')
-            self.assertEqual(output, 'test_output')
+        test_object.shards = 10
+        self.assertEqual(test_object.shard_tests(tests[:2]), [['t1'], ['t2']])
+        self.assertEqual(test_object.shard_tests([]), [[]])
+
+    @mock.patch.object(BaseExecutor, '_exec_cmd')
+    def test_execute_commands_journal(self, mock_exec_cmd):
+        test_object = self._get_test_object()
+        test_object.journal = mock.Mock()
+        test_object.journal.completed.side_effect = \
+            lambda unit, shard: shard == 0
+        mock_exec_cmd.side_effect = lambda command, shard: command + '_output'
+        self.assertEqual(test_object.execute_commands(['cmd1', 'cmd2']),
+                         [None, 'cmd2_output'])
+        mock_exec_cmd.assert_called_once_with('cmd2', shard=1)
+        test_object.journal.set_state.assert_has_calls([
+            mock.call('test_framework_name', 'running', 1),
+            mock.call('test_framework_name', 'completed', 1)])
+
+        mock_exec_cmd.side_effect = RuntimeError('test_error')
+        self.assertRaises(RuntimeError, test_object.execute_commands,
+                          ['cmd1', 'cmd2'])
+        test_object.journal.set_state.assert_called_with(
+            'test_framework_name', 'failed', 1)
+
+        mock_exec_cmd.side_effect = CommandTimeout('test_timeout')
+        self.assertRaises(CommandTimeout, test_object.execute_commands,
+                          ['cmd1', 'cmd2'])
+        test_object.journal.set_state.assert_called_with(
+            'test_framework_name', 'timeout', 1)
+
+    def test_shard_tests_journal(self):
+        test_object = self._get_test_object()
+        test_object.shards = 2
+        test_object.journal = mock.Mock()
+        test_object.journal.shard_groups.return_value = None
+        self.assertEqual(test_object.shard_tests(['t1', 't2', 't3']),
+                         [['t1', 't3'], ['t2']])
+        test_object.journal.set_shard_groups.assert_called_once_with(
+            'test_framework_name', [['t1', 't3'], ['t2']])
+
+        test_object.journal.shard_groups.return_value = [['t3'], ['t1', 't2']]
+        self.assertEqual(test_object.shard_tests(['t1', 't2', 't3']),
+                         [['t3'], ['t1', 't2']])
+
+    def test_shard_path(self):
+        self.assertEqual(BaseExecutor.shard_path('dir/out.json', 3),
+                         'dir/out-3.json')
+        self.assertEqual(BaseExecutor.shard_path('dir/out', 0), 'dir/out-0')
+
+    def test_merge_outputs(self):
+        test_object = self._get_test_object()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        paths = [os.path.join(temp_dir, name) for name in ['a', 'b', 'c']]
+        for path, content in zip(paths[:2], ['line1\n', 'line2\n']):
+            with open(path, 'w') as shard_file:
+                shard_file.write(content)
+
+        output = os.path.join(temp_dir, 'out')
+        test_object.merge_outputs(paths, output)
+        with open(output) as output_file:
+            self.assertEqual(output_file.read(), 'line1\nline2\n')
+
+    def test_merge_json_outputs(self):
+        test_object = self._get_test_object()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        documents = [
+            {'records': {'r1': 1}, 'sla': ['s1'], 'status': 'a'},
+            {'records': {'r2': 2}, 'sla': ['s2'], 'status': 'b'},
+        ]
+        paths = []
+        for index, document in enumerate(documents):
+            paths.append(os.path.join(temp_dir, str(index)))
+            with open(paths[-1], 'w') as shard_file:
+                json.dump(document, shard_file)
+
+        output = os.path.join(temp_dir, 'out')
+        test_object.merge_json_outputs(paths, output)
+        with open(output) as output_file:
+            self.assertEqual(json.load(output_file), {
+                'records': {'r1': 1, 'r2': 2},
+                'sla': ['s1', 's2'],
+                'status': 'b'
+            })
+
+    def test_match_test(self):
+        test_object = self._get_test_object()
+        test_object.collected_tests_list = [
+            '/fw/scenarios/openstack/perf_l2.yaml', '/fw/samples/ping.yaml'
+        ]
+        self.assertEqual(test_object.match_test('openstack/perf_l2.yaml'),
+                         '/fw/scenarios/openstack/perf_l2.yaml')
+        self.assertEqual(test_object.match_test('/fw/samples/ping.yaml'),
+                         '/fw/samples/ping.yaml')
+        self.assertEqual(test_object.match_test('ping'),
+                         '/fw/samples/ping.yaml')
+        self.assertIsNone(test_object.match_test('unknown'))
+
+    @mock.patch.object(BaseExecutor, 'parse_durations')
+    def test_record_durations(self, mock_parse_durations):
+        test_object = self._get_test_object()
+        test_object.history = mock.Mock()
+        test_object.collected_tests_list = ['/fw/samples/ping.yaml']
+        mock_parse_durations.return_value = {'ping': 12.5, 'unknown': 1}
+        test_object.record_durations()
+        test_object.history.record.assert_called_once_with(
+            {'/fw/samples/ping.yaml': 12.5})
+
+        test_object.history.reset_mock()
+        mock_parse_durations.side_effect = ValueError('bad json')
+        test_object.record_durations()
+        test_object.history.record.assert_not_called()
 
     @mock.patch('harbinger.executors.base.CONF')
     def test_walk_directory(self, mock_conf):
@@ -166,6 +863,8 @@ class TestBaseExecutor(unittest.TestCase):
                        ' that violate the schema.\nAll paths must' \
                        ' end in a file extention or / to indicate' \
                        ' a file or directory:\n'
+        # no durations recorded, collection order is kept
+        test_object.history.durations = {}
 
         with mock.patch('os.path') as mock_path:
 
@@ -1,3 +1,7 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -10,19 +14,28 @@ class TestShakerExecutor(unittest.TestCase):
     def setUp(self):
         self.mock_framework = mock.Mock()
         self.mock_framework.name = 'test_framework_name'
+        self.mock_framework.environment_overrides = None
 
         self.mock_environment = mock.Mock()
+        self.mock_environment.target = None
         self.mock_environment.OS_AUTH_URL = 'test_os_auth_url'
         self.mock_environment.OS_API_VERSION = 'test_os_api_version'
 
         self.mock_options = mock.Mock()
+        self.mock_options.run_id = None
 
     def _get_test_object(self):
         with mock.patch('harbinger.executors.base.CONF') as mock_conf:
             mock_conf.DEFAULT.files_dir = 'test_files_dir'
 
             with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
-                mock_lookup.return_value = 'foo'
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': 'log',
+                    'resource_cache_ttl': '0',
+                    'image_cache_size': '0', 'image_home_project_id': '',
+                    'image_home_project_name': ''}.get(prop, 'foo')
                 with mock.patch.object(ShakerExecutor,
                                        'format_collected_tests'):
                     with mock.patch.object(ShakerExecutor, 'collect_tests'):
@@ -42,6 +55,9 @@ class TestShakerExecutor(unittest.TestCase):
         self.assertEqual(test_object.results_json_path,
                          'test_files_dir/outputs/shaker-results.json')
 
+    @mock.patch.object(ShakerExecutor, 'optimize_image',
+                       side_effect=lambda name, path: (path, 'qcow2'))
+    @mock.patch('harbinger.executors.base.SingleFlight')
     @mock.patch.object(ShakerExecutor, '_exec_cmd')
     @mock.patch.object(ShakerExecutor, 'create_cfg_file')
     @mock.patch.object(ShakerExecutor, 'create_image')
@@ -49,7 +65,10 @@ class TestShakerExecutor(unittest.TestCase):
                 return_value='test_image')
     @mock.patch('harbinger.executors.base.BaseExecutor.setup')
     def test_setup(self, mock_base_setup, mock_hierarchy_lookup,
-                   mock_create_image, mock_create_cfg_file, mock_exec_cmd):
+                   mock_create_image, mock_create_cfg_file, mock_exec_cmd,
+                   mock_single_flight, mock_optimize_image):
+        mock_single_flight.return_value.run.side_effect = \
+            lambda done, build: build()
         test_object = self._get_test_object()
         test_object.image.check_image = mock.Mock(return_value=False)
         test_object.image.upload_image = mock.Mock()
@@ -59,17 +78,77 @@ class TestShakerExecutor(unittest.TestCase):
         mock_hierarchy_lookup.assert_called_once_with(test_object, 'image')
         mock_create_image.assert_called_once()
         test_object.image.upload_image.assert_called_once_with(
-            'test_image', 'qcow2', 'bare')
+            'test_image', 'qcow2', 'bare', None)
         mock_create_cfg_file.assert_called_once()
         mock_exec_cmd.assert_called_once_with(
-            "shaker --config-file test_files_dir/"
-            "inputs/test_framework_name.cfg")
+            ["shaker", "--config-file",
+             "test_files_dir/inputs/test_framework_name.cfg"])
 
         test_object.image.check_image = mock.Mock(return_value=True)
         test_object.setup()
         mock_create_image.assert_called_once()
         test_object.image.upload_image.assert_called_once_with(
-            'test_image', 'qcow2', 'bare')
+            'test_image', 'qcow2', 'bare', None)
+
+    @mock.patch.object(ShakerExecutor, 'merge_json_outputs')
+    @mock.patch.object(ShakerExecutor, 'execute_commands')
+    @mock.patch.object(ShakerExecutor, 'create_cfg_file')
+    def test_run_tests_sharded(self, mock_create_cfg_file,
+                               mock_execute_commands, mock_merge):
+        test_object = self._get_test_object()
+        test_object.shards = 2
+        test_object.collected_tests_list = ['t1', 't2', 't3']
+        test_object.format_collected_tests = lambda tests: ', '.join(tests)
+        test_object.run_tests()
+
+        mock_create_cfg_file.assert_has_calls([
+            mock.call('test_files_dir/inputs/test_framework_name-0.cfg',
+                      't1, t3', 'test_files_dir/outputs/shaker-results-0.json',
+                      0),
+            mock.call('test_files_dir/inputs/test_framework_name-1.cfg',
+                      't2', 'test_files_dir/outputs/shaker-results-1.json',
+                      1),
+        ])
+        mock_execute_commands.assert_called_once_with([
+            ['shaker', '--config-file',
+             'test_files_dir/inputs/test_framework_name-0.cfg'],
+            ['shaker', '--config-file',
+             'test_files_dir/inputs/test_framework_name-1.cfg'],
+        ])
+        mock_merge.assert_called_once_with([
+            'test_files_dir/outputs/shaker-results-0.json',
+            'test_files_dir/outputs/shaker-results-1.json'
+        ], 'test_files_dir/outputs/shaker-results.json')
+
+    def test_parse_durations(self):
+        test_object = self._get_test_object()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        test_object.results_json_path = os.path.join(temp_dir, 'out.json')
+        self.assertEqual(test_object.parse_durations(), {})
+
+        with open(test_object.results_json_path, 'w') as results_file:
+            json.dump({
+                'records': {
+                    'r1': {'scenario': 'L2', 'start': 100, 'finish': 150},
+                    'r2': {'scenario': 'L2', 'start': 90, 'finish': 160},
+                    'r3': {'scenario': 'L3', 'start': 10, 'finish': 15},
+                    'r4': {'scenario': 'L3'},
+                },
+                'scenarios': {
+                    'L2': {'file_name': 'openstack/perf_l2.yaml'}
+                }
+            }, results_file)
+
+        self.assertEqual(test_object.parse_durations(), {
+            'openstack/perf_l2.yaml': 70,
+            'L3': 5
+        })
+
+    def test_shard_endpoint(self):
+        test_object = self._get_test_object()
+        self.assertEqual(test_object.shard_endpoint('10.0.0.2:5999', 2),
+                         '10.0.0.2:6001')
 
     def test_add_extras_values(self):
         test_object = self._get_test_object()
@@ -127,10 +206,24 @@ class TestShakerExecutor(unittest.TestCase):
         ]
         test_object.config.set.assert_has_calls(calls)
 
-    @mock.patch('harbinger.common.utils.Utils.source_openrc')
     @mock.patch.object(ShakerExecutor, '_exec_cmd')
-    def test_create_image(self, mock_exec_cmd, mock_source_openrc):
+    def test_create_image(self, mock_exec_cmd):
         test_object = self._get_test_object()
         test_object.create_image()
-        mock_source_openrc.assert_called_once_with(test_object)
-        mock_exec_cmd.assert_called_once_with('shaker-image-builder')
+        mock_exec_cmd.assert_called_once_with(['shaker-image-builder'])
+
+    @mock.patch('harbinger.executors.shaker.platform.machine',
+                return_value='x86_64')
+    @mock.patch.object(ShakerExecutor, 'framework_revision')
+    def test_image_recipe(self, mock_revision, mock_machine):
+        test_object = self._get_test_object()
+        mock_revision.return_value = None
+        self.assertIsNone(test_object.image_recipe())
+
+        mock_revision.return_value = 'abc'
+        self.assertEqual(test_object.image_recipe(), ({
+            'framework': 'test_framework_name',
+            'revision': 'abc',
+            'builder': 'shaker-image-builder',
+            'arch': 'x86_64'
+        }, []))
@@ -1,4 +1,6 @@
+import json
 import os
+import shutil
 import tempfile
 import unittest
 
@@ -12,12 +14,15 @@ class TestYardstickExecutor(unittest.TestCase):
     def setUp(self):
         self.mock_framework = mock.Mock()
         self.mock_framework.name = 'test_framework_name'
+        self.mock_framework.environment_overrides = None
 
         self.mock_environment = mock.Mock()
+        self.mock_environment.target = None
         self.mock_environment.OS_AUTH_URL = 'test_os_auth_url'
         self.mock_environment.OS_API_VERSION = 'test_os_api_version'
 
         self.mock_options = mock.Mock()
+        self.mock_options.run_id = None
 
         self.temp_dir = tempfile.gettempdir()
 
@@ -26,7 +31,13 @@ class TestYardstickExecutor(unittest.TestCase):
             mock_conf.DEFAULT.files_dir = 'test_files_dir'
 
             with mock.patch.object(Utils, 'hierarchy_lookup') as mock_lookup:
-                mock_lookup.return_value = 'test_paths'
+                mock_lookup.side_effect = lambda executor, prop: {
+                    'shards': '1', 'timeout': '0', 'command_timeout': '0',
+                    'stall_timeout': '0', 'failure_tail_size': '0',
+                    'command_output': 'log',
+                    'resource_cache_ttl': '0',
+                    'image_cache_size': '0', 'image_home_project_id': '',
+                    'image_home_project_name': ''}.get(prop, 'test_paths')
                 with mock.patch('harbinger.executors.'
                                 'yardstick.CONF') as mock_conf2:
                     mock_conf2['test_framework_name'].test_paths = 'test_paths'
@@ -58,34 +69,44 @@ class TestYardstickExecutor(unittest.TestCase):
         self.assertEqual(test_object.conf_full_path,
                          'test_files_dir/inputs/test_framework_name.conf')
 
+    @mock.patch.object(YardstickExecutor, 'optimize_image',
+                       side_effect=lambda name, path: (path, 'qcow2'))
+    @mock.patch('harbinger.executors.base.SingleFlight')
     @mock.patch.object(YardstickExecutor, '_exec_cmd')
     @mock.patch.object(YardstickExecutor, 'create_test_suite')
     @mock.patch.object(YardstickExecutor, 'create_yardstick_conf')
     @mock.patch.object(YardstickExecutor, 'create_image')
-    @mock.patch('harbinger.common.utils.Utils.source_openrc')
     @mock.patch('harbinger.common.utils.Utils.hierarchy_lookup')
     @mock.patch('harbinger.executors.base.BaseExecutor.setup')
     def test_setup_positives(self, mock_base_setup, mock_hierarchy_lookup,
-                             mock_source_openrc, mock_create_image,
+                             mock_create_image,
                              mock_create_yardstick_conf,
-                             mock_create_test_suite, mock_exec_cmd):
+                             mock_create_test_suite, mock_exec_cmd,
+                             mock_single_flight, mock_optimize_image):
+        mock_single_flight.return_value.run.side_effect = \
+            lambda done, build: build()
         test_object = self._get_test_object()
-        mock_hierarchy_lookup.side_effect = [
-            'test_flavor_name', 'test_image_name'
-        ]
+        mock_hierarchy_lookup.side_effect = lambda executor, prop: {
+            'flavor_name': 'test_flavor_name', 'image': 'test_image_name'
+        }.get(prop)
         test_object.flavor.check_flavor.return_value = False
+        test_object.flavor.match_flavor.return_value = None
         test_object.image.check_image.return_value = False
         test_object.setup()
 
         mock_base_setup.assert_called_once()
-        test_object.flavor.check_flavor.assert_called_once_with(
+        test_object.flavor.check_flavor.assert_called_with(
             'test_flavor_name')
+        test_object.flavor.match_flavor.assert_called_once_with(
+            {'ram': 512, 'vcpus': 1, 'disk': 3, 'swap': 100}, None, 'none')
         test_object.flavor.create_flavor.assert_called_once_with(
             name='test_flavor_name',
-            ram='512',
-            vcpus='1',
-            disk='3',
-            swap='100')
+            extra_specs=None,
+            ram=512,
+            vcpus=1,
+            disk=3,
+            swap=100)
+        self.assertEqual(test_object.flavor_name, 'test_flavor_name')
         test_object.image.check_image.assert_called_once_with(
             'test_image_name')
         mock_create_image.assert_called_once()
@@ -94,28 +115,32 @@ class TestYardstickExecutor(unittest.TestCase):
             self.temp_dir + '/workspace/yardstick/')
         mock_create_yardstick_conf.assert_called_once()
         mock_create_test_suite.assert_called_once()
-        mock_source_openrc.assert_called_once_with(test_object)
         mock_exec_cmd.assert_called_once_with(
-            'yardstick --config-file test_files_dir/inputs/'
-            'test_framework_name.conf task start --output-file '
-            'test_files_dir/outputs/yardstick.out --suite '
-            'test_files_dir/inputs/yardstick-suite.yaml')
+            ['yardstick', '--config-file',
+             'test_files_dir/inputs/test_framework_name.conf', 'task',
+             'start', '--output-file', 'test_files_dir/outputs/yardstick.out',
+             '--suite', 'test_files_dir/inputs/yardstick-suite.yaml'])
 
+    @mock.patch.object(YardstickExecutor, 'optimize_image',
+                       side_effect=lambda name, path: (path, 'qcow2'))
+    @mock.patch('harbinger.executors.base.SingleFlight')
     @mock.patch.object(YardstickExecutor, '_exec_cmd')
     @mock.patch.object(YardstickExecutor, 'create_test_suite')
     @mock.patch.object(YardstickExecutor, 'create_yardstick_conf')
     @mock.patch.object(YardstickExecutor, 'create_image')
-    @mock.patch('harbinger.common.utils.Utils.source_openrc')
     @mock.patch('harbinger.common.utils.Utils.hierarchy_lookup')
     @mock.patch('harbinger.executors.base.BaseExecutor.setup')
     def test_setup_negatives(self, mock_base_setup, mock_hierarchy_lookup,
-                             mock_source_openrc, mock_create_image,
+                             mock_create_image,
                              mock_create_yardstick_conf,
-                             mock_create_test_suite, mock_exec_cmd):
+                             mock_create_test_suite, mock_exec_cmd,
+                             mock_single_flight, mock_optimize_image):
+        mock_single_flight.return_value.run.side_effect = \
+            lambda done, build: build()
         test_object = self._get_test_object()
-        mock_hierarchy_lookup.side_effect = [
-            'test_flavor_name', 'test_image_name'
-        ]
+        mock_hierarchy_lookup.side_effect = lambda executor, prop: {
+            'flavor_name': 'test_flavor_name', 'image': 'test_image_name'
+        }.get(prop)
         test_object.flavor.check_flavor.return_value = True
         test_object.image.check_image.return_value = True
         test_object.setup()
@@ -130,12 +155,80 @@ class TestYardstickExecutor(unittest.TestCase):
         test_object.image.upload_image.assert_not_called()
         mock_create_yardstick_conf.assert_called_once()
         mock_create_test_suite.assert_called_once()
-        mock_source_openrc.assert_called_once_with(test_object)
         mock_exec_cmd.assert_called_once_with(
-            'yardstick --config-file test_files_dir/inputs/'
-            'test_framework_name.conf task start --output-file '
-            'test_files_dir/outputs/yardstick.out --suite '
-            'test_files_dir/inputs/yardstick-suite.yaml')
+            ['yardstick', '--config-file',
+             'test_files_dir/inputs/test_framework_name.conf', 'task',
+             'start', '--output-file', 'test_files_dir/outputs/yardstick.out',
+             '--suite', 'test_files_dir/inputs/yardstick-suite.yaml'])
+
+    @mock.patch.object(YardstickExecutor, 'merge_outputs')
+    @mock.patch.object(YardstickExecutor, 'merge_json_outputs')
+    @mock.patch.object(YardstickExecutor, 'execute_commands')
+    @mock.patch.object(YardstickExecutor, 'create_test_suite')
+    @mock.patch.object(YardstickExecutor, 'create_yardstick_conf')
+    @mock.patch('harbinger.common.utils.Utils.hierarchy_lookup',
+                return_value='yardstick.json')
+    def test_run_tests_sharded(self, mock_hierarchy_lookup, mock_create_conf,
+                               mock_create_test_suite, mock_execute_commands,
+                               mock_merge_json, mock_merge):
+        test_object = self._get_test_object()
+        test_object.shards = 2
+        test_object.collected_tests_list = ['xt1', 'xt2']
+        test_object.run_tests()
+
+        mock_create_conf.assert_has_calls([
+            mock.call('test_files_dir/inputs/test_framework_name-0.conf',
+                      'test_files_dir/outputs/yardstick-0.json'),
+            mock.call('test_files_dir/inputs/test_framework_name-1.conf',
+                      'test_files_dir/outputs/yardstick-1.json'),
+        ])
+        mock_create_test_suite.assert_has_calls([
+            mock.call([{'file_name': 't1'}], 'yardstick-suite-0.yaml'),
+            mock.call([{'file_name': 't2'}], 'yardstick-suite-1.yaml'),
+        ])
+        mock_execute_commands.assert_called_once_with([
+            ['yardstick', '--config-file',
+             'test_files_dir/inputs/test_framework_name-0.conf', 'task',
+             'start', '--output-file',
+             'test_files_dir/outputs/yardstick-0.out',
+             '--suite', 'test_files_dir/inputs/yardstick-suite-0.yaml'],
+            ['yardstick', '--config-file',
+             'test_files_dir/inputs/test_framework_name-1.conf', 'task',
+             'start', '--output-file',
+             'test_files_dir/outputs/yardstick-1.out',
+             '--suite', 'test_files_dir/inputs/yardstick-suite-1.yaml'],
+        ])
+        mock_merge_json.assert_called_once_with([
+            'test_files_dir/outputs/yardstick-0.out',
+            'test_files_dir/outputs/yardstick-1.out'
+        ], 'test_files_dir/outputs/yardstick.out')
+        mock_merge.assert_called_once_with([
+            'test_files_dir/outputs/yardstick-0.json',
+            'test_files_dir/outputs/yardstick-1.json'
+        ], 'test_files_dir/outputs/yardstick.json')
+
+    def test_parse_durations(self):
+        test_object = self._get_test_object()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        test_object.outputs_full_path = os.path.join(temp_dir, 'out')
+        self.assertEqual(test_object.parse_durations(), {})
+
+        with open(test_object.outputs_full_path, 'w') as output_file:
+            json.dump({
+                'status': 1,
+                'result': {
+                    'testcases': {
+                        'ping': {
+                            'tc_data': [{'timestamp': 10.0},
+                                        {'timestamp': 42.5}]
+                        },
+                        'no_data': {'tc_data': []}
+                    }
+                }
+            }, output_file)
+
+        self.assertEqual(test_object.parse_durations(), {'ping': 32.5})
 
     def test_format_collected_tests(self):
         test_object = self._get_test_object()
@@ -168,6 +261,27 @@ class TestYardstickExecutor(unittest.TestCase):
                                              'test_cases:\n'
                                              '- file_name: test1\n')
 
+    @mock.patch('harbinger.common.utils.Utils.hierarchy_lookup')
+    def test_create_test_suite_flavor(self, mock_lookup):
+        test_object = self._get_test_object()
+        test_object.flavor_name = 'm1.small'
+        mock_lookup.side_effect = lambda executor, prop: {
+            'schema': 'test_schema',
+            'flavor_name': 'yardstick-flavor'}.get(prop)
+        mock_open = mock.mock_open()
+        open_name = 'harbinger.executors.yardstick.open'
+        with mock.patch(open_name, mock_open, create=True):
+            test_object.create_test_suite([{'file_name': 'test1'}])
+        handle = mock_open()
+        handle.write.assert_called_once_with(
+            'schema: test_schema\n'
+            'name: yardstick-suite.yaml\n'
+            'test_cases_dir: test_paths\n'
+            'test_cases:\n'
+            '- file_name: test1\n'
+            '  task_args:\n'
+            '    default: \'{"flavor": "m1.small"}\'\n')
+
     @mock.patch('harbinger.common.utils.Utils.hierarchy_lookup')
     def test_create_test_suite_negative(self, mock_lookup):
         test_object = self._get_test_object()
@@ -228,20 +342,39 @@ class TestYardstickExecutor(unittest.TestCase):
             'dispatcher_file')
         test_object.config.write.assert_called_once()
 
-    @mock.patch('harbinger.common.utils.Utils.source_openrc')
     @mock.patch.object(YardstickExecutor, '_exec_cmd')
-    def test_create_image(self, mock_exec_cmd, mock_source_openrc):
+    def test_create_image(self, mock_exec_cmd):
         test_object = self._get_test_object()
         with mock.patch('harbinger.executors.yardstick.CONF') as mock_conf:
             mock_conf.DEFAULT.files_dir = 'test_files_dir'
             with mock.patch.dict(os.environ, {}, clear=True):
                 test_object.create_image()
-                self.assertTrue(len(os.environ) == 1)
-                self.assertIn('YARD_IMG_ARCH', os.environ)
-                self.assertEqual('amd64', os.environ['YARD_IMG_ARCH'])
+                # the architecture is only set for the build
+                self.assertEqual(len(os.environ), 0)
+        self.assertNotIn('YARD_IMG_ARCH', test_object.environ)
         mock_exec_cmd.assert_called_once_with(
             'apt update && '
             'test_files_dir/frameworks/yardstick/tools/yardstick-img-modify '
             'test_files_dir/frameworks/yardstick/tools/'
-            'ubuntu-server-cloudimg-modify.sh')
-        mock_source_openrc.assert_called_once_with(test_object)
+            'ubuntu-server-cloudimg-modify.sh',
+            environ={'YARD_IMG_ARCH': 'amd64'})
+
+    @mock.patch.object(YardstickExecutor, 'framework_revision')
+    def test_image_recipe(self, mock_revision):
+        test_object = self._get_test_object()
+        mock_revision.return_value = None
+        self.assertIsNone(test_object.image_recipe())
+
+        mock_revision.return_value = 'abc'
+        with mock.patch('harbinger.executors.yardstick.CONF') as mock_conf:
+            mock_conf.DEFAULT.files_dir = 'test_files_dir'
+            self.assertEqual(test_object.image_recipe(), ({
+                'framework': 'test_framework_name',
+                'revision': 'abc',
+                'arch': 'amd64'
+            }, [
+                'test_files_dir/frameworks/yardstick/tools/'
+                'yardstick-img-modify',
+                'test_files_dir/frameworks/yardstick/tools/'
+                'ubuntu-server-cloudimg-modify.sh'
+            ]))
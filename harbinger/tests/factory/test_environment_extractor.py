@@ -28,3 +28,41 @@ class TestEnvironmentExtractor(unittest.TestCase):
     def test_parse_framework(self):
         self.environment = self.test_object.parse_environment(self.yaml_file)
         self.assertEqual("v2", self.environment.OS_API_VERSION)
+
+    def test_parse_environments_default(self):
+        environments = self.test_object.parse_environments(self.yaml_file)
+        self.assertEqual(len(environments), 1)
+        self.assertIsNone(environments[0].target)
+        self.assertEqual("v2", environments[0].OS_API_VERSION)
+
+    def test_parse_environments_targets(self):
+        self.yaml_file["Environment"]["targets"] = [
+            {'name': 'east', 'OS_REGION_NAME': 'east', 'password': 'pw'},
+            {'name': 'west', 'OS_AUTH_URL': 'https://west:5000/'},
+        ]
+        east, west = self.test_object.parse_environments(self.yaml_file)
+        self.assertEqual('east', east.target)
+        self.assertEqual('east', east.OS_REGION_NAME)
+        self.assertEqual('pw', east.password)
+        self.assertEqual('https://identity.openstack:5000/', east.OS_AUTH_URL)
+        self.assertEqual('west', west.target)
+        self.assertEqual('regionOne', west.OS_REGION_NAME)
+        self.assertEqual('https://west:5000/', west.OS_AUTH_URL)
+        self.assertFalse(hasattr(west, 'password'))
+
+    def test_parse_environments_missing_keys(self):
+        del self.yaml_file["Environment"]["OS_AUTH_URL"]
+        self.yaml_file["Environment"]["targets"] = [
+            {'name': 'east', 'OS_AUTH_URL': 'https://east:5000/'},
+            {'name': 'west'},
+        ]
+        with self.assertRaises(RuntimeError) as context:
+            self.test_object.parse_environments(self.yaml_file)
+        self.assertIn("west", str(context.exception))
+        self.assertIn("OS_AUTH_URL", str(context.exception))
+
+    def test_parse_environments_duplicate_names(self):
+        self.yaml_file["Environment"]["targets"] = [
+            {'name': 'east'}, {'name': 'east'}]
+        self.assertRaises(RuntimeError, self.test_object.parse_environments,
+                          self.yaml_file)
@@ -35,6 +35,14 @@ class TestFlavorManager(unittest.TestCase):
                                    'Creating Nova client for framework '
                                    'using keystone: test_auth_url'))
 
+    @mock.patch('harbinger.flavors.flavor_manager.client.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    def test__init_shared_session(self, mock_loader, mock_client):
+        auth_session = mock.Mock()
+        FlavorManager("framework", auth_session, auth_url='test_auth_url')
+        mock_loader.assert_not_called()
+        mock_client.assert_called_once_with(2, session=auth_session)
+
     @log_capture()
     def test_check_flavor(self, capture):
         self.test_object.nova = mock.MagicMock()
@@ -51,7 +59,12 @@ class TestFlavorManager(unittest.TestCase):
         self.assertFalse(self.test_object.check_flavor('f10'))
         self.assertFalse(self.test_object.check_flavor('f38439'))
 
+        # the flavors are listed once for every lookup
+        self.test_object.nova.flavors.list.assert_called_once_with(
+            marker=None, limit=FlavorManager.PAGE_SIZE)
         capture.check(('harbinger.flavors.flavor_manager', 'INFO',
+                       'Listing every flavor in Nova'),
+                      ('harbinger.flavors.flavor_manager', 'INFO',
                        'Flavor <f1> exists: True'),
                       ('harbinger.flavors.flavor_manager', 'INFO',
                        'Flavor <f6> exists: True'),
@@ -60,6 +73,64 @@ class TestFlavorManager(unittest.TestCase):
                       ('harbinger.flavors.flavor_manager', 'INFO',
                        'Flavor <f38439> exists: False'))
 
+    def test_load_snapshot_pages(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.PAGE_SIZE = 2
+
+        pages = [[mock.Mock(id=str(i)) for i in range(start, end)]
+                 for start, end in ((0, 2), (2, 4), (4, 5))]
+        for page in pages:
+            for flavor in page:
+                flavor.name = 'f' + flavor.id
+        self.test_object.nova.flavors.list.side_effect = pages
+
+        self.assertTrue(self.test_object.check_flavor('f4'))
+        self.assertEqual(self.test_object.nova.flavors.list.call_args_list, [
+            mock.call(marker=None, limit=2),
+            mock.call(marker='1', limit=2),
+            mock.call(marker='3', limit=2)
+        ])
+
+    def test_create_flavor_snapshot(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.nova.flavors.list.return_value = []
+        self.assertFalse(self.test_object.check_flavor('f1'))
+
+        self.test_object.create_flavor('f1', '2048', '4', '1')
+        self.assertTrue(self.test_object.check_flavor('f1'))
+        self.test_object.nova.flavors.list.assert_called_once()
+
+    def test_check_flavor_cached(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.cache = mock.Mock()
+        self.test_object.cache.lookup.return_value = {'f1': 'id1'}
+        self.assertTrue(self.test_object.check_flavor('f1'))
+        self.assertFalse(self.test_object.check_flavor('f2'))
+        self.test_object.cache.lookup.assert_called_with('flavors')
+        self.test_object.nova.flavors.list.assert_not_called()
+
+        self.test_object.cache.lookup.return_value = None
+        flavor = mock.Mock(id='id2')
+        flavor.name = 'f2'
+        self.test_object.nova.flavors.list.return_value = [flavor]
+        self.assertTrue(self.test_object.check_flavor('f2'))
+        self.test_object.cache.store.assert_called_once_with(
+            'flavors', {'f2': 'id2'})
+
+    def test_prefetch(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.cache = mock.Mock()
+        self.test_object.cache.refresh.return_value = {'f1': 'id1'}
+        self.test_object.prefetch()
+        self.test_object.cache.refresh.assert_called_once_with(
+            'flavors', self.test_object.list_flavors)
+        self.assertEqual(self.test_object.snapshot, {'f1': 'id1'})
+
+        self.test_object.create_flavor('f2', '2048', '4', '1')
+        self.test_object.cache.invalidate.assert_called_once_with('flavors')
+        self.assertEqual(self.test_object.snapshot['f2'],
+                         self.test_object.nova.flavors.create.return_value.id)
+
     @log_capture()
     def test_create_flavor(self, capture):
         self.test_object.nova = mock.MagicMock(autospec=True)
@@ -67,3 +138,55 @@ class TestFlavorManager(unittest.TestCase):
         capture.check(
             ('harbinger.flavors.flavor_manager', 'INFO', 'Creating flavor f1'))
         self.test_object.nova.flavors.create.assert_called_once()
+
+    def _flavor(self, name, ram, vcpus, disk, swap='', extra_specs=None,
+                disabled=False):
+        flavor = mock.Mock(ram=ram, vcpus=vcpus, disk=disk, swap=swap,
+                           id=name + '_id')
+        flavor.name = name
+        flavor.get_keys.return_value = extra_specs or {}
+        setattr(flavor, 'OS-FLV-DISABLED:disabled', disabled)
+        return flavor
+
+    def test_create_flavor_extra_specs(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.index = {}
+        self.test_object.create_flavor('f1', 2048, 4, 1,
+                                       extra_specs={'hw:numa_nodes': '1'})
+        self.test_object.nova.flavors.create.return_value.set_keys.\
+            assert_called_once_with({'hw:numa_nodes': '1'})
+        self.assertIsNone(self.test_object.index)
+
+    def test_match_flavor(self):
+        self.test_object.nova = mock.MagicMock()
+        self.test_object.nova.flavors.list.return_value = [
+            self._flavor('m1.large', 8192, 4, 80),
+            self._flavor('same', 512, 1, 3, 100, {'hw:numa_nodes': '1'}),
+            self._flavor('m1.small', 2048, 1, 20),
+            self._flavor('m1.tiny', 512, 1, 1),
+            self._flavor('bigger', 1024, 2, 3, 100, disabled=True),
+            self._flavor('pinned', 2048, 1, 20, '',
+                         {'hw:cpu_policy': 'dedicated'}),
+        ]
+        spec = {'ram': 512, 'vcpus': 1, 'disk': 3, 'swap': 100}
+
+        self.assertEqual(self.test_object.match_flavor(
+            spec, {'hw:numa_nodes': 1}, 'exact'), 'same')
+        self.assertIsNone(self.test_object.match_flavor(spec, None, 'exact'))
+        # the closest larger flavor with the fewest extra specs, disabled
+        # flavors and ones too small are left out
+        self.assertEqual(self.test_object.match_flavor(
+            {'ram': 1024, 'vcpus': 1, 'disk': 3}), 'm1.small')
+        self.assertEqual(self.test_object.match_flavor(
+            {'ram': 1024, 'vcpus': 1, 'disk': 3},
+            {'hw:cpu_policy': 'dedicated'}), 'pinned')
+        self.assertIsNone(self.test_object.match_flavor(
+            {'ram': 512, 'vcpus': 8, 'disk': 3}))
+        self.assertIsNone(self.test_object.match_flavor(spec, None, 'none'))
+        # nova is listed once, extra specs are read once per flavor
+        self.test_object.nova.flavors.list.assert_called_once()
+        for flavor in self.test_object.nova.flavors.list.return_value:
+            self.assertLessEqual(flavor.get_keys.call_count, 1)
+
+        self.test_object.forget()
+        self.assertIsNone(self.test_object.index)
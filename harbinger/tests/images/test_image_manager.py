@@ -1,6 +1,11 @@
+import hashlib
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
+from glanceclient import exc
 from testfixtures import log_capture
 
 from harbinger.images.image_manager import ImageManager
@@ -34,52 +39,207 @@ class TestImageManager(unittest.TestCase):
                        'Creating Glance client for test_label '
                        'using keystone: test_auth_url'), )
 
+    @mock.patch('harbinger.images.image_manager.Client')
+    @mock.patch('keystoneauth1.loading.get_plugin_loader')
+    def test___init___shared_session(self, mock_loader, mock_client):
+        auth_session = mock.Mock()
+        ImageManager('test_label', auth_session, auth_url='test_auth_url')
+        mock_loader.assert_not_called()
+        mock_client.assert_called_once_with('2', session=auth_session)
+
     @log_capture()
     def test_check_image(self, capture):
         test_object = self._get_test_object()
-        test_object.glance.images.list.side_effect = [[{
-            'name': 'test_image1'
-        }, {
-            'name': 'test_image2'
-        }]]
+        test_object.glance.images.list.side_effect = [[]]
         self.assertFalse(test_object.check_image('test_image_name'))
         capture.check_present(
             ('harbinger.images.image_manager', 'INFO',
              'Image <test_image_name> exists in Glance: False'), )
         test_object.glance.images.list.side_effect = [[{
-            'name': 'test_image1'
-        }, {
-            'name':
-            'test_image_name'
+            'id': 'test_id',
+            'name': 'test_image_name'
+        }]]
+        self.assertEqual(test_object.find_image('test_image_name'),
+                         'test_id')
+        test_object.glance.images.list.side_effect = [[{
+            'id': 'test_id',
+            'name': 'test_image_name'
         }]]
         self.assertTrue(test_object.check_image('test_image_name'))
         capture.check_present(
             ('harbinger.images.image_manager', 'INFO',
              'Image <test_image_name> exists in Glance: True'), )
+        test_object.glance.images.list.assert_called_with(
+            filters={'name': 'test_image_name'}, limit=1)
+        self.assertIsNone(test_object.snapshot)
+
+    def test_check_image_unfiltered(self):
+        test_object = self._get_test_object()
+        # glance ignored the name filter, every image is listed once
+        test_object.glance.images.list.side_effect = [[{
+            'id': 'test_id1',
+            'name': 'test_image1'
+        }], [{
+            'id': 'test_id1',
+            'name': 'test_image1'
+        }, {
+            'id': 'test_id',
+            'name': 'test_image_name'
+        }]]
+        self.assertTrue(test_object.check_image('test_image_name'))
+        self.assertFalse(test_object.check_image('test_image2'))
+        self.assertEqual(test_object.glance.images.list.call_args_list, [
+            mock.call(filters={'name': 'test_image_name'}, limit=1),
+            mock.call()
+        ])
+
+    def test_check_image_bad_request(self):
+        test_object = self._get_test_object()
+        test_object.glance.images.list.side_effect = [
+            exc.HTTPBadRequest('test_exception'), [{
+                'id': 'test_id',
+                'name': 'test_image_name'
+            }]
+        ]
+        self.assertTrue(test_object.check_image('test_image_name'))
+        self.assertEqual(test_object.snapshot, {'test_image_name': 'test_id'})
+
+    def test_check_image_cached(self):
+        test_object = self._get_test_object()
+        test_object.cache = mock.Mock()
+        test_object.cache.lookup.return_value = {'test_image_name': 'test_id'}
+        self.assertTrue(test_object.check_image('test_image_name'))
+        self.assertFalse(test_object.check_image('test_image2'))
+        test_object.cache.lookup.assert_called_with('images')
+        test_object.glance.images.list.assert_not_called()
+
+        # a stale cache is filled again when the catalog is listed
+        test_object.cache.lookup.return_value = None
+        test_object.glance.images.list.side_effect = [[{
+            'id': 'test_id1',
+            'name': 'test_image1'
+        }], [{
+            'id': 'test_id',
+            'name': 'test_image_name'
+        }]]
+        self.assertTrue(test_object.check_image('test_image_name'))
+        test_object.cache.store.assert_called_once_with(
+            'images', {'test_image_name': 'test_id'})
+
+    def test_check_image_shared(self):
+        test_object = self._get_test_object()
+        test_object.session = mock.Mock()
+        test_object.session.get_project_id.return_value = 'test_project_id'
+        test_object.cache = mock.Mock()
+        test_object.cache.lookup.return_value = {}
+        test_object.glance.images.list.side_effect = [[{
+            'id': 'test_id',
+            'name': 'test_image_name',
+            'visibility': 'shared'
+        }]]
+        self.assertTrue(test_object.check_image('test_image_name',
+                                                'test_home_id'))
+        test_object.glance.images.list.assert_called_once_with(
+            filters={'visibility': 'shared', 'member_status': 'all',
+                     'name': 'test_image_name', 'owner': 'test_home_id'},
+            limit=1)
+        # the pending membership is accepted
+        test_object.glance.image_members.update.assert_called_once_with(
+            'test_id', 'test_project_id', 'accepted')
+        test_object.cache.invalidate.assert_called_once_with('images')
+
+        test_object.glance.images.list.side_effect = [[], [{
+            'id': 'test_id',
+            'name': 'test_image_name',
+            'visibility': 'community'
+        }]]
+        self.assertTrue(test_object.check_image('test_image_name',
+                                                'test_home_id'))
+        test_object.glance.images.list.assert_called_with(
+            filters={'visibility': 'community', 'name': 'test_image_name',
+                     'owner': 'test_home_id'}, limit=1)
+        test_object.glance.image_members.update.assert_called_once()
+
+        test_object.glance.images.list.side_effect = [[], []]
+        self.assertFalse(test_object.check_image('test_image_name',
+                                                 'test_home_id'))
+
+    def test_share_image(self):
+        test_object = self._get_test_object()
+        test_object.snapshot = {'test_image_name': 'test_id'}
+        test_object.glance.images.get.return_value = {'visibility': 'private'}
+        self.assertEqual(
+            test_object.share_image('test_image_name', 'test_project_id'),
+            'test_id')
+        test_object.glance.images.update.assert_called_once_with(
+            'test_id', visibility='shared')
+        test_object.glance.image_members.create.assert_called_once_with(
+            'test_id', 'test_project_id')
+
+        # a project already member of the image is fine
+        test_object.glance.images.update.reset_mock()
+        test_object.glance.images.get.return_value = {'visibility': 'shared'}
+        test_object.glance.image_members.create.side_effect = \
+            exc.HTTPConflict('test_exception')
+        test_object.share_image('test_image_name', 'test_project_id')
+        test_object.glance.images.update.assert_not_called()
+
+        test_object.share_image('test_image_name', 'test_project_id',
+                                'community')
+        test_object.glance.images.update.assert_called_once_with(
+            'test_id', visibility='community')
+
+    def test_share_image_missing(self):
+        test_object = self._get_test_object()
+        test_object.snapshot = {}
+        with self.assertRaises(RuntimeError):
+            test_object.share_image('test_image_name', 'test_project_id')
+
+    def test_prefetch(self):
+        test_object = self._get_test_object()
+        test_object.prefetch()
+
+        test_object.cache = mock.Mock()
+        test_object.cache.refresh.return_value = {'test_image_name': 'test_id'}
+        test_object.prefetch()
+        test_object.cache.refresh.assert_called_once_with(
+            'images', test_object.list_images)
+        self.assertEqual(test_object.snapshot, {'test_image_name': 'test_id'})
+
+    def _image_file(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        with open(os.path.join(temp_dir, 'test_image_name.img'),
+                  'wb') as image_file:
+            image_file.write(b'image data')
+        return temp_dir
 
     @log_capture()
     def test_upload_image_success(self, capture):
         test_object = self._get_test_object()
-        with mock.patch('harbinger.images.image_manager.CONF') as mock_conf:
-            mock_conf.DEFAULT.files_dir = 'test_dir'
-            with mock.patch('os.listdir') as mock_listdir:
-                mock_listdir.side_effect = [
-                    ['wrong_file', 'test_image_name'],
-                ]
-                mock_open = mock.mock_open()
-                open_name = 'harbinger.images.image_manager.open'
-                with mock.patch(open_name, mock_open, create=True):
-                    test_object.upload_image('test_image_name',
-                                             'test_disk_format',
-                                             'test_container_format')
-                    test_object.glance.images.create.assert_called()
-                    test_object.glance.images.upload.assert_called()
-                    capture.check_present(
-                        ('harbinger.images.image_manager', 'INFO',
-                         'Uploading image <test_image_name> into Glance....'),
-                        ('harbinger.images.image_manager', 'INFO',
-                         'Image <test_image_name> uploaded into Glance'),
-                    )
+        test_object.cache = mock.Mock()
+        test_object.glance.images.get_import_info.side_effect = \
+            exc.HTTPNotFound()
+        test_object.glance.images.get.return_value = {
+            'status': 'active', 'checksum': hashlib.md5(  # nosec
+                b'image data').hexdigest()}
+        sent = []
+        test_object.glance.images.upload.side_effect = \
+            lambda image_id, stream, size: sent.append(stream.read(size))
+
+        test_object.upload_image('test_image_name', 'test_disk_format',
+                                 'test_container_format', self._image_file())
+        test_object.glance.images.create.assert_called_once_with(
+            name='test_image_name', disk_format='test_disk_format',
+            container_format='test_container_format')
+        self.assertEqual(sent, [b'image data'])
+        test_object.cache.invalidate.assert_called_once_with('images')
+        capture.check_present(
+            ('harbinger.images.image_manager', 'INFO',
+             'Uploading image <test_image_name> into Glance....'),
+            ('harbinger.images.image_manager', 'INFO',
+             'Image <test_image_name> uploaded into Glance'),
+        )
 
     def test_upload_image_missing_file(self):
         test_object = self._get_test_object()
@@ -102,28 +262,118 @@ class TestImageManager(unittest.TestCase):
     @log_capture()
     def test_upload_image_glance_error(self, capture):
         test_object = self._get_test_object()
-        with mock.patch('harbinger.images.image_manager.CONF') as mock_conf:
-            mock_conf.DEFAULT.files_dir = 'test_dir'
-            with mock.patch('os.listdir') as mock_listdir:
-                mock_listdir.side_effect = [
-                    ['wrong_file', 'test_image_name'],
-                ]
-                mock_open = mock.mock_open()
-                open_name = 'harbinger.images.image_manager.open'
-                with mock.patch(open_name, mock_open, create=True):
-                    test_object.glance.images.upload.side_effect = OSError(
-                        'test_exception')
-                    with self.assertRaises(OSError):
-                        test_object.upload_image('test_image_name',
-                                                 'test_disk_format',
-                                                 'test_container_format')
-                        test_object.glance.images.create.assert_called()
-                        test_object.glance.images.upload.assert_called()
-                        capture.check_present(
-                            ('harbinger.images.image_manager', 'INFO',
-                             'Uploading image <test_image_name> '
-                             'into Glance....'),
-                            ('harbinger.images.image_manager', 'ERROR',
-                             'Error connecting to Glance, check proxy and '
-                             'no_proxy settings\ntest_exception'),
-                        )
+        test_object.glance.images.get_import_info.side_effect = \
+            exc.HTTPNotFound()
+        test_object.glance.images.upload.side_effect = OSError(
+            'test_exception')
+        with self.assertRaises(OSError):
+            test_object.upload_image('test_image_name', 'test_disk_format',
+                                     'test_container_format',
+                                     self._image_file())
+        # only transient errors are retried
+        test_object.glance.images.upload.assert_called_once()
+        capture.check_present(
+            ('harbinger.images.image_manager', 'INFO',
+             'Uploading image <test_image_name> into Glance....'),
+            ('harbinger.images.image_manager', 'ERROR',
+             'Error connecting to Glance, check proxy and '
+             'no_proxy settings\ntest_exception'),
+        )
+        # the image created for the upload is not left behind
+        image_id = test_object.glance.images.create.return_value.id
+        test_object.glance.images.delete.assert_called_once_with(image_id)
+
+        test_object.glance.images.delete.side_effect = exc.HTTPForbidden()
+        with self.assertRaises(OSError):
+            test_object.upload_image('test_image_name', 'test_disk_format',
+                                     'test_container_format',
+                                     self._image_file())
+        self.assertEqual(capture.records[-1].levelname, 'WARNING')
+
+    @mock.patch('harbinger.images.image_manager.time.sleep')
+    def test_send_image_retries(self, mock_sleep):
+        test_object = self._get_test_object()
+        test_object.glance.images.get_import_info.return_value = {}
+        test_object.glance.images.get.return_value = {}
+        errors = [exc.CommunicationError('reset'),
+                  exc.HTTPServiceUnavailable('busy')]
+
+        def upload(image_id, stream, size):
+            stream.read(size)
+            if errors:
+                raise errors.pop(0)
+
+        test_object.glance.images.upload.side_effect = upload
+        image_path = os.path.join(self._image_file(), 'test_image_name.img')
+        test_object.send_image('id', image_path, 'test_image_name')
+        self.assertEqual(test_object.glance.images.upload.call_count, 3)
+        self.assertEqual(mock_sleep.call_args_list,
+                         [mock.call(2), mock.call(4)])
+
+        test_object.glance.images.upload.reset_mock()
+        test_object.glance.images.upload.side_effect = \
+            exc.CommunicationError('reset')
+        with self.assertRaises(exc.CommunicationError):
+            test_object.send_image('id', image_path, 'test_image_name')
+        self.assertEqual(test_object.glance.images.upload.call_count,
+                         ImageManager.UPLOAD_RETRIES)
+
+    def test_send_image_incomplete(self):
+        test_object = self._get_test_object()
+        test_object.UPLOAD_RETRIES = 1
+        test_object.glance.images.get_import_info.return_value = {}
+        # the client stopped reading before the end of the file
+        test_object.glance.images.upload.side_effect = \
+            lambda image_id, stream, size: stream.read(2)
+        image_path = os.path.join(self._image_file(), 'test_image_name.img')
+        with self.assertRaises(exc.CommunicationError):
+            test_object.send_image('id', image_path, 'test_image_name')
+
+    @mock.patch('harbinger.images.image_manager.time.sleep')
+    def test_send_image_import(self, mock_sleep):
+        test_object = self._get_test_object()
+        test_object.glance.images.get_import_info.return_value = {
+            'import-methods': {'value': ['glance-direct', 'web-download']}}
+        test_object.glance.images.stage.side_effect = \
+            lambda image_id, stream, size: stream.read(size)
+        test_object.glance.images.image_import.side_effect = [
+            exc.HTTPBadGateway('proxy'), None
+        ]
+        test_object.glance.images.get.side_effect = [
+            {'status': 'importing'}, {'status': 'active'},
+            {'status': 'active', 'os_hash_algo': 'sha512',
+             'os_hash_value': hashlib.sha512(b'image data').hexdigest()}
+        ]
+        image_path = os.path.join(self._image_file(), 'test_image_name.img')
+        test_object.send_image('id', image_path, 'test_image_name')
+
+        # the failed import is retried from the staged data
+        test_object.glance.images.stage.assert_called_once()
+        self.assertEqual(test_object.glance.images.image_import.call_args,
+                         mock.call('id', method='glance-direct'))
+        self.assertEqual(test_object.glance.images.image_import.call_count,
+                         2)
+        test_object.glance.images.upload.assert_not_called()
+
+    def test_send_image_import_killed(self):
+        test_object = self._get_test_object()
+        test_object.glance.images.get_import_info.return_value = {
+            'import-methods': {'value': ['glance-direct']}}
+        test_object.glance.images.stage.side_effect = \
+            lambda image_id, stream, size: stream.read(size)
+        test_object.glance.images.get.return_value = {'status': 'killed'}
+        image_path = os.path.join(self._image_file(), 'test_image_name.img')
+        with self.assertRaises(RuntimeError):
+            test_object.send_image('id', image_path, 'test_image_name')
+
+    def test_send_image_checksum_mismatch(self):
+        test_object = self._get_test_object()
+        test_object.glance.images.get_import_info.return_value = {}
+        test_object.glance.images.upload.side_effect = \
+            lambda image_id, stream, size: stream.read(size)
+        test_object.glance.images.get.return_value = {'checksum': 'other'}
+        image_path = os.path.join(self._image_file(), 'test_image_name.img')
+        with self.assertRaises(RuntimeError) as context:
+            test_object.send_image('id', image_path, 'test_image_name')
+        self.assertIn('The checksum of <test_image_name> in Glance is other',
+                      str(context.exception))
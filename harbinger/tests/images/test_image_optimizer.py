@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import log_capture
+
+from harbinger.images.image_optimizer import ImageOptimizer
+
+
+class TestImageOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.image_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.image_path)
+        self.source = os.path.join(self.image_path, 'test-image.img')
+        with open(self.source, 'wb') as image_file:
+            image_file.write(b'image data')
+
+    def execute(self, command):
+        # stands in for qemu-img, copies the source to the target
+        source, target = command[-2:]
+        shutil.copyfile(source, target)
+
+    def test___init__(self):
+        self.assertFalse(ImageOptimizer().enabled)
+        self.assertFalse(ImageOptimizer('none').enabled)
+        self.assertTrue(ImageOptimizer('raw').enabled)
+        with self.assertRaises(RuntimeError) as context:
+            ImageOptimizer('zip')
+        self.assertEqual(str(context.exception),
+                         'image_optimization must be one of none, compress, '
+                         'raw, sparsify, got zip')
+
+    def test_optimize_none(self):
+        execute = mock.Mock()
+        self.assertEqual(
+            ImageOptimizer().optimize('test-image', self.image_path,
+                                      execute),
+            (self.image_path, 'qcow2'))
+        execute.assert_not_called()
+
+    @log_capture()
+    def test_optimize(self, capture):
+        execute = mock.Mock(side_effect=self.execute)
+        target_path = os.path.join(self.image_path, 'raw')
+        self.assertEqual(
+            ImageOptimizer('raw').optimize('test-image', self.image_path,
+                                           execute),
+            (target_path, 'raw'))
+        command = execute.call_args[0][0]
+        self.assertEqual(command[:-1],
+                         ['qemu-img', 'convert', '-O', 'raw', self.source])
+        # written under a name of its own, then renamed
+        self.assertRegex(command[-1],
+                         r'^%s/test-image\.raw\..+\.part$' % target_path)
+        self.assertEqual(os.listdir(target_path), ['test-image.raw'])
+        self.assertIn('Optimized image test-image (raw) in',
+                      capture.records[-1].getMessage())
+
+        # the optimized image is reused until the image is built again
+        ImageOptimizer('raw').optimize('test-image', self.image_path,
+                                       execute)
+        execute.assert_called_once()
+        os.utime(self.source, (0, os.path.getmtime(self.source) + 10))
+        ImageOptimizer('raw').optimize('test-image', self.image_path,
+                                       execute)
+        self.assertEqual(execute.call_count, 2)
+
+    def test_optimize_compress(self):
+        execute = mock.Mock(side_effect=self.execute)
+        self.assertEqual(
+            ImageOptimizer('compress').optimize('test-image',
+                                                self.image_path, execute),
+            (os.path.join(self.image_path, 'compress'), 'qcow2'))
+        self.assertEqual(execute.call_args[0][0][:5],
+                         ['qemu-img', 'convert', '-c', '-O', 'qcow2'])
+
+    def test_optimize_failed(self):
+        execute = mock.Mock(side_effect=RuntimeError('qemu-img failed'))
+        with self.assertRaises(RuntimeError):
+            ImageOptimizer('sparsify').optimize('test-image',
+                                                self.image_path, execute)
+        # nothing half written is taken for an optimized image
+        self.assertEqual(
+            os.listdir(os.path.join(self.image_path, 'sparsify')), [])
+
+    def test_optimize_missing(self):
+        with self.assertRaises(OSError):
+            ImageOptimizer('raw').optimize('other-image', self.image_path,
+                                           mock.Mock())
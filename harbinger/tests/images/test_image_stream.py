@@ -0,0 +1,55 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import log_capture
+
+from harbinger.images.image_stream import ImageStream
+
+
+class TestImageStream(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.image_path = os.path.join(temp_dir, 'image.img')
+        with open(self.image_path, 'wb') as image_file:
+            image_file.write(b'0123456789')
+
+    def test_read(self):
+        with ImageStream(self.image_path) as stream:
+            self.assertEqual(stream.size, 10)
+            self.assertEqual(stream.label, 'image.img')
+            chunks = list(iter(lambda: stream.read(4), b''))
+
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+        self.assertTrue(stream.complete)
+        self.assertEqual(stream.checksum,
+                         hashlib.md5(b'0123456789').hexdigest())  # nosec
+        self.assertEqual(stream.sha512.hexdigest(),
+                         hashlib.sha512(b'0123456789').hexdigest())
+
+    def test_incomplete(self):
+        with ImageStream(self.image_path) as stream:
+            stream.read(4)
+        self.assertFalse(stream.complete)
+
+    @log_capture()
+    @mock.patch('harbinger.images.image_stream.time.monotonic')
+    def test_report(self, mock_monotonic, capture):
+        mock_monotonic.return_value = 100
+        with ImageStream(self.image_path, 'image') as stream:
+            mock_monotonic.return_value = 110
+            stream.read(4)
+            mock_monotonic.return_value = 130
+            stream.read(4)
+            mock_monotonic.return_value = 135
+            stream.read(4)
+
+        # at the first report interval and at the end of the file
+        self.assertEqual(len(capture.records), 2)
+        self.assertEqual(capture.records[0].getMessage(),
+                         'Uploaded 0 of 0 MB of <image> at 0.0 MB/s')
+        self.assertEqual(stream.throughput(135), 10 / 1024 ** 2 / 35)
@@ -0,0 +1,29 @@
+import argparse
+import unittest
+
+import mock
+
+from harbinger.list_jobs import ListJobs
+
+
+class TestListJobs(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(spec=argparse.Namespace)
+        self.test_object = ListJobs(app=mock.Mock(), app_args=self.args)
+
+    def test_get_description(self):
+        self.assertEqual(self.test_object.get_description(),
+                         'lists the runs submitted to harbinger serve')
+
+    @mock.patch('harbinger.list_jobs.print')
+    @mock.patch('harbinger.list_jobs.JobClient')
+    def test_take_action(self, mock_client, mock_print):
+        mock_client.return_value.list.return_value = [{
+            'job': 'abc', 'priority': 5, 'state': 'failed', 'submitted': 0,
+            'run_id': 'def', 'result': 'test_error'
+        }]
+        self.test_object.take_action(argparse.Namespace(socket='test.sock'))
+        mock_client.assert_called_once_with('test.sock')
+        table = str(mock_print.call_args[0][0])
+        self.assertRegex(table, r'\| abc +\| 5 +\| failed +\| .+ \| '
+                                r'def +\| test_error +\|')
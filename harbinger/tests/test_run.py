@@ -1,11 +1,18 @@
 import argparse
+import collections
 import signal
+import threading
 import unittest
 
 import mock
 from testfixtures import log_capture
 
+from harbinger.common.cancellation import Cancelled
+from harbinger.common.scheduler import DependencyError
+from harbinger.common.watchdog import CommandTimeout
 from harbinger.run import loader
+from harbinger.run import pool_worker
+from harbinger.run import provision
 from harbinger.run import Run
 from harbinger.run import worker
 from harbinger.run import worker_init
@@ -35,10 +42,10 @@ class TestRun(unittest.TestCase):
         self.assertEqual(self.test_object.frameworks_dict, 'test_framework')
 
     def test_parse_environment(self):
-        short_fn = self.test_object.environment_extractor.parse_environment
-        short_fn.return_value = 'test_environment'
+        short_fn = self.test_object.environment_extractor.parse_environments
+        short_fn.return_value = ['test_environment']
         self.test_object.parse_environment()
-        self.assertEqual(self.test_object.environment, 'test_environment')
+        self.assertEqual(self.test_object.environments, ['test_environment'])
 
     def test_parse_options(self):
         short_fn = self.test_object.options_extractor.parse_options
@@ -73,11 +80,12 @@ class TestRun(unittest.TestCase):
         mock_parse_opts.assert_called_once()
         mock_begin.assert_called_once()
 
+    @mock.patch('harbinger.run.RunJournal')
     @mock.patch.object(Run, 'execute_serial')
     @mock.patch('harbinger.run.Core')
     @mock.patch.object(Run, 'load_yaml')
     def test_begin_serial(self, mock_load_yaml, mock_core,
-                          mock_execute_serial):
+                          mock_execute_serial, mock_journal):
         self.test_object.directory_manager = mock.Mock()
         self.test_object.options = mock.Mock()
         self.test_object.options.execution_mode = 'serial'
@@ -86,11 +94,12 @@ class TestRun(unittest.TestCase):
         mock_core.assert_called_once()
         mock_execute_serial.assert_called_once()
 
+    @mock.patch('harbinger.run.RunJournal')
     @mock.patch.object(Run, 'execute_parallel')
     @mock.patch('harbinger.run.Core')
     @mock.patch.object(Run, 'load_yaml')
     def test_begin_parallel(self, mock_load_yaml, mock_core,
-                            mock_execute_parallel):
+                            mock_execute_parallel, mock_journal):
         self.test_object.directory_manager = mock.Mock()
         self.test_object.options = mock.Mock()
         self.test_object.options.execution_mode = 'parallel'
@@ -99,26 +108,472 @@ class TestRun(unittest.TestCase):
         mock_core.assert_called_once()
         mock_execute_parallel.assert_called_once()
 
+    @mock.patch('harbinger.run.RunJournal')
+    @mock.patch.object(Run, 'execute_threads')
+    @mock.patch('harbinger.run.Core')
+    @mock.patch.object(Run, 'load_yaml')
+    def test_begin_threads(self, mock_load_yaml, mock_core,
+                           mock_execute_threads, mock_journal):
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.test_object.options.execution_mode = 'threads'
+        self.test_object.begin()
+        mock_execute_threads.assert_called_once()
+
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.RunJournal')
+    @mock.patch.object(Run, 'execute_threads')
+    @mock.patch('harbinger.run.Core')
+    @mock.patch.object(Run, 'load_yaml')
+    def test_begin_cancelled(self, mock_load_yaml, mock_core,
+                             mock_execute_threads, mock_journal, mock_groups):
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock(execution_mode='threads')
+        mock_execute_threads.side_effect = Cancelled('test_cancel')
+        self.assertRaises(Cancelled, self.test_object.begin)
+        # the run clears its cancellation once it is over
+        mock_groups.reset.assert_called_once_with()
+
+    @mock.patch('harbinger.run.RunJournal')
+    def test_start_journal_new_run(self, mock_journal):
+        mock_journal.new_run_id.return_value = 'abc'
+        mock_journal.return_value.run_id = 'abc'
+        self.args.resume = None
+        self.args.yaml_path = 'test.yaml'
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.test_object.start_journal()
+        self.test_object.directory_manager.archive_outputs.assert_called_once()
+        mock_journal.assert_called_once_with('abc')
+        mock_journal.return_value.create.assert_called_once_with('test.yaml')
+        self.assertEqual(self.test_object.options.run_id, 'abc')
+
+    @mock.patch('harbinger.run.RunJournal')
+    def test_start_journal_run_id(self, mock_journal):
+        self.args.resume = None
+        self.args.run_id = 'job1'
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.test_object.start_journal()
+        mock_journal.assert_called_once_with('job1')
+        mock_journal.new_run_id.assert_not_called()
+
+    @mock.patch('harbinger.run.RunJournal')
+    def test_start_journal_resume(self, mock_journal):
+        mock_journal.return_value.run_id = 'abc'
+        mock_journal.return_value.exists.return_value = True
+        mock_journal.return_value.matches.return_value = True
+        self.args.resume = 'abc'
+        self.args.yaml_path = 'test.yaml'
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.test_object.start_journal()
+        mock_journal.return_value.matches.assert_called_once_with('test.yaml')
+        self.test_object.directory_manager.archive_outputs.assert_not_called()
+        mock_journal.return_value.create.assert_not_called()
+        self.assertEqual(self.test_object.options.run_id, 'abc')
+
+    @mock.patch('harbinger.run.RunJournal')
+    def test_start_journal_resume_missing(self, mock_journal):
+        mock_journal.return_value.exists.return_value = False
+        self.args.resume = 'abc'
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.assertRaises(RuntimeError, self.test_object.start_journal)
+
+    @mock.patch('harbinger.run.RunJournal')
+    def test_start_journal_resume_other_yaml(self, mock_journal):
+        mock_journal.return_value.exists.return_value = True
+        mock_journal.return_value.matches.return_value = False
+        mock_journal.return_value.load.return_value = {'yaml': 'first.yaml'}
+        self.args.resume = 'abc'
+        self.args.yaml_path = 'other.yaml'
+        self.test_object.directory_manager = mock.Mock()
+        self.test_object.options = mock.Mock()
+        self.assertRaises(RuntimeError, self.test_object.start_journal)
+        mock_journal.return_value.create.assert_not_called()
+
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_resumed(self, mock_worker):
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('first', 'first'), ('second', 'second')])
+        self.test_object.environments = ['test_env']
+        self.test_object.options = 'test_options'
+        self.test_object.journal = mock.Mock()
+        self.test_object.journal.completed.side_effect = \
+            lambda name: name == 'first'
+        self.test_object.execute_serial()
+        mock_worker.assert_called_once_with(
+            ['second', 'second', 'test_env', 'test_options'])
+
     @mock.patch('harbinger.run.worker')
     def test_execute_serial(self, mock_worker):
         self.test_object.frameworks_dict = {'key': 'val'}
-        self.test_object.environment = 'test_env'
+        self.test_object.environments = ['test_env']
         self.test_object.options = 'test_options'
         self.test_object.execute_serial()
         mock_worker.assert_called_once_with(
             ['key', 'val', 'test_env', 'test_options'])
 
-    @mock.patch('harbinger.run.worker_init', return_value='worker_id')
-    @mock.patch('harbinger.run.multiprocessing.Pool')
-    @mock.patch('harbinger.run.os.getpid', return_value='12345')
-    def test_execute_parallel(self, mock_getpid, mock_pool, mock_worker_init):
+    @mock.patch('harbinger.run.restore_signal_handlers')
+    @mock.patch('harbinger.run.install_signal_handlers')
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_cancelled(self, mock_worker, mock_install,
+                                      mock_restore):
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('first', 'first'), ('second', 'second')])
+        self.test_object.environments = ['test_env']
+        self.test_object.options = 'test_options'
+        mock_worker.side_effect = Cancelled('test_cancel')
+        self.assertRaises(Cancelled, self.test_object.execute_serial)
+        mock_worker.assert_called_once()
+        mock_install.assert_called_once()
+        mock_restore.assert_called_once_with(mock_install.return_value)
+
+    @log_capture()
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_failure(self, mock_worker, capture):
         self.test_object.frameworks_dict = {'key': 'val'}
-        self.test_object.environment = 'test_env'
+        self.test_object.environments = ['test_env']
+        self.test_object.options = mock.Mock(provisioning_threads=0,
+                                             concurrency_budget=None)
+        error = RuntimeError('test_error')
+        error.output_tail = 'last words'
+        mock_worker.side_effect = error
+        self.assertRaises(RuntimeError, self.test_object.execute_serial)
+        # serial mode has no summary to show the last output in
+        capture.check_present(
+            ('harbinger.run', 'ERROR',
+             'Last output of key before it failed:\nlast words'))
+
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_dependencies(self, mock_worker):
+        second = mock.Mock(spec=[])
+        second.depends_on = ['third']
+        third = mock.Mock(spec=[])
+        third.after = ['first']
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('second', second), ('third', third), ('first', 'first')])
+        self.test_object.environments = ['test_env']
+        self.test_object.options = 'test_options'
+        self.test_object.execute_serial()
+        mock_worker.assert_has_calls([
+            mock.call(['first', 'first', 'test_env', 'test_options']),
+            mock.call(['third', third, 'test_env', 'test_options']),
+            mock.call(['second', second, 'test_env', 'test_options']),
+        ])
+
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_targets(self, mock_worker):
+        second = mock.Mock(spec=[])
+        second.depends_on = ['first']
+        east = mock.Mock(spec=[])
+        east.target = 'east'
+        west = mock.Mock(spec=[])
+        west.target = 'west'
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('second', second), ('first', 'first')])
+        self.test_object.environments = [east, west]
         self.test_object.options = 'test_options'
+        scheduler = self.test_object.create_scheduler()
+        self.assertEqual(
+            list(scheduler.units),
+            ['second@east', 'first@east', 'second@west', 'first@west'])
+        self.assertEqual(scheduler.dependencies['second@west'],
+                         ['first@west'])
+
+        self.test_object.execute_serial()
+        mock_worker.assert_has_calls([
+            mock.call(['first', 'first', east, 'test_options']),
+            mock.call(['first', 'first', west, 'test_options']),
+            mock.call(['second', second, east, 'test_options']),
+            mock.call(['second', second, west, 'test_options']),
+        ])
+
+    @mock.patch('harbinger.run.Provisioner')
+    @mock.patch('harbinger.run.worker')
+    def test_execute_serial_provisioning(self, mock_worker,
+                                         mock_provisioner):
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('first', 'first'), ('second', 'second')])
+        self.test_object.environments = ['test_env']
+        self.test_object.options = 'test_options'
+        calls = []
+        provisioner = mock_provisioner.return_value
+        provisioner.wait.side_effect = lambda name: calls.append(name)
+        mock_worker.side_effect = lambda args: calls.append(args[0] + ' run')
+        self.test_object.execute_serial()
+
+        # every framework is submitted up front, each one runs once its
+        # resources are ready while the next ones are provisioned
+        mock_provisioner.assert_called_once_with(provision, 2)
+        provisioner.submit.assert_has_calls([
+            mock.call('first', ('first', 'first', 'test_env',
+                                'test_options')),
+            mock.call('second', ('second', 'second', 'test_env',
+                                 'test_options'))])
+        self.assertEqual(calls,
+                         ['first', 'first run', 'second', 'second run'])
+        provisioner.stop.assert_called_once_with()
+
+    @mock.patch('harbinger.run.Provisioner')
+    def test_start_provisioning_disabled(self, mock_provisioner):
+        self.test_object.frameworks_dict = {'key': 'val'}
+        self.test_object.environments = ['test_env']
+        self.test_object.options = mock.Mock(provisioning_threads=0,
+                                             concurrency_budget=None)
+        scheduler = self.test_object.create_scheduler()
+        self.assertIsNone(
+            self.test_object.start_provisioning(scheduler, ['key']))
+
+        self.test_object.options.provisioning_threads = 8
+        scheduler.mark_completed('key', 'resumed')
+        self.assertIsNone(
+            self.test_object.start_provisioning(scheduler, ['key']))
+        mock_provisioner.assert_not_called()
+
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.Provisioner')
+    def test_provision_parallel(self, mock_provisioner, mock_groups):
+        self.test_object.frameworks_dict = {'key': 'val'}
+        self.test_object.environments = ['test_env']
+        self.test_object.options = mock.Mock(provisioning_threads=None,
+                                             concurrency_budget=None)
+        scheduler = self.test_object.create_scheduler()
+        self.test_object.provision_parallel(scheduler)
+        mock_provisioner.assert_called_once_with(provision, 1)
+        mock_provisioner.return_value.wait_all.assert_called_once()
+        mock_provisioner.return_value.stop.assert_called_once_with()
+
+        # a run cancelled while provisioning stops there
+        mock_groups.check.side_effect = Cancelled('test_cancel')
+        self.assertRaises(Cancelled, self.test_object.provision_parallel,
+                          scheduler)
+        self.assertEqual(mock_provisioner.return_value.stop.call_count, 2)
+        mock_groups.reset.assert_not_called()
+
+    @mock.patch('harbinger.run.Scheduler')
+    @mock.patch('harbinger.run.multiprocessing.Pool')
+    def test_execute_parallel(self, mock_pool, mock_scheduler):
+        self.test_object.frameworks_dict = {'key': 'val'}
+        self.test_object.environments = ['test_env']
+        self.test_object.options = mock.Mock()
+        self.test_object.options.max_parallel = 4
+        self.test_object.options.concurrency_budget = {'vms': 2}
+        mock_scheduler.return_value.run.return_value = {'key': None}
+        mock_scheduler.return_value.units = {
+            'key': (None, ('key', 'val', 'test_env', 'test_options'))
+        }
+        mock_scheduler.return_value.deadline = None
         self.test_object.execute_parallel()
-        mock_getpid.assert_called()
-        mock_worker_init.assert_called_once_with('12345')
-        mock_pool.assert_called_once_with(initializer='worker_id')
+        mock_pool.assert_called_once_with(processes=1,
+                                          initializer=worker_init)
+        mock_scheduler.assert_called_once_with({'vms': 2}, 4)
+        mock_scheduler.return_value.add.assert_called_once_with(
+            'key', None, ('key', 'val', 'test_env', self.test_object.options),
+            [])
+        mock_scheduler.return_value.run.assert_called_once_with(
+            mock_pool.return_value, pool_worker)
+
+    @mock.patch('harbinger.run.Scheduler')
+    @mock.patch('harbinger.run.worker_init')
+    @mock.patch('harbinger.run.multiprocessing.Pool')
+    def test_execute_parallel_failure(self, mock_pool, mock_worker_init,
+                                      mock_scheduler):
+        self.test_object.frameworks_dict = {'key': 'val', 'key2': 'val2'}
+        self.test_object.environments = [None]
+        self.test_object.options = mock.Mock()
+        self.test_object.options.max_parallel = None
+        mock_scheduler.return_value.units = {
+            'key': (None, ('key', 'val', None, None)),
+            'key2': (None, ('key2', 'val2', None, None)),
+        }
+        mock_scheduler.return_value.run.return_value = {
+            'key': None,
+            'key2': OSError('test_error')
+        }
+        mock_scheduler.return_value.deadline = None
+        self.assertRaises(OSError, self.test_object.execute_parallel)
+        mock_pool.return_value.join.assert_called_once()
+
+    @mock.patch('harbinger.run.Scheduler')
+    @mock.patch('harbinger.run.worker_init')
+    @mock.patch('harbinger.run.multiprocessing.Pool')
+    def test_execute_parallel_skipped(self, mock_pool, mock_worker_init,
+                                      mock_scheduler):
+        self.test_object.frameworks_dict = {'key': 'val', 'key2': 'val2'}
+        self.test_object.environments = [None]
+        self.test_object.options = mock.Mock()
+        self.test_object.options.max_parallel = None
+        mock_scheduler.return_value.units = {
+            'key': (None, ('key', 'val', None, None)),
+            'key2': (None, ('key2', 'val2', None, None)),
+        }
+        mock_scheduler.return_value.run.return_value = \
+            collections.OrderedDict([
+                ('key', DependencyError('skipped')),
+                ('key2', OSError('test_error')),
+            ])
+        mock_scheduler.return_value.deadline = None
+        self.assertRaises(OSError, self.test_object.execute_parallel)
+
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.multiprocessing')
+    @mock.patch('harbinger.run.Scheduler')
+    def test_execute_parallel_cancelled(self, mock_scheduler,
+                                        mock_multiprocessing, mock_groups):
+        self.test_object.frameworks_dict = {'key': 'val'}
+        self.test_object.environments = [None]
+        self.test_object.options = mock.Mock()
+        self.test_object.options.max_parallel = 1
+        mock_scheduler.return_value.units = {
+            'key': (None, ('key', 'val', None, None)),
+        }
+        mock_multiprocessing.active_children.return_value = [
+            mock.Mock(pid=11), mock.Mock(pid=12)]
+        handlers = {}
+        scheduler = mock_scheduler.return_value
+        scheduler.deadline = None
+
+        def run(pool, func):
+            handlers['cancel'](signal.SIGINT, None)
+            scheduler.cancel.assert_called_once_with(20)
+            mock_groups.signal.assert_has_calls([
+                mock.call(11, signal.SIGTERM),
+                mock.call(12, signal.SIGTERM)])
+            scheduler.deadline = 1
+            handlers['cancel'](signal.SIGINT, None)
+            mock_groups.terminate.assert_called_once_with([11, 12],
+                                                          grace=0)
+            return {'key': Cancelled('test_cancel')}
+
+        scheduler.run.side_effect = run
+        with mock.patch('harbinger.run.install_signal_handlers') as install:
+            install.side_effect = lambda handler: handlers.update(
+                cancel=handler) or {}
+            self.assertRaises(Cancelled, self.test_object.execute_parallel)
+        mock_multiprocessing.Pool.return_value.terminate.assert_called_once()
+        mock_multiprocessing.Pool.return_value.join.assert_called_once()
+
+    @mock.patch('harbinger.run.worker')
+    def test_execute_threads(self, mock_worker):
+        self.test_object.frameworks_dict = collections.OrderedDict([
+            ('first', 'first'), ('second', 'second')])
+        self.test_object.environments = [None]
+        self.test_object.options = mock.Mock(max_parallel=2,
+                                             concurrency_budget=None,
+                                             provisioning_threads=0)
+        threads = set()
+
+        def run(args):
+            threads.add(threading.current_thread())
+            if args[0] == 'second':
+                raise OSError('test_error')
+
+        mock_worker.side_effect = run
+        self.assertRaises(OSError, self.test_object.execute_threads)
+        self.assertEqual(mock_worker.call_count, 2)
+        # the frameworks ran in threads of this process
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.Scheduler')
+    def test_execute_threads_cancelled(self, mock_scheduler, mock_groups):
+        self.test_object.frameworks_dict = {'key': 'val'}
+        self.test_object.environments = [None]
+        self.test_object.options = mock.Mock(max_parallel=1)
+        mock_scheduler.return_value.units = {
+            'key': (None, ('key', 'val', None, None)),
+        }
+        handlers = {}
+        scheduler = mock_scheduler.return_value
+
+        scheduler.deadline = None
+
+        def run(pool, func):
+            handlers['cancel'](signal.SIGINT, None)
+            # no further frameworks, the running ones stop their commands
+            scheduler.cancel.assert_called_once_with(20)
+            mock_groups.cancel.assert_called_once_with(signal.SIGINT)
+            scheduler.deadline = 1
+            handlers['cancel'](signal.SIGINT, None)
+            mock_groups.stop.assert_called_once_with(grace=0)
+            return {'key': Cancelled('test_cancel')}
+
+        scheduler.run.side_effect = run
+        with mock.patch('harbinger.run.install_signal_handlers') as install:
+            install.side_effect = lambda handler: handlers.update(
+                cancel=handler) or {}
+            with mock.patch('harbinger.run.ThreadPool') as mock_pool:
+                self.assertRaises(Cancelled,
+                                  self.test_object.execute_threads)
+        # what is left running is killed and the threads are waited for
+        self.assertEqual(mock_groups.stop.call_count, 2)
+        mock_pool.return_value.join.assert_called_once_with()
+        mock_groups.reset.assert_not_called()
+
+    @log_capture()
+    def test_log_summary(self, capture):
+        scheduler = mock.Mock()
+        scheduler.units = {
+            'first': (None, ('first', None, None, None)),
+            'second': (None, ('second', None, None, None)),
+            'third': (None, ('third', None, None, None)),
+            'fourth': (None, ('fourth', None, None, None)),
+        }
+        self.test_object.log_summary(
+            scheduler,
+            collections.OrderedDict([
+                ('first', None),
+                ('second', OSError('test_error')),
+                ('third', DependencyError('test_skip')),
+                ('fourth', CommandTimeout('test_timeout')),
+            ]))
+        message = capture.records[-1].getMessage()
+        self.assertRegex(message, r'\| Framework +\| Result +\|')
+        self.assertRegex(message, r'\| first +\| passed +\|')
+        self.assertRegex(message, r'\| second +\| failed: test_error +\|')
+        self.assertRegex(message, r'\| third +\| skipped: test_skip +\|')
+        self.assertRegex(message,
+                         r'\| fourth +\| timed out: test_timeout +\|')
+
+    @log_capture()
+    def test_log_summary_output_tail(self, capture):
+        scheduler = mock.Mock()
+        scheduler.units = {
+            'first': (None, ('first', None, None, None)),
+            'second': (None, ('second', None, None, None)),
+        }
+        error = RuntimeError('command <run> failed with return code 1')
+        error.output_tail = 'Traceback\nValueError: bad scenario'
+        self.test_object.log_summary(
+            scheduler,
+            collections.OrderedDict([('first', error),
+                                     ('second', OSError('test_error'))]))
+        capture.check_present(
+            ('harbinger.run', 'ERROR', 'Last output of first before it '
+             'failed:\nTraceback\nValueError: bad scenario'))
+        self.assertEqual(capture.records[-1].levelname, 'ERROR')
+
+    @log_capture()
+    def test_log_summary_targets(self, capture):
+        east = mock.Mock(target='east')
+        west = mock.Mock(target='west')
+        scheduler = mock.Mock()
+        scheduler.units = {
+            'shaker@east': (None, ('shaker', None, east, None)),
+            'shaker@west': (None, ('shaker', None, west, None)),
+        }
+        self.test_object.log_summary(
+            scheduler,
+            collections.OrderedDict([
+                ('shaker@east', None),
+                ('shaker@west', OSError('test_error')),
+            ]))
+        message = capture.records[-1].getMessage()
+        self.assertRegex(message, r'\| Framework +\| east +\| west +\|')
+        self.assertRegex(message,
+                         r'\| shaker +\| passed +\| failed: test_error +\|')
 
     @mock.patch('harbinger.common.utils.Utils.load_class')
     def test_loader(self, mock_load_class):
@@ -126,41 +581,98 @@ class TestRun(unittest.TestCase):
         mock_load_class.assert_called_once_with(
             'harbinger.executors.test.TestExecutor')
 
-    @log_capture()
-    @mock.patch('harbinger.run.Process')
-    def test_worker_init(self, mock_process, capture):
-        parent = mock.Mock()
-        child1 = mock.Mock()
-        child2 = mock.Mock()
-        child1.pid = 1
-        child2.pid = 2
-        parent.children.return_value = [child1, child2]
-        mock_process.side_effect = [parent, mock.Mock()]
-        self.addCleanup(signal.signal, signal.SIGINT,
-                        signal.getsignal(signal.SIGINT))
-        # all of the following numbers are arbitrary
+    @mock.patch('harbinger.common.utils.Utils.load_class')
+    def test_provision(self, mock_load_class):
+        executor = mock_load_class.return_value.return_value
+        provision('test', 'framework', 'environment', 'options')
+        mock_load_class.return_value.assert_called_once_with(
+            'framework', 'environment', 'options')
+        executor.prefetch_resources.assert_called_once_with()
+        executor.provision.assert_called_once_with()
+        executor.setup.assert_not_called()
+
+    @mock.patch('harbinger.common.utils.Utils.load_class')
+    def test_loader_cancelled(self, mock_load_class):
+        executor = mock_load_class.return_value.return_value
+        executor.setup.side_effect = Cancelled('test_cancel')
+        self.assertRaises(Cancelled, loader, 'test', 'framework',
+                          'environment', 'options')
+        executor.cleanup.assert_called_once()
+
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.os.setpgrp')
+    def test_worker_init(self, mock_setpgrp, mock_groups):
         with mock.patch('harbinger.run.signal.signal') as mock_signal:
-            mock_signal.side_effect = lambda a, b: b(3, 4)
-            with mock.patch('harbinger.run.os.getpid') as mock_getpid:
-                mock_getpid.return_value = 2
-                worker_init(5)
-        child1.kill.assert_called_once()
-        child2.kill.assert_not_called()
-        parent.kill.assert_called_once()
-        capture.check(
-            ('harbinger.run', 'ERROR', 'signal: 3 frame: 4'),
-            ('harbinger.run', 'ERROR', 'exiting child: 1'),
-            ('harbinger.run', 'ERROR', 'exiting parent: 5'),
-            ('harbinger.run', 'ERROR', 'exiting all: 2'),
-        )
+            worker_init()
+            mock_setpgrp.assert_called_once()
+            self.assertEqual(
+                [call[0][0] for call in mock_signal.call_args_list],
+                [signal.SIGINT, signal.SIGTERM])
+            handler = mock_signal.call_args[0][1]
+        handler(signal.SIGTERM, None)
+        mock_groups.cancel.assert_called_once_with(signal.SIGTERM)
 
     @mock.patch('harbinger.run.multiprocessing')
     @mock.patch('harbinger.run.loader')
     def test_worker_success(self, mock_loader, mock_multiprocessing):
-        worker(['test'])
+        worker(['test', None, None, None])
         mock_loader.assert_called()
         mock_multiprocessing.current_process.assert_called()
 
+    @mock.patch('harbinger.run.ProcessGroups')
+    @mock.patch('harbinger.run.worker')
+    def test_pool_worker(self, mock_worker, mock_groups):
+        mock_worker.return_value = 'test_result'
+        self.assertEqual(pool_worker(['test']), 'test_result')
+        mock_worker.assert_called_once_with(['test'])
+        mock_groups.reset.assert_called_once_with()
+
+        # the process is ready for its next framework after a cancellation
+        mock_worker.side_effect = Cancelled('test_cancel')
+        self.assertRaises(Cancelled, pool_worker, ['test'])
+        self.assertEqual(mock_groups.reset.call_count, 2)
+
+    @mock.patch('harbinger.run.multiprocessing')
+    @mock.patch('harbinger.run.loader')
+    def test_worker_thread(self, mock_loader, mock_multiprocessing):
+        names = []
+        mock_loader.side_effect = \
+            lambda *args: names.append(threading.current_thread().name)
+        thread = threading.Thread(target=worker,
+                                  args=(['test', None, None, None],))
+        thread.start()
+        thread.join()
+        self.assertEqual(names, ['test-worker'])
+        # the name of the process is left alone
+        mock_multiprocessing.current_process.assert_not_called()
+
+    @mock.patch('harbinger.run.RunJournal')
+    @mock.patch('harbinger.run.multiprocessing')
+    @mock.patch('harbinger.run.loader')
+    def test_worker_journal(self, mock_loader, mock_multiprocessing,
+                            mock_journal):
+        options = mock.Mock()
+        options.run_id = 'abc'
+        mock_journal.unit_name.return_value = 'test'
+        worker(['test', None, None, options])
+        mock_journal.assert_called_once_with('abc')
+        mock_journal.return_value.set_state.assert_has_calls([
+            mock.call('test', 'running'), mock.call('test', 'completed')])
+
+        mock_loader.side_effect = CommandTimeout('test_timeout')
+        self.assertRaises(CommandTimeout, worker,
+                          ['test', None, None, options])
+        mock_journal.return_value.set_state.assert_called_with(
+            'test', 'timeout')
+
+        mock_loader.side_effect = Cancelled('test_cancel')
+        with mock.patch('harbinger.run.flush_logs') as mock_flush_logs:
+            self.assertRaises(Cancelled, worker,
+                              ['test', None, None, options])
+        mock_flush_logs.assert_called_once()
+        mock_journal.return_value.set_state.assert_called_with(
+            'test', 'cancelled')
+
     @log_capture()
     @mock.patch('harbinger.run.traceback')
     @mock.patch('harbinger.run.loader')
@@ -171,7 +683,17 @@ class TestRun(unittest.TestCase):
             mock_exc_buffer.getvalue.return_value = 'test_string'
             mock_io.StringIO.return_value = mock_exc_buffer
             with mock.patch('harbinger.run.multiprocessing'):
-                self.assertRaises(OSError, worker, ['test'])
+                self.assertRaises(OSError, worker,
+                                  ['test', None, None, None])
         mock_loader.assert_called()
         mock_traceback.print_exc.assert_called()
         capture.check(('harbinger.run', 'ERROR', 'test_string'), )
+
+        # the last output is left to the summary, it is not logged twice
+        error = RuntimeError('test_error')
+        error.output_tail = 'last words'
+        mock_loader.side_effect = error
+        with mock.patch('harbinger.run.multiprocessing'):
+            self.assertRaises(RuntimeError, worker,
+                              ['test', None, None, None])
+        self.assertEqual(len(capture.records), 2)
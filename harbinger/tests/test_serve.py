@@ -0,0 +1,108 @@
+import argparse
+import logging
+import unittest
+
+import mock
+
+from harbinger.common.cancellation import Cancelled
+from harbinger.serve import JobLogHandler
+from harbinger.serve import Serve
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(spec=argparse.Namespace)
+        self.test_object = Serve(app=mock.Mock(), app_args=self.args)
+        self.test_object.queue = mock.Mock()
+        self.test_object.log_handler = JobLogHandler(self.test_object.queue)
+        self.test_object.pool = 'test_pool'
+        self.test_object.workers = 4
+        self.test_object.mp_log_handler = mock.Mock()
+        self.test_object.mp_log_handler.queue.qsize.return_value = 0
+        self.job = mock.Mock(job_id='abc', yaml_path='abc.yaml', resume=None,
+                             run_id='abc')
+
+    def test_get_description(self):
+        self.assertEqual(
+            self.test_object.get_description(),
+            'run harbinger as a daemon that runs submitted yaml files')
+
+    def test_get_parser(self):
+        parser = self.test_object.get_parser('NAME')
+        self.assertEqual('NAME', parser.prog)
+        parsed_args = parser.parse_args(['--workers', '2'])
+        self.assertEqual(parsed_args.workers, 2)
+
+    @mock.patch.object(Serve, 'run_job')
+    def test_serve_jobs(self, mock_run_job):
+        self.test_object.queue.claim.side_effect = [
+            None, self.job, None, KeyboardInterrupt()]
+        with mock.patch('harbinger.serve.time.monotonic') as mock_monotonic:
+            mock_monotonic.side_effect = [0, 30, 61, 61, 90, 130, 130]
+            self.assertRaises(KeyboardInterrupt,
+                              self.test_object.serve_jobs)
+        mock_run_job.assert_called_once_with(self.job)
+        # the jobs of dead daemons are looked for once a minute
+        self.assertEqual(self.test_object.queue.recover.call_count, 2)
+
+    @mock.patch('harbinger.serve.Run')
+    def test_run_job(self, mock_run):
+        run = mock_run.return_value
+        run.options.run_id = 'def'
+        run.pool = 'test_pool'
+
+        def take_action(parsed_args):
+            self.assertEqual(parsed_args.yaml, 'abc.yaml')
+            self.assertEqual(parsed_args.run_id, 'abc')
+            self.assertEqual(run.pool, 'test_pool')
+            self.assertEqual(run.pool_size, 4)
+            self.assertIs(self.test_object.log_handler.job, self.job)
+
+        run.take_action.side_effect = take_action
+        self.test_object.run_job(self.job)
+        self.test_object.queue.finish.assert_called_once_with(
+            self.job, 'passed', None)
+        self.assertIsNone(self.test_object.log_handler.job)
+
+    @mock.patch('harbinger.serve.Run')
+    def test_run_job_failed(self, mock_run):
+        run = mock_run.return_value
+        run.options.run_id = 'def'
+        run.take_action.side_effect = OSError('test_error')
+        self.test_object.run_job(self.job)
+        self.test_object.queue.finish.assert_called_once_with(
+            self.job, 'failed', 'OSError: test_error')
+
+    @mock.patch.object(Serve, 'create_pool', return_value='new_pool')
+    @mock.patch('harbinger.serve.Run')
+    def test_run_job_cancelled(self, mock_run, mock_create_pool):
+        run = mock_run.return_value
+        run.options.run_id = 'def'
+
+        def take_action(parsed_args):
+            # a cancelled run terminates the pool
+            run.pool = None
+            raise Cancelled('test_cancel')
+
+        run.take_action.side_effect = take_action
+        self.test_object.run_job(self.job)
+        self.test_object.queue.finish.assert_called_once_with(
+            self.job, 'cancelled', 'test_cancel')
+
+        self.assertIsNone(self.test_object.pool)
+        run.take_action.side_effect = None
+        self.test_object.run_job(self.job)
+        mock_create_pool.assert_called_once()
+        self.assertEqual(run.pool, 'new_pool')
+
+    def test_job_log_handler(self):
+        record = logging.makeLogRecord({
+            'msg': 'test %s', 'args': ('message',), 'levelname': 'INFO',
+            'name': 'test', 'processName': 'shaker-worker'})
+        self.test_object.log_handler.emit(record)
+        self.test_object.queue.log.assert_not_called()
+
+        self.test_object.log_handler.job = self.job
+        self.test_object.log_handler.emit(record)
+        self.test_object.queue.log.assert_called_once_with(
+            self.job, 'shaker-worker INFO test test message')
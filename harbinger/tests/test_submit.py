@@ -0,0 +1,64 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from harbinger.submit import Submit
+
+
+class TestSubmit(unittest.TestCase):
+    def setUp(self):
+        self.args = mock.Mock(spec=argparse.Namespace)
+        self.test_object = Submit(app=mock.Mock(), app_args=self.args)
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.yaml_path = os.path.join(temp_dir, 'test.yaml')
+        with open(self.yaml_path, 'w') as yaml_file:
+            yaml_file.write('Options: {}\n')
+
+    def test_get_description(self):
+        self.assertEqual(self.test_object.get_description(),
+                         'submit a yaml file to a running harbinger serve')
+
+    def test_get_parser(self):
+        parser = self.test_object.get_parser('NAME')
+        parsed_args = parser.parse_args(['--wait', 'test.yaml'])
+        self.assertTrue(parsed_args.wait)
+        self.assertEqual(parsed_args.yaml, 'test.yaml')
+
+    @mock.patch('harbinger.submit.print')
+    @mock.patch('harbinger.submit.JobClient')
+    def test_take_action(self, mock_client, mock_print):
+        mock_client.return_value.submit.return_value = {
+            'job': {'job': 'abc'}, 'position': 0}
+        parsed_args = argparse.Namespace(yaml=self.yaml_path,
+                                         socket='test.sock', resume=None,
+                                         priority=5, wait=False)
+        self.test_object.take_action(parsed_args)
+        mock_client.assert_called_once_with('test.sock')
+        mock_client.return_value.submit.assert_called_once_with(
+            'Options: {}\n', None, 5)
+        mock_print.assert_called_once_with('abc')
+        mock_client.return_value.watch.assert_not_called()
+
+    @mock.patch('harbinger.submit.print')
+    def test_wait(self, mock_print):
+        client = mock.Mock()
+        client.watch.return_value = iter([
+            {'event': {'state': 'running'}},
+            {'event': {'log': 'test_log'}},
+            {'job': {'state': 'passed', 'result': None}},
+        ])
+        self.test_object.wait(client, 'abc')
+        mock_print.assert_called_once_with('test_log')
+
+        client.watch.return_value = iter([
+            {'job': {'state': 'failed', 'result': 'test_error'}},
+        ])
+        with self.assertRaises(RuntimeError) as context:
+            self.test_object.wait(client, 'abc')
+        self.assertEqual(str(context.exception),
+                         'Job abc failed: test_error')